@@ -0,0 +1,35 @@
+'''
+Compares the throughput of classifying messages one at a time (predict + response lookup per
+message, as process_message does) against a single predict_batch call.
+
+Usage: python -m benchmarks.bench_batch_predict [number_of_messages ...]
+'''
+
+import sys
+
+from src.utils import load_data
+from constants import INTENTS_JSON_PATH
+from benchmarks.common import build_classifier, generate_messages, best_time
+
+
+def main(sizes):
+    data = load_data(INTENTS_JSON_PATH)
+    classifier = build_classifier(data)
+    print(f"{'mensajes':>10} {'uno a uno (us/msg)':>20} {'batch (us/msg)':>16} {'aceleración':>12}")
+    for n in sizes:
+        messages = generate_messages(data, n)
+
+        def one_at_a_time():
+            for message in messages:
+                classifier.response_message_to_intent(classifier.predict(message))
+
+        def batch():
+            classifier.predict_batch(messages)
+
+        single = best_time(one_at_a_time) / n * 1e6
+        batched = best_time(batch) / n * 1e6
+        print(f"{n:>10} {single:>20.1f} {batched:>16.1f} {single / batched:>11.1f}x")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 10000])
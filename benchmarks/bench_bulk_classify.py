@@ -0,0 +1,77 @@
+'''
+Bulk classification of a chat log (src/bulk_classify.py) against classifying the messages one at a
+time like process_message. Writes a gzip text file with generated messages, classifies it with
+several numbers of worker processes and reports the messages per second and the peak memory of
+the main process and of the workers (Linux); the memory should not grow with the number of
+messages.
+
+Usage: python -m benchmarks.bench_bulk_classify [messages ...]
+'''
+
+import os
+import sys
+import gzip
+import json
+import tempfile
+import subprocess
+
+from constants import INTENTS_JSON_PATH
+from src.utils import load_data
+from src.compact_model import CompactPredictor, export_compact_model, compact_model_path
+from benchmarks.common import build_classifier, generate_messages, best_time
+from benchmarks.suite import RSS_UNIT
+
+
+# Classifies a file in a new process, returns the seconds and the peak memory in MB of the main
+# process and of the largest worker. The peak of the main process is read from /proc (VmHWM),
+# ru_maxrss keeps the peak of the benchmark itself across exec.
+def run_bulk(input_path, output_path, model_file, workers):
+    code = (
+        "import json, time, resource\n"
+        "from src.bulk_classify import classify_file\n"
+        "start = time.perf_counter()\n"
+        f"classify_file({input_path!r}, {output_path!r}, {model_file!r}, workers={workers})\n"
+        "seconds = time.perf_counter() - start\n"
+        "with open('/proc/self/status') as f:\n"
+        "    main = [int(line.split()[1]) for line in f if line.startswith('VmHWM')][0]\n"
+        "workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss\n"
+        "print(json.dumps({'seconds': seconds, 'main': main, 'workers': workers}))\n"
+    )
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    return result['seconds'], result['main'] / 1024, result['workers'] / RSS_UNIT
+
+
+def main(sizes):
+    import joblib
+    data = load_data(INTENTS_JSON_PATH)
+    classifier = build_classifier(data)
+    cores = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, cores})
+    with tempfile.TemporaryDirectory() as directory:
+        model_file = os.path.join(directory, 'model.pkl')
+        joblib.dump(classifier.model, model_file)
+        export_compact_model(classifier.model, compact_model_path(model_file))
+        # The baseline uses the compact model too, like a classifier loaded from models/
+        classifier.model = CompactPredictor(compact_model_path(model_file))
+        sample = generate_messages(data, 2000, seed=1)
+        seconds = best_time(lambda: [classifier.classify(message) for message in sample])
+        print(f"Mensaje por mensaje (classify, sin caché): {len(sample) / seconds:.0f} "
+                f"mensajes por segundo")
+        print(f"{'mensajes':>9} {'procesos':>9} {'mensajes/s':>11} {'principal (MB)':>15} "
+                f"{'proceso de trabajo (MB)':>24}")
+        for size in sizes:
+            input_path = os.path.join(directory, f"log_{size}.txt.gz")
+            with gzip.open(input_path, 'wt', encoding='utf-8') as f:
+                for message in generate_messages(data, size, seed=2):
+                    f.write(message + '\n')
+            for workers in worker_counts:
+                output_path = os.path.join(directory, f"out_{size}_{workers}.jsonl")
+                seconds, main_peak, worker_peak = run_bulk(input_path, output_path, model_file, workers)
+                print(f"{size:>9} {workers:>9} {size / seconds:>11.0f} {main_peak:>15.1f} "
+                        f"{worker_peak:>24.1f}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [50000, 200000])
@@ -0,0 +1,72 @@
+'''
+Compares the cold start time of a fresh Python process that loads the joblib pickle of the whole
+sklearn pipeline against one that memory-maps the compact model with CompactPredictor, and checks
+that both give the same predictions.
+
+Usage: python -m benchmarks.bench_cold_start [repetitions]
+'''
+
+import os
+import sys
+import subprocess
+import tempfile
+import time
+
+from constants import PROJECT_ROOT, INTENTS_JSON_PATH
+from src.utils import load_data
+from src.compact_model import CompactPredictor, export_compact_model
+from benchmarks.common import build_classifier, generate_messages
+
+
+JOBLIB_STARTUP = """
+import joblib
+model = joblib.load({path!r})
+model.predict(['hola'])
+"""
+
+COMPACT_STARTUP = """
+from src.compact_model import CompactPredictor
+model = CompactPredictor({path!r})
+model.predict(['hola'])
+"""
+
+
+# Runs a snippet in a new Python process and returns the elapsed wall time in seconds
+def time_process(code):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], cwd=PROJECT_ROOT, check=True)
+    return time.perf_counter() - start
+
+
+def main(repetitions):
+    data = load_data(INTENTS_JSON_PATH)
+    classifier = build_classifier(data)
+    with tempfile.TemporaryDirectory() as directory:
+        import joblib
+        pickle_path = os.path.join(directory, 'model.pkl')
+        compact_path = os.path.join(directory, 'model_compact')
+        joblib.dump(classifier.model, pickle_path)
+        export_compact_model(classifier.model, compact_path)
+
+        messages = generate_messages(data, 2000)
+        compact = CompactPredictor(compact_path)
+        matches = (compact.predict(messages) == classifier.model.predict(messages)).mean()
+        print(f"Predicciones iguales al pipeline: {matches:.2%} de {len(messages)} mensajes")
+
+        # Warm the file system cache so both paths are measured in the same conditions
+        time_process(JOBLIB_STARTUP.format(path=pickle_path))
+        time_process(COMPACT_STARTUP.format(path=compact_path))
+        joblib_time = min(time_process(JOBLIB_STARTUP.format(path=pickle_path))
+                            for _ in range(repetitions))
+        compact_time = min(time_process(COMPACT_STARTUP.format(path=compact_path))
+                            for _ in range(repetitions))
+        baseline = min(time_process("pass") for _ in range(repetitions))
+    print(f"Proceso vacío:        {baseline * 1000:8.1f} ms")
+    print(f"joblib + sklearn:     {joblib_time * 1000:8.1f} ms")
+    print(f"Modelo compacto:      {compact_time * 1000:8.1f} ms")
+    print(f"Aceleración del arranque (sin contar el proceso vacío): "
+            f"{(joblib_time - baseline) / (compact_time - baseline):.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
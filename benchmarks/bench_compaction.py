@@ -0,0 +1,64 @@
+'''
+Compaction of the compact model: feature selection (chi² or document frequency) and precision of
+the Naive Bayes weights. Trains the TF-IDF + Naive Bayes pipeline on a Spanish-like corpus and,
+for each setting, exports its compact copy and predicts the held-out examples with it: accuracy,
+kept columns, size on disk and time per message, against the full float64 copy.
+
+Usage: python -m benchmarks.bench_compaction [vocabulary|hashing]
+'''
+
+import os
+import sys
+import tempfile
+
+from src.compact_model import export_compact_model
+from src.model_compaction import select_columns, measure
+from src.hashing_features import hashing_pipeline, fit_hashing_pipeline
+from benchmarks.common import spanish_corpus, train_test_split_examples
+from benchmarks.bench_hashing import vocabulary_pipeline
+
+
+N_INTENTS = 50
+EXAMPLES_PER_INTENT = 400
+SETTINGS = [
+    (None, 1.0, 'float64'),
+    (None, 1.0, 'float32'),
+    (None, 1.0, 'float16'),
+    (None, 1.0, 'int8'),
+    ('chi2', 0.5, 'float64'),
+    ('chi2', 0.25, 'float64'),
+    ('chi2', 0.1, 'float64'),
+    ('df', 0.5, 'float64'),
+    ('df', 0.25, 'float64'),
+    ('chi2', 0.5, 'float16'),
+    ('chi2', 0.25, 'int8'),
+    ('chi2', 0.1, 'int8'),
+]
+
+
+def main(mode):
+    data = spanish_corpus(N_INTENTS, EXAMPLES_PER_INTENT, vocabulary_size=20000, seed=0)
+    X_train, y_train, X_test, y_test = train_test_split_examples(data)
+    if mode == 'hashing':
+        pipeline = fit_hashing_pipeline(hashing_pipeline(), X_train, y_train, workers=1)
+    else:
+        pipeline = vocabulary_pipeline().fit(X_train, y_train)
+    print(f"{len(X_train)} ejemplos de entrenamiento, {len(X_test)} de prueba, "
+            f"{N_INTENTS} intenciones, modo {mode}")
+    print(f"{'selección':<10} {'términos':>9} {'pesos':>8} {'exactitud':>10} {'caída':>7} "
+            f"{'columnas':>9} {'tamaño (KB)':>12} {'ms/mensaje':>11}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as temporary:
+        for position, (method, keep, weights_dtype) in enumerate(SETTINGS):
+            directory = os.path.join(temporary, str(position))
+            export_compact_model(pipeline, directory, select_columns(pipeline, method, keep),
+                                    weights_dtype)
+            result = measure(directory, X_test, y_test)
+            baseline = baseline or result
+            print(f"{method or '-':<10} {keep:>9.0%} {weights_dtype:>8} {result['accuracy']:>10.4f} "
+                    f"{baseline['accuracy'] - result['accuracy']:>7.4f} {result['columns']:>9} "
+                    f"{result['bytes'] / 1024:>12.0f} {result['ms_per_message']:>11.3f}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else 'vocabulary')
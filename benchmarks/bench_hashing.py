@@ -0,0 +1,102 @@
+'''
+Feature hashing mode against the vocabulary-based pipeline. The first table trains both on the
+same Spanish-like corpus and shows the held-out accuracy, the size of the pickled model and the
+training time for several numbers of buckets. The second one keeps the number of examples and
+grows the vocabulary of the corpus: the memory of the vocabulary pipeline grows with it, the one
+of the hashing pipeline does not.
+
+Usage: python -m benchmarks.bench_hashing [buckets ...]
+'''
+
+import io
+import sys
+import time
+
+import numpy as np
+
+from src.hashing_features import hashing_pipeline, fit_hashing_pipeline
+from src.text_normalization import default_normalizer
+from benchmarks.common import spanish_corpus, train_test_split_examples
+
+
+N_INTENTS = 50
+EXAMPLES_PER_INTENT = 400
+
+
+# Returns the memory held by a pipeline in bytes: its arrays and the terms of its vocabulary
+def model_memory(pipeline):
+    size = 0
+    for _, step in pipeline.steps:
+        size += sum(value.nbytes for value in vars(step).values() if isinstance(value, np.ndarray))
+        vocabulary = getattr(step, 'vocabulary_', None)
+        if isinstance(vocabulary, dict):
+            size += sys.getsizeof(vocabulary) + sum(sys.getsizeof(term) for term in vocabulary)
+    return size
+
+
+# Returns the size in bytes of a pickled model
+def pickled_size(pipeline):
+    import joblib
+    buffer = io.BytesIO()
+    joblib.dump(pipeline, buffer)
+    return len(buffer.getvalue())
+
+
+# Creates the current vocabulary-based pipeline
+def vocabulary_pipeline():
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import make_pipeline
+    return make_pipeline(TfidfVectorizer(preprocessor=default_normalizer()), MultinomialNB())
+
+
+# Trains a pipeline and returns its training time
+def train(pipeline, X, y, workers=None):
+    start = time.perf_counter()
+    if workers is None:
+        pipeline.fit(X, y)
+    else:
+        fit_hashing_pipeline(pipeline, X, y, workers)
+    return time.perf_counter() - start
+
+
+def main(buckets):
+    data = spanish_corpus(N_INTENTS, EXAMPLES_PER_INTENT, vocabulary_size=20000, seed=0)
+    X_train, y_train, X_test, y_test = train_test_split_examples(data)
+    expected = np.asarray(y_test)
+    print(f"{len(X_train)} ejemplos de entrenamiento, {N_INTENTS} intenciones")
+    print(f"{'modelo':<22} {'exactitud':>10} {'.pkl (MB)':>10} {'memoria (MB)':>13} "
+            f"{'entrenar (s)':>13} {'entrenar 1 proceso (s)':>23}")
+    model = vocabulary_pipeline()
+    seconds = train(model, X_train, y_train)
+    print(f"{'vocabulario':<22} {np.mean(model.predict(X_test) == expected):>10.3f} "
+            f"{pickled_size(model) / 2 ** 20:>10.2f} {model_memory(model) / 2 ** 20:>13.2f} "
+            f"{seconds:>13.2f} {'':>23}")
+    for n_features in buckets:
+        for ngram_range in ((1, 1), (1, 2)):
+            model = hashing_pipeline(n_features, ngram_range)
+            serial = train(model, X_train, y_train, workers=1)
+            model = hashing_pipeline(n_features, ngram_range)
+            seconds = train(model, X_train, y_train, workers=None)
+            name = f"hashing 2^{n_features.bit_length() - 1}" + (" +bigramas" if ngram_range[1] > 1 else "")
+            print(f"{name:<22} {np.mean(model.predict(X_test) == expected):>10.3f} "
+                    f"{pickled_size(model) / 2 ** 20:>10.2f} {model_memory(model) / 2 ** 20:>13.2f} "
+                    f"{seconds:>13.2f} {serial:>23.2f}")
+
+    n_features = buckets[len(buckets) // 2]
+    print(f"\nMemoria (MB) a medida que crece el vocabulario del corpus "
+            f"(hashing con 2^{n_features.bit_length() - 1} columnas)")
+    print(f"{'palabras distintas':>19} {'vocabulario':>12} {'hashing':>8}")
+    for vocabulary_size in (5000, 50000, 200000):
+        data = spanish_corpus(N_INTENTS, EXAMPLES_PER_INTENT, vocabulary_size, seed=1)
+        X, y, _, _ = train_test_split_examples(data, test_fraction=0.0)
+        vocabulary_model = vocabulary_pipeline().fit(X, y)
+        hashing_model = hashing_pipeline(n_features)
+        fit_hashing_pipeline(hashing_model, X, y)
+        print(f"{len(vocabulary_model[0].vocabulary_):>19} "
+                f"{model_memory(vocabulary_model) / 2 ** 20:>12.2f} "
+                f"{model_memory(hashing_model) / 2 ** 20:>8.2f}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [2 ** 10, 2 ** 12, 2 ** 14, 2 ** 16])
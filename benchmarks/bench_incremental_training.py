@@ -0,0 +1,71 @@
+'''
+Compares the time to retrain when a small training file arrives: a full refit of TF-IDF + Naive
+Bayes on the whole corpus against an incremental update with only the new examples. It also checks
+that the incremental model predicts exactly like the same statistics computed in one go, and
+compares its accuracy with the full TF-IDF refit on a held-out set.
+
+Usage: python -m benchmarks.bench_incremental_training [examples_per_intent ...]
+'''
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from src.incremental_trainer import IncrementalTrainer
+from benchmarks.common import synthetic_corpus, train_test_split_examples
+
+
+# Fraction of the corpus that arrives in the new training file
+DELTA_FRACTION = 0.01
+N_INTENTS = 50
+
+
+def main(sizes):
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.pipeline import make_pipeline
+
+    print(f"{'ejemplos':>9} {'nuevos':>7} {'refit (s)':>10} {'incremental (s)':>16} "
+            f"{'acc refit':>10} {'acc incr':>9} {'idéntico':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        state_path = os.path.join(directory, 'state.npz')
+        for per_intent in sizes:
+            data = synthetic_corpus(N_INTENTS, per_intent, seed=per_intent)
+            X_train, y_train, X_test, y_test = train_test_split_examples(data)
+            split = len(X_train) - max(1, int(len(X_train) * DELTA_FRACTION))
+            X_base, y_base = X_train[:split], y_train[:split]
+            X_new, y_new = X_train[split:], y_train[split:]
+
+            # Existing statistics for the base corpus, saved as they would be after the last retrain
+            trainer = IncrementalTrainer(state_path)
+            trainer.update(X_base, y_base)
+            trainer.save()
+
+            start = time.perf_counter()
+            full = make_pipeline(TfidfVectorizer(), MultinomialNB()).fit(X_train, y_train)
+            refit_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            trainer = IncrementalTrainer(state_path)
+            trainer.load()
+            trainer.update(X_new, y_new)
+            incremental = trainer.to_pipeline()
+            incremental_time = time.perf_counter() - start
+
+            # The same statistics computed in a single pass over all the examples
+            reference = IncrementalTrainer(state_path)
+            reference.update(X_train, y_train)
+            identical = np.array_equal(reference.to_pipeline().predict(X_test),
+                                        incremental.predict(X_test))
+
+            full_accuracy = np.mean(full.predict(X_test) == np.array(y_test))
+            incremental_accuracy = np.mean(incremental.predict(X_test) == np.array(y_test))
+            print(f"{len(X_train):>9} {len(X_new):>7} {refit_time:>10.3f} {incremental_time:>16.3f} "
+                    f"{full_accuracy:>10.3f} {incremental_accuracy:>9.3f} {str(identical):>9}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000, 20000])
@@ -0,0 +1,72 @@
+'''
+Scaling benchmark of the merge of a training file into intents.json. Compares merge_intents, which
+indexes the intents and examples in a dict and sets once, against the previous implementation,
+which searched each intent with a linear scan and each example with a list membership test.
+
+Usage: python -m benchmarks.bench_merge [total_examples ...]
+'''
+
+import sys
+import copy
+import time
+
+from src.utils import merge_intents
+from benchmarks.common import synthetic_corpus
+
+
+N_INTENTS = 100
+# Fraction of the examples of the training file that are already in the base file
+DUPLICATE_FRACTION = 0.5
+# The previous implementation is quadratic, it is only measured up to this size
+LEGACY_LIMIT = 1_000_000
+
+
+# Previous merge: linear search of the intent and list membership test of every example
+def legacy_add_intents(intents_data, train_data):
+    for new_intent in train_data["intents"]:
+        existing_intent = next((intent for intent in intents_data["intents"]
+                                if intent["intent"] == new_intent["intent"]), None)
+        if existing_intent:
+            new_examples = [example for example in new_intent["examples"]
+                            if example not in existing_intent["examples"] and example.strip()]
+            if new_examples:
+                existing_intent["examples"].extend(new_examples)
+        else:
+            intents_data["intents"].append(new_intent)
+    return intents_data
+
+
+# Builds a base file with `total` examples and a training file with 10% of that size, half of its
+# examples repeated from the base file, plus some new intents
+def build_inputs(total):
+    per_intent = max(1, total // N_INTENTS)
+    base = synthetic_corpus(N_INTENTS, per_intent, vocabulary_size=50_000, words_per_example=8, seed=1)
+    extra = synthetic_corpus(N_INTENTS + 10, max(1, per_intent // 10), vocabulary_size=50_000,
+                                words_per_example=8, seed=2)
+    for base_intent, train_intent in zip(base['intents'], extra['intents']):
+        repeated = int(len(train_intent['examples']) * DUPLICATE_FRACTION)
+        train_intent['examples'][:repeated] = base_intent['examples'][:repeated]
+    return base, extra
+
+
+def main(sizes):
+    print(f"{'ejemplos':>9} {'anterior (s)':>13} {'merge_intents (s)':>18} {'agregados':>10} "
+            f"{'duplicados':>11} {'nuevas':>7}")
+    for total in sizes:
+        base, train = build_inputs(total)
+        legacy_time = None
+        if total <= LEGACY_LIMIT:
+            legacy_base, legacy_train = copy.deepcopy(base), copy.deepcopy(train)
+            start = time.perf_counter()
+            legacy_add_intents(legacy_base, legacy_train)
+            legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        _, stats = merge_intents(base, train)
+        merge_time = time.perf_counter() - start
+        legacy = f"{legacy_time:.3f}" if legacy_time is not None else "-"
+        print(f"{total:>9} {legacy:>13} {merge_time:>18.3f} {stats['added_examples']:>10} "
+                f"{stats['duplicate_examples']:>11} {stats['new_intents']:>7}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,66 @@
+'''
+Latency of classifying repetitive chat traffic one message at a time (as process_message does)
+without the prediction cache and with caches of several sizes. The traffic follows a Zipf
+distribution over a pool of messages: copies of the training examples with different case and
+punctuation ("Hola", "hola!", "¿Hola?") and messages that are not in the training data. Reports the
+hit rate of each tier, which helps to choose PREDICTION_CACHE_SIZE.
+
+Usage: python -m benchmarks.bench_prediction_cache [number_of_messages] [pool_size]
+'''
+
+import sys
+import random
+
+from src.utils import load_data
+from src.prediction_cache import PredictionCache
+from constants import INTENTS_JSON_PATH
+from benchmarks.common import build_classifier, generate_messages, best_time
+
+
+CACHE_SIZES = [100, 1000, 10000]
+# Exponent of the Zipf distribution of the messages
+ZIPF_EXPONENT = 1.1
+
+
+# Generates n messages drawn from a pool where the message of rank r has a weight of 1 / r^s
+def generate_traffic(data, n, pool_size, seed=0):
+    rng = random.Random(seed)
+    variants = [str.lower, str.upper, str.capitalize, lambda text: f"¿{text}?",
+                lambda text: f"{text}!", lambda text: f"  {text} "]
+    examples = [example for intent in data['intents'] for example in intent['examples']]
+    pool = [rng.choice(variants)(rng.choice(examples)) for _ in range(pool_size // 2)]
+    pool += generate_messages(data, pool_size - len(pool), seed)
+    rng.shuffle(pool)
+    weights = [1 / rank ** ZIPF_EXPONENT for rank in range(1, len(pool) + 1)]
+    return rng.choices(pool, weights=weights, k=n)
+
+
+def main(n, pool_size):
+    data = load_data(INTENTS_JSON_PATH)
+    classifier = build_classifier(data)
+    messages = generate_traffic(data, n, pool_size)
+
+    def run():
+        if classifier.prediction_cache is not None:
+            classifier.prediction_cache.clear()
+        for message in messages:
+            classifier.classify(message)
+
+    print(f"{'caché':>8} {'us/msg':>9} {'exactos':>9} {'aciertos':>9} {'fallos':>9} {'tasa':>7}")
+    classifier.prediction_cache = None
+    baseline = best_time(run) / n * 1e6
+    print(f"{'sin':>8} {baseline:>9.1f}")
+    for size in CACHE_SIZES:
+        classifier.prediction_cache = PredictionCache(max_size=size)
+        elapsed = best_time(run) / n * 1e6
+        # Counters of the last run only
+        classifier.prediction_cache = PredictionCache(max_size=size)
+        run()
+        stats = classifier.prediction_cache.stats()
+        print(f"{size:>8} {elapsed:>9.1f} {stats['exact_hits']:>9} {stats['hits']:>9} "
+                f"{stats['misses']:>9} {stats['hit_rate']:>7.1%}   {baseline / elapsed:.1f}x")
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(args[0] if args else 20000, args[1] if len(args) > 1 else 5000)
@@ -0,0 +1,76 @@
+'''
+Throughput and memory of the inference server with 1, 2, 4... worker processes. For each number of
+workers the server is started in a new process (python -m src.server --workers N), loaded with
+benchmarks.load_test from several client processes, and the private memory of every worker is read
+from /proc (Linux), which shows how much of the model each worker does not share.
+
+Usage: python -m benchmarks.bench_prefork [workers ...] [--requests N] [--clients N]
+'''
+
+import re
+import sys
+import time
+import socket
+import signal
+import argparse
+import subprocess
+
+from constants import PROJECT_ROOT
+
+
+PORT = 8765
+
+
+# Waits until the server accepts connections
+def wait_for_server(port, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise Exception(f"El servidor no respondió en el puerto {port}.")
+
+
+# Returns the private dirty memory in MB of a process
+def private_memory(pid):
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        return int(re.search(r"Private_Dirty:\s+(\d+)", f.read()).group(1)) / 1024
+
+
+# Returns the pids of the workers of a server, or the server itself if it has a single process
+def worker_pids(pid):
+    children = subprocess.run(['ps', '--ppid', str(pid), '-o', 'pid='], capture_output=True,
+                                text=True).stdout.split()
+    return [int(child) for child in children] or [pid]
+
+
+def main(args):
+    print(f"{'procesos':>9} {'peticiones/s':>13} {'p99 (ms)':>9} {'privada por proceso (MB)':>25}")
+    for workers in args.workers:
+        server = subprocess.Popen([sys.executable, '-W', 'ignore', '-m', 'src.server', '--no-watch',
+                                    '--port', str(PORT), '--workers', str(workers)],
+                                    cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL)
+        try:
+            wait_for_server(PORT)
+            output = subprocess.run([sys.executable, '-W', 'ignore', '-m', 'benchmarks.load_test',
+                                        '--port', str(PORT), '--requests', str(args.requests),
+                                        '--clients', str(args.clients),
+                                        '--processes', str(max(2, workers))],
+                                    cwd=PROJECT_ROOT, check=True, capture_output=True, text=True).stdout
+            throughput = float(re.search(r"Rendimiento: (\d+)", output).group(1))
+            p99 = float(re.search(r"p99: ([\d.]+)", output).group(1))
+            memory = [private_memory(pid) for pid in worker_pids(server.pid)]
+            print(f"{workers:>9} {throughput:>13.0f} {p99:>9.2f} {sum(memory) / len(memory):>25.1f}")
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Escalabilidad del servidor con varios procesos.")
+    parser.add_argument('workers', type=int, nargs='*', default=[1, 2, 4])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=64)
+    main(parser.parse_args())
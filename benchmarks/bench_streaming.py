@@ -0,0 +1,93 @@
+'''
+Peak memory of training from a large file: json.load of the whole document plus the full
+X_train/y_train lists and a TF-IDF + Naive Bayes fit, against the streaming path that reads a JSON
+Lines file in chunks and updates the incremental statistics. Each measurement runs in a fresh
+process and reports its peak resident set size.
+
+Usage: python -m benchmarks.bench_streaming [total_examples ...]
+'''
+
+import os
+import sys
+import json
+import random
+import tempfile
+import subprocess
+
+from constants import PROJECT_ROOT
+
+
+N_INTENTS = 50
+VOCABULARY_SIZE = 20000
+
+FULL_LOAD = """
+import resource, time
+start = time.perf_counter()
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.pipeline import make_pipeline
+from src.utils import load_data, get_training_examples
+data = load_data({path!r})
+X_train, y_train = get_training_examples(data)
+model = make_pipeline(TfidfVectorizer(), MultinomialNB()).fit(X_train, y_train)
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+STREAMING = """
+import resource, time
+start = time.perf_counter()
+from src.streaming import iter_chunks
+from src.incremental_trainer import IncrementalTrainer
+trainer = IncrementalTrainer()
+for X_chunk, y_chunk in iter_chunks({path!r}):
+    trainer.update(X_chunk, y_chunk)
+model = trainer.to_pipeline()
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+# Writes the same synthetic corpus as a JSON document and as a JSON Lines file
+def write_corpus(directory, total, seed=0):
+    rng = random.Random(seed)
+    vocabulary = [f"w{index}" for index in range(VOCABULARY_SIZE)]
+    topics = [rng.sample(vocabulary, 30) for _ in range(N_INTENTS)]
+    json_path = os.path.join(directory, f"corpus_{total}.json")
+    jsonl_path = os.path.join(directory, f"corpus_{total}.jsonl")
+    intents = {f"intent_{index}": [] for index in range(N_INTENTS)}
+    with open(jsonl_path, 'w', encoding='utf-8') as jsonl:
+        for number in range(total):
+            index = number % N_INTENTS
+            example = " ".join(rng.choice(topics[index]) if rng.random() < 0.6
+                                else rng.choice(vocabulary) for _ in range(8))
+            intents[f"intent_{index}"].append(example)
+            jsonl.write(json.dumps({'intent': f"intent_{index}", 'example': example}) + "\n")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({'intents': [{'intent': name, 'examples': examples}
+                                for name, examples in intents.items()]}, f)
+    return json_path, jsonl_path
+
+
+# Runs a snippet in a new process and returns its elapsed time and peak RSS in MB
+def measure(code):
+    output = subprocess.run([sys.executable, '-W', 'ignore', '-c', code], cwd=PROJECT_ROOT,
+                            check=True, capture_output=True, text=True).stdout.split()
+    return float(output[-2]), int(output[-1]) / 1024
+
+
+def main(sizes):
+    print(f"{'ejemplos':>9} {'archivo (MB)':>13} {'json.load (s)':>14} {'pico (MB)':>10} "
+            f"{'streaming (s)':>14} {'pico (MB)':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for total in sizes:
+            json_path, jsonl_path = write_corpus(directory, total)
+            size = os.path.getsize(jsonl_path) / 1024 ** 2
+            full_time, full_peak = measure(FULL_LOAD.format(path=json_path))
+            stream_time, stream_peak = measure(STREAMING.format(path=jsonl_path))
+            print(f"{total:>9} {size:>13.1f} {full_time:>14.2f} {full_peak:>10.0f} "
+                    f"{stream_time:>14.2f} {stream_peak:>10.0f}")
+            os.remove(json_path)
+            os.remove(jsonl_path)
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000, 3_000_000])
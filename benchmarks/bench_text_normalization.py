@@ -0,0 +1,102 @@
+'''
+Effect of the text normalization (src/text_normalization.py) on the model. The same corpus is
+trained without normalization, with accent and punctuation folding and with folding and light
+stemming. The corpus is the Spanish-like synthetic one, with its examples written with the
+spelling variants of chat messages (without accents, in uppercase, without ¿ ¡), and the held-out
+messages have the same variants. For each mode it reports the size of the vocabulary and of the
+model files, the accuracy, and the time to predict a message with the compact model (the one used
+in production) and a batch with the pipeline. The vocabulary of data/intents.json is also shown.
+
+Usage: python -m benchmarks.bench_text_normalization [examples_per_intent]
+'''
+
+import io
+import os
+import sys
+import random
+import tempfile
+
+import numpy as np
+
+from constants import INTENTS_JSON_PATH
+from src.utils import load_data, get_training_examples
+from src.compact_model import CompactPredictor, export_compact_model
+from src.text_normalization import TextNormalizer, normalize_text
+from benchmarks.common import spanish_corpus, train_test_split_examples, best_time
+
+
+N_INTENTS = 50
+MODES = {'sin normalizar': None, 'normalizado': TextNormalizer(stem=False),
+            'normalizado + raíces': TextNormalizer(stem=True)}
+
+
+# Writes a text with one of the spelling variants of chat messages
+def spelling_variant(text, rng):
+    draw = rng.random()
+    if draw < 0.25:
+        return normalize_text(text)
+    if draw < 0.35:
+        return text.upper()
+    if draw < 0.5:
+        return text.strip('¿?¡!').lower()
+    return text
+
+
+# Returns the size in bytes of the files of a directory
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+# Returns the vocabulary size of each mode for a list of texts
+def vocabulary_sizes(texts):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    return [len(TfidfVectorizer(preprocessor=normalizer).fit(texts).vocabulary_)
+            for normalizer in MODES.values()]
+
+
+def main(examples_per_intent):
+    import joblib
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.pipeline import make_pipeline
+
+    rng = random.Random(0)
+    data = spanish_corpus(N_INTENTS, examples_per_intent, vocabulary_size=5000, seed=0)
+    for intent in data['intents']:
+        intent['examples'] = [spelling_variant(example, rng) for example in intent['examples']]
+    X_train, y_train, X_test, y_test = train_test_split_examples(data)
+    expected = np.asarray(y_test)
+    queries = X_test[:500]
+
+    X_real, _ = get_training_examples(load_data(INTENTS_JSON_PATH))
+    print(f"data/intents.json: vocabulario de {' / '.join(map(str, vocabulary_sizes(X_real)))} "
+            f"términos ({' / '.join(MODES)})\n")
+    print(f"Corpus sintético: {len(X_train)} ejemplos de entrenamiento, {len(X_test)} de prueba")
+    print(f"{'modo':<22} {'vocabulario':>11} {'.pkl (KB)':>10} {'compacto (KB)':>14} "
+            f"{'exactitud':>10} {'1 mensaje (us)':>15} {'lote (us/msg)':>14}")
+    for mode, normalizer in MODES.items():
+        model = make_pipeline(TfidfVectorizer(preprocessor=normalizer), MultinomialNB())
+        model.fit(X_train, y_train)
+        pickled = io.BytesIO()
+        joblib.dump(model, pickled)
+        with tempfile.TemporaryDirectory() as directory:
+            export_compact_model(model, directory)
+            compact_size = directory_size(directory)
+            compact = CompactPredictor(directory)
+            # The memo caches of the normalization are emptied, so the first run pays for them
+            normalize_text.cache_clear()
+            single = best_time(lambda: [compact.predict([query]) for query in queries]) / len(queries)
+        batch = best_time(lambda: model.predict(X_test)) / len(X_test)
+        accuracy = np.mean(model.predict(X_test) == expected)
+        print(f"{mode:<22} {len(model[0].vocabulary_):>11} {len(pickled.getvalue()) / 1024:>10.1f} "
+                f"{compact_size / 1024:>14.1f} {accuracy:>10.3f} {single * 1e6:>15.1f} "
+                f"{batch * 1e6:>14.2f}")
+
+    normalize_text.cache_clear()
+    cold = best_time(lambda: [normalize_text(text) for text in X_test], repeat=1) / len(X_test)
+    warm = best_time(lambda: [normalize_text(text) for text in X_test]) / len(X_test)
+    print(f"\nNormalización: {cold * 1e6:.2f} us por mensaje nuevo, {warm * 1e6:.2f} us repetido")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
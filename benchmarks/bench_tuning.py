@@ -0,0 +1,69 @@
+'''
+Hyperparameter search of src/tuning.py against refitting the whole pipeline for every candidate
+and fold. Reports the time of each strategy and the parameters and accuracy of the candidate it
+chooses, on the same Spanish-like corpus and folds.
+
+    naive           every candidate refits TF-IDF and Naive Bayes on every fold
+    cached          every fold is vectorized once per vectorizer setting, every candidate is
+                    evaluated on every fold
+    cached + early  the same, keeping the best half of the candidates after each fold
+
+Usage: python -m benchmarks.bench_tuning [workers]
+'''
+
+import sys
+import time
+
+import numpy as np
+
+from src.tuning import search, expand_grid, build_steps, format_params
+from src.evaluation import stratified_folds
+from constants import TUNING_VECTORIZER_GRID, TUNING_CLASSIFIER_GRID
+from benchmarks.common import spanish_corpus
+
+
+N_INTENTS = 30
+EXAMPLES_PER_INTENT = 200
+N_FOLDS = 5
+
+
+# Cross-validates every candidate refitting the whole pipeline on every fold
+def naive_search(data):
+    from sklearn.pipeline import make_pipeline
+    X = [example for intent in data['intents'] for example in intent['examples']]
+    y = np.array([intent['intent'] for intent in data['intents'] for _ in intent['examples']])
+    folds = stratified_folds(y, N_FOLDS, 0)
+    results = []
+    for vectorizer_params in expand_grid(TUNING_VECTORIZER_GRID):
+        for classifier_params in expand_grid(TUNING_CLASSIFIER_GRID):
+            params = {'vectorizer': vectorizer_params, 'classifier': classifier_params}
+            hits = 0
+            for train, test in folds:
+                pipeline = make_pipeline(*build_steps(params))
+                pipeline.fit([X[i] for i in train], y[train])
+                hits += int(np.sum(pipeline.predict([X[i] for i in test]) == y[test]))
+            results.append({'params': params, 'accuracy': round(hits / len(y), 4)})
+    results.sort(key=lambda result: -result['accuracy'])
+    return results
+
+
+def main(workers):
+    data = spanish_corpus(N_INTENTS, EXAMPLES_PER_INTENT, vocabulary_size=5000, seed=0)
+    candidates = len(expand_grid(TUNING_VECTORIZER_GRID)) * len(expand_grid(TUNING_CLASSIFIER_GRID))
+    print(f"{N_INTENTS * EXAMPLES_PER_INTENT} ejemplos, {candidates} candidatos, "
+            f"{N_FOLDS} particiones, procesos: {workers or 'uno por núcleo'}")
+    print(f"{'estrategia':<16} {'tiempo (s)':>11} {'exactitud':>10}  parámetros elegidos")
+    strategies = [
+        ('ingenua', naive_search),
+        ('caché', lambda data: search(data, N_FOLDS, 0, workers, elimination_rate=None)),
+        ('caché + parada', lambda data: search(data, N_FOLDS, 0, workers, elimination_rate=2)),
+    ]
+    for name, strategy in strategies:
+        start = time.perf_counter()
+        best = strategy(data)[0]
+        seconds = time.perf_counter() - start
+        print(f"{name:<16} {seconds:>11.2f} {best['accuracy']:>10.4f}  {format_params(best['params'])}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,147 @@
+'''
+Helpers shared by the benchmark scripts. The benchmarks are run from the project root as modules,
+for example: python -m benchmarks.bench_batch_predict
+'''
+
+import random
+import time
+import itertools
+
+from constants import INTENTS_JSON_PATH, MODELS_PATH
+from src.utils import load_data
+from src.response_store import ResponseStore
+from src.intent_classifier_model import IntentClassifier
+
+
+# Builds a classifier trained in memory with the given data, without writing the models/
+# directory, so benchmarks never modify the stored models. Like a new model, it uses the tuned
+# parameters of models/ if there are any.
+def build_classifier(data=None, intents_path=INTENTS_JSON_PATH):
+    if data is None:
+        data = load_data(intents_path)
+    classifier = IntentClassifier.__new__(IntentClassifier)
+    classifier.model_filename = None
+    classifier.models_path = MODELS_PATH
+    classifier.intents_path = intents_path
+    classifier.model = classifier.create_new_model()
+    classifier.train(data)
+    classifier.response_store = ResponseStore(intents_path)
+    # The benchmarks measure the model, the cache has its own benchmark
+    classifier.prediction_cache = None
+    return classifier
+
+
+# Generates n messages by mixing the words of the training examples, so the messages look like
+# real traffic but are not exact copies of the training data.
+def generate_messages(data, n, seed=0):
+    rng = random.Random(seed)
+    words = [word for intent in data['intents'] for example in intent['examples']
+                for word in example.split()]
+    examples = [example for intent in data['intents'] for example in intent['examples']]
+    messages = []
+    for _ in range(n):
+        message = rng.choice(examples).split()
+        message += rng.sample(words, k=min(len(words), rng.randint(0, 3)))
+        rng.shuffle(message)
+        messages.append(" ".join(message))
+    return messages
+
+
+# Generates a synthetic intents dictionary. Each intent has its own topic words, and every example
+# mixes a few of them with words shared by all intents, so the intents can be learned but overlap.
+def synthetic_corpus(n_intents, examples_per_intent, vocabulary_size=5000, words_per_example=6,
+                        seed=0):
+    rng = random.Random(seed)
+    vocabulary = [f"w{index}" for index in range(vocabulary_size)]
+    shared = vocabulary[:max(1, vocabulary_size // 10)]
+    intents = []
+    for intent_index in range(n_intents):
+        topic = rng.sample(vocabulary, k=min(len(vocabulary), 20))
+        examples = [
+            " ".join(rng.choice(topic) if rng.random() < 0.6 else rng.choice(shared)
+                        for _ in range(words_per_example))
+            for _ in range(examples_per_intent)
+        ]
+        intents.append({'intent': f"intent_{intent_index}", 'examples': examples,
+                        'response': f"Respuesta {intent_index}"})
+    return {'intents': intents}
+
+
+# Pieces of the words of the Spanish-like corpus
+ONSETS = ['', '', 'b', 'c', 'd', 'f', 'g', 'l', 'm', 'n', 'p', 'r', 's', 't', 'v', 'ch', 'll', 'br',
+            'tr', 'pl', 'gr', 'qu']
+VOWELS = ['a', 'e', 'i', 'o', 'u'] * 6 + ['á', 'é', 'í', 'ó', 'ú', 'ue', 'ie']
+CODAS = ['', '', '', 'n', 's', 'r', 'l']
+FUNCTION_WORDS = ['de', 'la', 'que', 'el', 'en', 'y', 'a', 'los', 'se', 'por', 'un', 'para', 'con',
+                    'no', 'una', 'su', 'me', 'es', 'mi', 'tu', 'puedo', 'quiero', 'cómo', 'qué']
+
+
+# Generates a random Spanish-like word of 1 to 4 syllables
+def spanish_word(rng):
+    return "".join(rng.choice(ONSETS) + rng.choice(VOWELS) + rng.choice(CODAS)
+                    for _ in range(rng.choice([1, 2, 2, 3, 3, 4])))
+
+
+# Generates a synthetic intents dictionary that looks like Spanish chat data: words made of Spanish
+# syllables (some with accents) with a Zipf-like frequency, function words, capitalized sentences
+# and questions and exclamations with ¿? and ¡!. Each intent draws most of its content words from
+# its own topic, so the intents can be learned but overlap.
+def spanish_corpus(n_intents, examples_per_intent, vocabulary_size=5000, seed=0):
+    rng = random.Random(seed)
+    vocabulary = set()
+    while len(vocabulary) < vocabulary_size:
+        vocabulary.add(spanish_word(rng))
+    vocabulary = sorted(vocabulary)
+    rng.shuffle(vocabulary)
+    # The word of rank r is drawn with a weight of 1 / r
+    cumulative = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    intents = []
+    for intent_index in range(n_intents):
+        topic = rng.sample(vocabulary, k=min(len(vocabulary), 25))
+        examples = []
+        for _ in range(examples_per_intent):
+            words = []
+            for _ in range(rng.randint(2, 9)):
+                draw = rng.random()
+                if draw < 0.5:
+                    words.append(rng.choice(topic))
+                elif draw < 0.8:
+                    words.append(rng.choice(FUNCTION_WORDS))
+                else:
+                    words.append(rng.choices(vocabulary, cum_weights=cumulative)[0])
+            sentence = " ".join(words).capitalize()
+            punctuation = rng.random()
+            if punctuation < 0.3:
+                sentence = f"¿{sentence}?"
+            elif punctuation < 0.45:
+                sentence = f"¡{sentence}!"
+            examples.append(sentence)
+        name = f"{spanish_word(rng).capitalize()}_{intent_index}"
+        response = " ".join(rng.choice(topic) for _ in range(6)).capitalize() + "."
+        intents.append({'intent': name, 'examples': examples, 'response': response})
+    return {'intents': intents}
+
+
+# Splits an intents dictionary into train and test lists (texts and intents)
+def train_test_split_examples(data, test_fraction=0.2, seed=0):
+    rng = random.Random(seed)
+    X_train, y_train, X_test, y_test = [], [], [], []
+    for intent in data['intents']:
+        for example in intent['examples']:
+            if rng.random() < test_fraction:
+                X_test.append(example)
+                y_test.append(intent['intent'])
+            else:
+                X_train.append(example)
+                y_train.append(intent['intent'])
+    return X_train, y_train, X_test, y_test
+
+
+# Runs func the given number of times and returns the best elapsed time in seconds
+def best_time(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
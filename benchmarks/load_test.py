@@ -0,0 +1,114 @@
+'''
+Load test of the inference server (src/server.py). Opens several concurrent keep-alive
+connections against localhost, sends single-message /predict requests and reports throughput,
+client side latency percentiles and the server's own /metrics.
+
+Start the server first (python -m src.server) and then run:
+    python -m benchmarks.load_test [--clients 50] [--requests 5000] [--port 8000] [--processes 1]
+
+With --processes the clients are split among several client processes, which is needed to load a
+server with several workers (python -m src.server --workers N) without the client being the
+bottleneck.
+'''
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from constants import SERVER_HOST, SERVER_PORT, INTENTS_JSON_PATH
+from src.utils import load_data
+from src.server import LatencyMetrics
+from benchmarks.common import generate_messages
+
+
+# Sends one HTTP request over an open connection and returns the status and decoded JSON body
+async def request(reader, writer, method, path, payload=None):
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode('latin-1')
+        + body
+    )
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode('latin-1').split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    length = next(int(line.split(":", 1)[1]) for line in lines
+                    if line.lower().startswith('content-length'))
+    return status, json.loads(await reader.readexactly(length))
+
+
+# One client: sends its share of the messages sequentially over a single connection. If the
+# server closes the connection (for example a worker that is being replaced), the client opens a
+# new one and sends the request again, like an HTTP client with a connection pool does.
+async def client(host, port, messages, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for message in messages:
+            start = time.perf_counter()
+            try:
+                status, _ = await request(reader, writer, 'POST', '/predict', {'message': message})
+            except (asyncio.IncompleteReadError, ConnectionError):
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+                status, _ = await request(reader, writer, 'POST', '/predict', {'message': message})
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+# Runs a group of clients in the current process and returns their latencies and statuses
+def run_clients(host, port, messages, clients):
+    latencies = []
+    statuses = {}
+
+    async def run():
+        await asyncio.gather(*(client(host, port, messages[i::clients], latencies, statuses)
+                                for i in range(clients)))
+
+    asyncio.run(run())
+    return latencies, statuses
+
+
+async def main(args):
+    messages = generate_messages(load_data(INTENTS_JSON_PATH), args.requests)
+    latencies = []
+    statuses = {}
+    start = time.perf_counter()
+    if args.processes > 1:
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(args.processes) as executor:
+            groups = await asyncio.gather(*(
+                loop.run_in_executor(executor, run_clients, args.host, args.port,
+                                        messages[i::args.processes],
+                                        max(1, args.clients // args.processes))
+                for i in range(args.processes)))
+        for group_latencies, group_statuses in groups:
+            latencies += group_latencies
+            for status, count in group_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+    else:
+        await asyncio.gather(*(client(args.host, args.port, messages[i::args.clients], latencies,
+                                        statuses) for i in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    print(f"Peticiones: {args.requests}  clientes: {args.clients}  tiempo: {elapsed:.2f} s")
+    print(f"Rendimiento: {args.requests / elapsed:.0f} peticiones/s  estados: {statuses}")
+    print(f"Latencia cliente p50: {LatencyMetrics.percentile(latencies, 50) * 1000:.2f} ms  "
+            f"p99: {LatencyMetrics.percentile(latencies, 99) * 1000:.2f} ms")
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    _, metrics = await request(reader, writer, 'GET', '/metrics')
+    writer.close()
+    print(f"Métricas del servidor: {json.dumps(metrics, indent=2)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Prueba de carga del servidor de inferencia.")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--processes', type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,301 @@
+'''
+Reproducible benchmark suite. A synthetic Spanish-like corpus is generated from a seed and sized by
+the number of intents, examples per intent and vocabulary size, and written to a temporary
+workspace (data/ and models/), so the stored models of the project are never touched. Then the
+main operations are timed:
+
+    cold_start         new Python process: imports, IntentClassifier() with a saved model and first
+                       prediction
+    train              IntentClassifier.train on the whole corpus
+    load_model         IntentClassifier.load_model of the saved model (compact format if enabled)
+    load_pickle        joblib.load of the saved .pkl
+    predict_single     predict + response_message_to_intent, one message at a time
+    predict_batch      predict_batch of all the messages at once (without the prediction cache)
+    response_lookup    response_message_to_intent
+    add_intents        merge of a training file with 10% of the size of the corpus
+    reload_responses   ResponseStore.reload of intents.json
+    reload_classifier  IntentClassifier() again in a process that already imported everything
+
+Each benchmark runs in its own new process, which also reports its peak resident memory. The
+results are saved as JSON together with the parameters, the commit and the Python version, and a
+previous result file can be given to flag the benchmarks that got slower (or use more memory) by
+more than a threshold.
+
+Usage: python -m benchmarks.suite [--intents 50] [--examples 200] [--vocabulary 5000] [--seed 0]
+                                  [--messages 2000] [--repeat 3] [--only train,predict_batch]
+                                  [--output FILE] [--compare FILE] [--threshold 0.10]
+'''
+
+import io
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+from constants import PROJECT_ROOT, INTENTS_JSON
+from src.utils import load_data, save_json
+from benchmarks.common import spanish_corpus, generate_messages, best_time
+
+
+RESULTS_PATH = os.path.join(PROJECT_ROOT, 'benchmarks', 'results')
+# Measurements compared against the previous run
+COMPARED_FIELDS = ('seconds', 'peak_rss_mb')
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+RSS_UNIT = 1024 ** 2 if sys.platform == 'darwin' else 1024
+
+
+# Builds a classifier of the workspace without the prediction cache, so the model is measured
+def workspace_classifier(workspace):
+    from src.intent_classifier_model import IntentClassifier
+    classifier = IntentClassifier(os.path.join(workspace, 'data'), os.path.join(workspace, 'models'))
+    classifier.prediction_cache = None
+    return classifier
+
+
+# Program run by cold_start: imports, loading of the saved model and first prediction
+COLD_START_CODE = (
+    "import sys\n"
+    "from src.intent_classifier_model import IntentClassifier\n"
+    "IntentClassifier(sys.argv[1], sys.argv[2]).predict('hola')\n"
+)
+
+
+def bench_cold_start(workspace, options):
+    import resource
+    command = [sys.executable, '-W', 'ignore', '-c', COLD_START_CODE,
+                os.path.join(workspace, 'data'), os.path.join(workspace, 'models')]
+    seconds = best_time(lambda: subprocess.run(command, cwd=PROJECT_ROOT, check=True,
+                                                stdout=subprocess.DEVNULL), options['repeat'])
+    # The memory measured is the one of the new processes
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {'seconds': seconds, 'peak_rss_mb': peak / RSS_UNIT}
+
+
+def bench_train(workspace, options):
+    from src.intent_classifier_model import IntentClassifier
+    data = load_data(os.path.join(workspace, 'data', INTENTS_JSON))
+    classifier = IntentClassifier.__new__(IntentClassifier)
+    classifier.models_path = os.path.join(workspace, 'models')
+    classifier.model = classifier.create_new_model()
+    seconds = best_time(lambda: classifier.train(data), options['repeat'])
+    examples = sum(len(intent['examples']) for intent in data['intents'])
+    return {'seconds': seconds, 'examples': examples}
+
+
+def bench_load_model(workspace, options):
+    classifier = workspace_classifier(workspace)
+    seconds = best_time(lambda: classifier.load_model(classifier.model_filename), options['repeat'])
+    return {'seconds': seconds}
+
+
+def bench_load_pickle(workspace, options):
+    import joblib
+    classifier = workspace_classifier(workspace)
+    seconds = best_time(lambda: joblib.load(classifier.model_filename), options['repeat'])
+    return {'seconds': seconds}
+
+
+def bench_predict_single(workspace, options):
+    classifier = workspace_classifier(workspace)
+    messages = generate_messages(classifier.response_store.snapshot().data, options['messages'])
+
+    def run():
+        for message in messages:
+            intent = classifier.predict(message)
+            if intent in classifier.response_store.snapshot().intent_map:
+                classifier.response_message_to_intent(intent)
+
+    seconds = best_time(run, options['repeat'])
+    return {'seconds': seconds, 'us_per_message': seconds / len(messages) * 1e6}
+
+
+def bench_predict_batch(workspace, options):
+    classifier = workspace_classifier(workspace)
+    messages = generate_messages(classifier.response_store.snapshot().data, options['messages'])
+    seconds = best_time(lambda: classifier.predict_batch(messages), options['repeat'])
+    return {'seconds': seconds, 'us_per_message': seconds / len(messages) * 1e6}
+
+
+def bench_response_lookup(workspace, options):
+    classifier = workspace_classifier(workspace)
+    intents = list(classifier.response_store.snapshot().intent_map)
+    calls = [intents[index % len(intents)] for index in range(options['messages'])]
+    seconds = best_time(lambda: [classifier.response_message_to_intent(intent) for intent in calls],
+                        options['repeat'])
+    return {'seconds': seconds, 'us_per_call': seconds / len(calls) * 1e6}
+
+
+def bench_add_intents(workspace, options):
+    from src.utils import add_intents
+    base = load_data(os.path.join(workspace, 'data', INTENTS_JSON))
+    train = load_data(os.path.join(workspace, 'train.json'))
+    best = float('inf')
+    for _ in range(options['repeat']):
+        # The merge modifies its input, every run starts from fresh copies
+        base_copy, train_copy = copy.deepcopy(base), copy.deepcopy(train)
+        start = time.perf_counter()
+        add_intents(base_copy, train_copy)
+        best = min(best, time.perf_counter() - start)
+    return {'seconds': best}
+
+
+def bench_reload_responses(workspace, options):
+    from src.response_store import ResponseStore
+    store = ResponseStore(os.path.join(workspace, 'data', INTENTS_JSON))
+    seconds = best_time(lambda: store.reload(force=True), options['repeat'])
+    return {'seconds': seconds}
+
+
+def bench_reload_classifier(workspace, options):
+    workspace_classifier(workspace)
+    seconds = best_time(lambda: workspace_classifier(workspace), options['repeat'])
+    return {'seconds': seconds}
+
+
+BENCHMARKS = {
+    'cold_start': bench_cold_start,
+    'train': bench_train,
+    'load_model': bench_load_model,
+    'load_pickle': bench_load_pickle,
+    'predict_single': bench_predict_single,
+    'predict_batch': bench_predict_batch,
+    'response_lookup': bench_response_lookup,
+    'add_intents': bench_add_intents,
+    'reload_responses': bench_reload_responses,
+    'reload_classifier': bench_reload_classifier,
+}
+
+
+# Runs one benchmark in the current process (a new one started by the suite) and adds its peak
+# resident memory. The output of the classifier is discarded.
+def run_in_process(name, workspace, options):
+    import resource
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = BENCHMARKS[name](workspace, options)
+    result.setdefault('peak_rss_mb', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / RSS_UNIT)
+    return result
+
+
+# Runs one benchmark in a new process and returns its result
+def run_benchmark(name, workspace, options):
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_in_process, name, workspace, options).result()
+
+
+# Writes the corpus, a training file to merge and a trained model to the workspace
+def prepare_workspace(workspace, options):
+    data = spanish_corpus(options['intents'], options['examples'], options['vocabulary'],
+                            options['seed'])
+    os.makedirs(os.path.join(workspace, 'data'))
+    save_json(data, os.path.join(workspace, 'data', INTENTS_JSON))
+    # Training file with 10% of the size of the corpus: half of its examples are new and half are
+    # already in the corpus, plus 10% of new intents
+    extra = spanish_corpus(options['intents'] + max(1, options['intents'] // 10),
+                            max(2, options['examples'] // 10), options['vocabulary'],
+                            options['seed'] + 1)
+    for intent, base_intent in zip(extra['intents'], data['intents']):
+        intent['intent'] = base_intent['intent']
+        half = len(intent['examples']) // 2
+        intent['examples'][:half] = base_intent['examples'][:half]
+    save_json(extra, os.path.join(workspace, 'train.json'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        workspace_classifier(workspace)
+
+
+# Returns the current commit, if the project is a git repository
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Compares two result files. Returns the list of regressions as (benchmark, field, previous,
+# current, change).
+def compare(previous, current, threshold):
+    regressions = []
+    for name, result in current['results'].items():
+        before = previous['results'].get(name)
+        if not before:
+            continue
+        for field in COMPARED_FIELDS:
+            if not before.get(field) or field not in result:
+                continue
+            change = result[field] / before[field] - 1
+            if change > threshold:
+                regressions.append((name, field, before[field], result[field], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Suite de benchmarks del clasificador.")
+    parser.add_argument('--intents', type=int, default=50)
+    parser.add_argument('--examples', type=int, default=200, help="Ejemplos por intención.")
+    parser.add_argument('--vocabulary', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', help="Benchmarks a ejecutar, separados por comas.")
+    parser.add_argument('--output', help="Archivo JSON de resultados.")
+    parser.add_argument('--compare', help="Archivo JSON de una ejecución anterior.")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Aumento relativo a partir del cual se marca una regresión.")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Benchmarks desconocidos: {', '.join(unknown)}")
+    options = {key: getattr(args, key)
+                for key in ('intents', 'examples', 'vocabulary', 'seed', 'messages', 'repeat')}
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': options,
+        'results': {},
+    }
+    with tempfile.TemporaryDirectory() as workspace:
+        print(f"Generando el corpus: {args.intents} intenciones x {args.examples} ejemplos, "
+                f"vocabulario de {args.vocabulary} palabras (semilla {args.seed})")
+        prepare_workspace(workspace, options)
+        print(f"{'benchmark':<18} {'tiempo (s)':>11} {'pico RSS (MB)':>14}")
+        for name in names:
+            result = run_benchmark(name, workspace, options)
+            report['results'][name] = result
+            print(f"{name:<18} {result['seconds']:>11.4f} {result['peak_rss_mb']:>14.1f}")
+
+    output = args.output or os.path.join(RESULTS_PATH,
+                                            f"suite_{datetime.now():%Y-%m-%d_%H-%M-%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    print(f"Resultados guardados en {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous.get('parameters') != options:
+            print("Advertencia: los parámetros de las dos ejecuciones no son iguales.")
+        regressions = compare(previous, report, args.threshold)
+        for name, field, before, after, change in regressions:
+            print(f"REGRESIÓN {name} {field}: {before:.4f} -> {after:.4f} (+{change:.1%})")
+        if regressions:
+            sys.exit(1)
+        print(f"Sin regresiones mayores a {args.threshold:.0%} respecto a {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,8 @@ MODELS_PATH = os.path.join(PROJECT_ROOT, 'models')
 SRC_PATH = os.path.join(PROJECT_ROOT, 'src')
 OLD_TRAIN_FILES_PATH = os.path.join(PROJECT_ROOT, 'data/old_training_files')
 OLD_INTENTS_FILES_PATH = os.path.join(PROJECT_ROOT, 'data/old_intents_files')
+# Content-addressed versions of intents.json and of the training files (src/snapshot_store.py)
+SNAPSHOTS_PATH = os.path.join(PROJECT_ROOT, 'data/snapshots')
 
 # Paths to specific files
 INTENTS_JSON_PATH = os.path.join(DATA_PATH, 'intents.json')
@@ -17,3 +19,150 @@ INTENTS_TRAIN_JSON_PATH = os.path.join(DATA_PATH, 'intents_train.json')
 # Name of specific files
 INTENTS_JSON = 'intents.json'
 INTENTS_TRAIN_JSON = 'intents_train.json'
+# Labeled examples that are never trained on, used to evaluate the stored models (src/evaluation.py)
+INTENTS_TEST_JSON = 'intents_test.json'
+# Without that file, fraction of the examples of intents.json sampled to evaluate the stored models
+EVALUATION_TEST_SIZE = 0.2
+
+# Minimum number of seconds between two checks of intents.json for changes
+RESPONSE_STORE_CHECK_INTERVAL = 1.0
+
+# Settings of the HTTP inference server (src/server.py)
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8000
+# Maximum number of messages classified together in a single vectorized call
+SERVER_MAX_BATCH_SIZE = 64
+# Maximum time a message waits for other messages to fill its batch, in milliseconds
+SERVER_MAX_WAIT_MS = 5
+# Maximum number of messages waiting to be classified, beyond that requests are rejected (503)
+SERVER_MAX_QUEUE_SIZE = 1024
+# Number of latencies kept to compute the p50/p99 percentiles
+SERVER_LATENCY_WINDOW = 10000
+# Largest request body accepted, in bytes, larger requests are rejected (413)
+SERVER_MAX_BODY_SIZE = 1024 ** 2
+# Seconds a connection may take to send the head or the body of a request, and to start the next
+# request on a kept-alive connection, before it is closed
+SERVER_READ_TIMEOUT = 30
+
+# Seconds between two checks of data/ and models/ looking for a new training file or model
+MODEL_WATCH_INTERVAL = 2.0
+
+# Save a NumPy-only compact copy of every model and load it instead of the joblib pickle
+USE_COMPACT_MODEL = True
+# Compaction of the compact copy after training (src/model_compaction.py). Terms to drop: 'chi2'
+# (least related to the intents), 'df' (in the fewest examples) or None to keep every term
+COMPACT_FEATURE_SELECTION = None
+# Fraction of the terms kept by the selection
+COMPACT_KEEP_FEATURES = 1.0
+# Precision of the Naive Bayes weights: 'float64' (the same probabilities as the pipeline),
+# 'float32', 'float16' or 'int8'
+COMPACT_WEIGHTS_DTYPE = 'float64'
+# Largest accepted drop of accuracy, beyond it the compact copy is saved without compaction
+COMPACT_MAX_ACCURACY_DROP = 0.01
+# Fraction of the examples of every intent kept out of the fit of the copy of the model that
+# measures the accuracy of the compaction
+COMPACT_VALIDATION_FRACTION = 0.2
+# Maximum number of held-out examples predicted to measure the accuracy of the compaction
+COMPACT_VALIDATION_SIZE = 5000
+
+# Manifest of the trained models inside MODELS_PATH, with the active version
+MODEL_REGISTRY_JSON = 'registry.json'
+# Number of model versions kept on disk when a new model is registered, older ones are deleted.
+# None keeps all of them, old versions are then only deleted with `python -m src.model_registry prune`.
+MODEL_RETENTION = None
+# Settings of TF-IDF and Naive Bayes chosen by the hyperparameter search (src/tuning.py), inside
+# MODELS_PATH. New models use them instead of the defaults while the file exists.
+TUNED_PARAMS_JSON = 'tuned_params.json'
+# Values tried by the hyperparameter search for the TfidfVectorizer and for MultinomialNB. Every
+# combination is a candidate.
+TUNING_VECTORIZER_GRID = {
+    'ngram_range': [(1, 1), (1, 2)],
+    'min_df': [1, 2],
+    'sublinear_tf': [False, True],
+}
+TUNING_CLASSIFIER_GRID = {
+    'alpha': [0.01, 0.03, 0.1, 0.3, 1.0],
+}
+# After each fold only the best 1 / TUNING_ELIMINATION_RATE of the candidates are evaluated on the
+# next one (None evaluates every candidate on every fold)
+TUNING_ELIMINATION_RATE = 2
+
+# 'full' refits TF-IDF and Naive Bayes on the whole corpus when a training file arrives,
+# 'incremental' only adds the new examples to the statistics stored in INCREMENTAL_STATE_PATH
+TRAINING_MODE = 'full'
+INCREMENTAL_STATE_PATH = os.path.join(MODELS_PATH, 'incremental_state.npz')
+
+# Normalization of the texts before the vectorizer (src/text_normalization.py): lowercase, accents
+# and punctuation removed. Only the models trained after changing it are affected.
+TEXT_NORMALIZATION = True
+# Light stemming (plural and gender endings) on top of the normalization
+TEXT_STEMMING = False
+
+# Features of new Naive Bayes models: 'vocabulary' (TfidfVectorizer, one column per distinct term)
+# or 'hashing' (a fixed number of hashed buckets, see src/hashing_features.py)
+FEATURE_MODE = 'vocabulary'
+# Number of buckets of the hashing mode, the size of the model does not grow beyond it. Naive Bayes
+# keeps two float64 values per bucket and intent, 2 ** 14 buckets are 256 KB per intent.
+HASHING_N_FEATURES = 2 ** 14
+# Sizes of the n-grams hashed as terms, (1, 2) adds the pairs of consecutive words
+HASHING_NGRAM_RANGE = (1, 1)
+# Processes that hash the training examples in parallel (None uses one per core)
+HASHING_TRAINING_WORKERS = None
+
+# Treat examples that only differ in what the text normalization removes as duplicates when merging
+# a training file into intents.json. Off by default, so only identical examples are duplicates and
+# turning on TEXT_NORMALIZATION does not drop examples from intents.json.
+MERGE_NORMALIZE_EXAMPLES = False
+
+# Number of examples read and vectorized at a time when training from a file as a stream
+STREAMING_CHUNK_SIZE = 10000
+# Largest intent, in characters, that the JSON reader without ijson buffers before giving up. A file
+# that is not valid JSON is rejected once this much of it has been read.
+STREAMING_MAX_INTENT_SIZE = 64 * 1024 ** 2
+# Number of messages classified at a time by the bulk classification of files (src/bulk_classify.py)
+BULK_CHUNK_SIZE = 5000
+# Chunks sent to the worker processes and not written yet, per worker. Bounds the memory used.
+BULK_PENDING_CHUNKS_PER_WORKER = 2
+
+# Instrumentation (src/metrics.py), configured through environment variables
+METRICS_PORT = int(os.environ.get('CHATBOT_METRICS_PORT', 0)) or None
+METRICS_DUMP_PATH = os.environ.get('CHATBOT_METRICS_DUMP')
+METRICS_DUMP_INTERVAL = float(os.environ.get('CHATBOT_METRICS_DUMP_INTERVAL', 60))
+PROFILE_SAMPLE_RATE = float(os.environ.get('CHATBOT_PROFILE_SAMPLE_RATE', 0))
+PROFILE_OUTPUT_PATH = os.environ.get('CHATBOT_PROFILE_OUTPUT', os.path.join(PROJECT_ROOT, 'profile.txt'))
+
+# Cache of the results of the model by normalized message (src/prediction_cache.py)
+USE_PREDICTION_CACHE = True
+# Maximum number of cached messages, the least recently used ones are evicted
+PREDICTION_CACHE_SIZE = 10000
+# Seconds a cached result is valid (None keeps it until it is evicted)
+PREDICTION_CACHE_TTL = 600
+
+# Multi-process serving (src/prefork.py)
+# Seconds a worker waits for its requests in progress when it is stopped or replaced
+PREFORK_GRACEFUL_TIMEOUT = 30
+# A worker that crashes sooner than this many seconds after starting is restarted after waiting
+# the same time, so a worker that cannot start does not fork in a loop
+PREFORK_RESTART_DELAY = 1.0
+
+# Directory with one subdirectory per tenant (customer), each with its own data/ and models/
+TENANTS_PATH = os.path.join(PROJECT_ROOT, 'tenants')
+# Memory budget of the tenant classifiers kept loaded, the least recently used are evicted
+TENANT_MEMORY_BUDGET_MB = 512
+
+# Classification engine of new models: 'naive_bayes' (TF-IDF + MultinomialNB) or 'retrieval'
+# (nearest training examples in an inverted index, see src/retrieval_engine.py)
+CLASSIFIER_ENGINE = 'naive_bayes'
+# Number of nearest examples returned by the retrieval engine
+RETRIEVAL_TOP_K = 5
+# Minimum cosine similarity of the closest example, below it the message is an unknown intent
+RETRIEVAL_UNKNOWN_THRESHOLD = 0.2
+# Minimum probability of the predicted intent for the other engines (None disables it)
+UNKNOWN_INTENT_THRESHOLD = None
+# Intent and response used when a message is below the threshold. Adding an intent with this name
+# to intents.json replaces the response.
+UNKNOWN_INTENT = 'Desconocido'
+UNKNOWN_INTENT_RESPONSE = "Lo siento, no entendí tu mensaje. ¿Podrías decirlo de otra forma?"
+
+# Maximum number of rows kept in the conversation history of the window, the oldest are removed
+GUI_MAX_HISTORY_CONTROLS = 200
@@ -0,0 +1,304 @@
+'''
+Bulk classification of chat log files, for labeling large amounts of historical messages (to find
+new intents or measure how many messages the current intents cover). The input is read as a
+stream in chunks of BULK_CHUNK_SIZE messages, and every chunk is classified at once (vectorized
+predict_proba) by a pool of worker processes that load the model once each. Three formats are
+accepted, optionally compressed with gzip (.gz):
+
+    text  (.txt)    one message per line
+    CSV   (.csv)    with a header, the message is in the column --field
+    JSONL (.jsonl)  one object per line, the message is in the key --field (or a plain string)
+
+The results are written in the order of the input, one record per message: its position, intent,
+response id (the position of the intent in intents.json, null if it has no response) and
+confidence (the probability of the intent). The output is JSON Lines, or CSV if its name ends in
+.csv. At most BULK_PENDING_CHUNKS_PER_WORKER chunks per worker are in flight, so memory does not
+depend on the size of the input.
+
+After every written chunk, a checkpoint (<output>.checkpoint) saves the byte offset reached in the
+input and the size of the output. With --resume, an interrupted run truncates the output to the
+last checkpoint and goes on from that offset in the input, with the model of the checkpoint. A
+compressed input is decompressed again up to that offset (gzip has no random access), but the
+messages before it are not parsed nor classified again.
+
+Usage: python -m src.bulk_classify INPUT OUTPUT [--format text|csv|jsonl] [--field message]
+                                   [--model FILE] [--workers N] [--chunk-size N] [--with-text]
+                                   [--resume]
+'''
+
+import io
+import os
+import sys
+import csv
+import gzip
+import json
+import time
+import argparse
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from constants import DATA_PATH, MODELS_PATH, INTENTS_JSON
+from constants import BULK_CHUNK_SIZE, BULK_PENDING_CHUNKS_PER_WORKER
+from constants import UNKNOWN_INTENT, UNKNOWN_INTENT_THRESHOLD
+from src.utils import load_data
+from src.text_normalization import normalize_text
+from src.compact_model import load_model_file
+from src.model_registry import ModelRegistry
+
+
+# Formats of the input by file extension, without .gz
+INPUT_FORMATS = {'.txt': 'text', '.csv': 'csv', '.jsonl': 'jsonl'}
+OUTPUT_FIELDS = ['record', 'intent', 'response_id', 'confidence']
+CHECKPOINT_SUFFIX = '.checkpoint'
+# Size of the blocks discarded when a compressed input is resumed
+SKIP_BLOCK_SIZE = 1 << 20
+
+# Model and response ids of a worker process, set by init_worker
+_worker = {}
+
+
+# Returns the format of an input file from its name
+def input_format(file_path):
+    name = file_path[:-3] if file_path.endswith('.gz') else file_path
+    return INPUT_FORMATS.get(os.path.splitext(name)[1].lower(), 'text')
+
+
+# Opens an input file in binary mode, decompressing it if it ends in .gz
+def open_input(file_path):
+    return gzip.open(file_path, 'rb') if file_path.endswith('.gz') else open(file_path, 'rb')
+
+
+# Moves an input file forward to a byte offset of its content. A gzip file has no random access:
+# GzipFile.seek decompresses everything before the offset, and starts again from the beginning of
+# the file to go back, so a compressed input is only read forward, discarding large blocks.
+def skip_to(f, offset):
+    if not isinstance(f, gzip.GzipFile):
+        f.seek(offset)
+        return
+    remaining = offset - f.tell()
+    while remaining > 0:
+        block = f.read(min(remaining, SKIP_BLOCK_SIZE))
+        if not block:
+            return
+        remaining -= len(block)
+
+
+# Yields the decoded lines of a binary file with the byte offset after each one
+def iter_lines(f, offset):
+    for line in f:
+        offset += len(line)
+        yield offset, line.decode('utf-8', errors='replace')
+
+
+# Yields the messages of an input file from a byte offset, each one with the offset after it.
+# A record without a message (a missing field, an invalid JSON line) yields an empty message.
+def iter_records(file_path, file_format, field='message', offset=0):
+    with open_input(file_path) as f:
+        if file_format == 'csv':
+            # The header is read from the beginning even when resuming
+            first = f.readline()
+            header = next(csv.reader([first.decode('utf-8-sig')]), [])
+            if field not in header:
+                raise ValueError(f"El archivo {file_path} no tiene la columna '{field}'.")
+            column = header.index(field)
+            offset = max(offset, len(first))
+        skip_to(f, offset)
+        lines = iter_lines(f, offset)
+        if file_format == 'text':
+            for end, line in lines:
+                yield end, line.rstrip('\r\n').lstrip('\ufeff')
+        elif file_format == 'jsonl':
+            for end, line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    value = json.loads(line)
+                except json.JSONDecodeError:
+                    value = None
+                message = value.get(field) if isinstance(value, dict) else value
+                yield end, message if isinstance(message, str) else ''
+        elif file_format == 'csv':
+            # The reader takes the lines one at a time, a quoted message can span several lines
+            position = [offset]
+            def source():
+                for end, line in lines:
+                    position[0] = end
+                    yield line
+            for row in csv.reader(source()):
+                yield position[0], row[column] if column < len(row) else ''
+        else:
+            raise ValueError(f"Formato de entrada desconocido: {file_format}")
+
+
+# Returns the response id of every intent with a response: its position in intents.json
+def response_ids(data):
+    return {intent['intent']: position for position, intent in enumerate(data['intents'])
+            if intent.get('response')}
+
+
+# Loads the model and the response ids in a worker process, once per process
+def init_worker(model_file, intents_path):
+    _worker['model'] = load_model_file(model_file)
+    _worker['response_ids'] = response_ids(load_data(intents_path))
+
+
+# Worker task: classifies a chunk of messages at once. Returns one (intent, response id,
+# confidence) tuple per message, with None for the empty messages.
+def classify_chunk(messages):
+    model = _worker['model']
+    results = [(None, None, None)] * len(messages)
+    positions = [position for position, message in enumerate(messages) if message.strip()]
+    if not positions:
+        return results
+    probabilities = model.predict_proba([messages[position] for position in positions])
+    best = probabilities.argmax(axis=1)
+    intents = model.classes_[best].tolist()
+    scores = probabilities[np.arange(len(positions)), best].tolist()
+    # Same fallback as IntentClassifier.score_batch
+    threshold = getattr(model, 'unknown_threshold', UNKNOWN_INTENT_THRESHOLD)
+    for position, intent, score in zip(positions, intents, scores):
+        if threshold is not None and score < threshold:
+            intent = UNKNOWN_INTENT
+        results[position] = (intent, _worker['response_ids'].get(intent), round(score, 4))
+    # The memoized text normalization pays off with the repeated messages of live traffic, but a
+    # log has mostly distinct lines: it is emptied after every chunk so the memory of a worker does
+    # not grow with the input
+    normalize_text.cache_clear()
+    return results
+
+
+# Serializes the results of a chunk in the format of the output
+def format_rows(first_record, results, messages, as_csv):
+    fields = OUTPUT_FIELDS + (['message'] if messages is not None else [])
+    rows = [[first_record + offset, *result] + ([messages[offset]] if messages is not None else [])
+            for offset, result in enumerate(results)]
+    if as_csv:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(rows)
+        return buffer.getvalue().encode('utf-8')
+    return ''.join(json.dumps(dict(zip(fields, row)), ensure_ascii=False) + '\n'
+                    for row in rows).encode('utf-8')
+
+
+# Writes a checkpoint atomically
+def save_checkpoint(checkpoint_path, state):
+    temporary = f"{checkpoint_path}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=4)
+    os.replace(temporary, checkpoint_path)
+
+
+# Classifies every message of an input file and writes the results to output_path. With
+# resume=True it goes on from the checkpoint of output_path, if there is one. Returns the final
+# state of the checkpoint.
+def classify_file(input_path, output_path, model_file=None, intents_path=None,
+                    models_path=MODELS_PATH, file_format=None, field='message',
+                    chunk_size=BULK_CHUNK_SIZE, workers=None, resume=False, with_text=False):
+    checkpoint_path = f"{output_path}{CHECKPOINT_SUFFIX}"
+    as_csv = output_path.endswith('.csv')
+    state = None
+    if resume and os.path.isfile(checkpoint_path):
+        state = load_data(checkpoint_path)
+        if state['input'] != os.path.abspath(input_path):
+            raise ValueError(f"El punto de control {checkpoint_path} es de otro archivo: "
+                                f"{state['input']}")
+        if state['done']:
+            return state
+        # The same model as the interrupted run, unless another one is given
+        model_file = model_file or state['model']
+    model_file = model_file or ModelRegistry(models_path).active_model_path()
+    if not model_file or not os.path.isfile(model_file):
+        raise ValueError("No hay un modelo para clasificar los mensajes.")
+    intents_path = intents_path or os.path.join(DATA_PATH, INTENTS_JSON)
+    file_format = file_format or input_format(input_path)
+    if state is None:
+        state = {'input': os.path.abspath(input_path), 'model': os.path.abspath(model_file),
+                    'format': file_format, 'field': field, 'records': 0, 'input_offset': 0,
+                    'output_bytes': 0, 'done': False}
+        output = open(output_path, 'wb')
+        if as_csv:
+            header = OUTPUT_FIELDS + (['message'] if with_text else [])
+            output.write((','.join(header) + '\n').encode('utf-8'))
+    else:
+        print(f"Se continúa desde el mensaje {state['records']} "
+                f"(byte {state['input_offset']} de la entrada).")
+        output = open(output_path, 'r+b')
+        # Whatever was written after the checkpoint is written again
+        output.truncate(state['output_bytes'])
+        output.seek(state['output_bytes'])
+
+    try:
+        workers = workers or os.cpu_count() or 1
+        records = iter_records(input_path, state['format'], state['field'], state['input_offset'])
+        pending = deque()
+        max_pending = workers * BULK_PENDING_CHUNKS_PER_WORKER
+        start = time.perf_counter()
+        classified = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                    initargs=(model_file, intents_path)) as executor:
+            while True:
+                chunk = list(islice(records, chunk_size))
+                if chunk:
+                    offsets, messages = zip(*chunk)
+                    pending.append((offsets[-1], list(messages) if with_text else None,
+                                    executor.submit(classify_chunk, list(messages))))
+                # The chunks are written in the order of the input, the oldest one first
+                while pending and (len(pending) >= max_pending or not chunk):
+                    end, messages, future = pending.popleft()
+                    results = future.result()
+                    output.write(format_rows(state['records'], results, messages, as_csv))
+                    output.flush()
+                    os.fsync(output.fileno())
+                    state.update(records=state['records'] + len(results), input_offset=end,
+                                    output_bytes=output.tell())
+                    save_checkpoint(checkpoint_path, state)
+                    classified += len(results)
+                    print(f"Mensajes clasificados: {state['records']} "
+                            f"({classified / (time.perf_counter() - start):.0f} por segundo)")
+                if not chunk:
+                    break
+        state['done'] = True
+        save_checkpoint(checkpoint_path, state)
+        return state
+    except ValueError:
+        raise
+    except Exception as e:
+        raise Exception(f"Error al clasificar {input_path}, se puede continuar con --resume: {e}")
+    finally:
+        output.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clasificación masiva de archivos de mensajes.")
+    parser.add_argument('input', help="Archivo de entrada (.txt, .csv o .jsonl, opcionalmente .gz).")
+    parser.add_argument('output', help="Archivo de resultados (.jsonl, o .csv).")
+    parser.add_argument('--format', choices=sorted(set(INPUT_FORMATS.values())),
+                        help="Formato de la entrada (por defecto, según su extensión).")
+    parser.add_argument('--field', default='message',
+                        help="Columna (CSV) o clave (JSONL) con el mensaje.")
+    parser.add_argument('--model', help="Modelo .pkl (por defecto, el activo del registro).")
+    parser.add_argument('--models', default=MODELS_PATH, help="Carpeta de los modelos.")
+    parser.add_argument('--intents', default=os.path.join(DATA_PATH, INTENTS_JSON),
+                        help="Archivo de intenciones de donde salen los ids de las respuestas.")
+    parser.add_argument('--workers', type=int, help="Procesos (por defecto, uno por núcleo).")
+    parser.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE)
+    parser.add_argument('--with-text', action='store_true', help="Incluye el mensaje en la salida.")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continúa desde el último punto de control de la salida.")
+    args = parser.parse_args(argv)
+
+    try:
+        state = classify_file(args.input, args.output, args.model, args.intents, args.models,
+                                args.format, args.field, args.chunk_size, args.workers,
+                                args.resume, args.with_text)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"{state['records']} mensajes clasificados en {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,39 @@
+import threading
+
 from src.intent_classifier_model import IntentClassifier
+from src.tenants import TenantManager
+from src.metrics import metrics, start_exporters
 
-# Global variable to store the classifier
+# Global variable to store the classifier. It is only replaced as a whole (see publish_classifier),
+# so a request that already took a reference keeps using the same model until it finishes.
 classifier = None
+# Avoids loading the first classifier several times when many requests arrive at once
+_classifier_lock = threading.Lock()
+# Classifiers of the tenants (one bot per customer), loaded on first use
+tenant_manager = TenantManager()
 
 
-# Obtain a trained classifier model or train a new one if one does not exist
-def get_or_train_classifier():
+# Obtain a trained classifier model or train a new one if one does not exist. With exporters=False
+# the metrics exporters are not started (the prefork supervisor starts them in each worker).
+def get_or_train_classifier(exporters=True):
     
     global classifier
     try:
         if classifier is None:
-            print("Cargando el modelo...")
-            # Initializes the classifier
-            classifier = IntentClassifier()  
-            # If a model cannot be loaded, whether it is a saved one or a created one
-            if not classifier.model:
-                print("Se genero un error y no fue posible cargar un Modelo o crearlo")
-                return None
+            with _classifier_lock:
+                if classifier is None:
+                    # Exporters enabled through environment variables, if any
+                    if exporters:
+                        start_exporters()
+                    print("Cargando el modelo...")
+                    # Initializes the classifier
+                    with metrics.timer('model_load'):
+                        new_classifier = IntentClassifier()
+                    # If a model cannot be loaded, whether it is a saved one or a created one
+                    if not new_classifier.model:
+                        print("Se genero un error y no fue posible cargar un Modelo o crearlo")
+                        return None
+                    classifier = new_classifier
         return classifier
     except Exception as e:
         # Catch any other unexpected errors related to classifier initialization
@@ -24,19 +41,77 @@ def get_or_train_classifier():
         return None
 
 
-# Receives the user's message and returns the response generated by the classifier.
-def process_message(user_input):    
+# Returns the classifier of a tenant, or the default classifier (data/ and models/) if no tenant
+# is given. Raises TenantNotFoundError if the tenant does not exist.
+def get_classifier(tenant=None):
+    if tenant is None:
+        return get_or_train_classifier()
+    return tenant_manager.get(tenant)
+
+
+# Replaces the current classifier (model and response map) with a new one that is already
+# loaded. It is a single reference assignment, so readers never see a partially built classifier.
+def publish_classifier(new_classifier):
+    global classifier
+    classifier = new_classifier
+
+
+# Builds a new classifier, retraining it if there is a new training file, and publishes it. The
+# requests in progress are not blocked, they keep using the current classifier meanwhile.
+def reload_classifier():
     try:
-        # Gets the classifier if it is not already loaded
-        classifier = get_or_train_classifier()
-        if classifier is None:
-            raise ("No se pudo cargar el clasificador.")
-        # Classify the intention of the message
-        intent = classifier.predict(user_input)
-        # Find the answer corresponding to the intention
-        response = classifier.response_message_to_intent(intent)
+        # Only one classifier is built at a time, since building one moves and writes files
+        with _classifier_lock, metrics.timer('model_reload'):
+            new_classifier = IntentClassifier()
+        if not new_classifier.model:
+            print("No fue posible cargar el nuevo modelo, se mantiene el actual.")
+            return None
+        publish_classifier(new_classifier)
+        metrics.inc('model_reloads')
+        print(f"Nuevo modelo publicado: {new_classifier.model_filename}")
+        return new_classifier
+    except Exception as e:
+        metrics.inc('errors')
+        print(f"Error al recargar el clasificador, se mantiene el actual: {e}")
+        return None
+
+
+# Receives the user's message and returns the response generated by the classifier of the tenant,
+# or by the default classifier if no tenant is given.
+def process_message(user_input, tenant=None):
+    metrics.inc('messages')
+    try:
+        with metrics.profile(), metrics.timer('process_message'):
+            # Gets the classifier if it is not already loaded
+            with metrics.timer('classifier_lookup'):
+                classifier = get_classifier(tenant)
+            if classifier is None:
+                raise Exception("No se pudo cargar el clasificador.")
+            # Classify the intention of the message and find its answer. Repeated messages are
+            # answered from the prediction cache.
+            response = classifier.classify(user_input)['response']
         # returns the response
         return response
     except Exception as e:
+        metrics.inc('errors')
+        # Catch any unexpected errors during the message processing
+        raise Exception(f"{e}")
+
+
+# Receives a list of user messages and returns, for each one, a dictionary with the predicted
+# intent, its response and its probability. All messages are classified in a single batch.
+def process_messages(user_inputs, tenant=None):
+    user_inputs = list(user_inputs)
+    metrics.inc('messages', len(user_inputs))
+    try:
+        with metrics.profile(), metrics.timer('process_messages'):
+            # Gets the classifier if it is not already loaded
+            with metrics.timer('classifier_lookup'):
+                classifier = get_classifier(tenant)
+            if classifier is None:
+                raise Exception("No se pudo cargar el clasificador.")
+            return classifier.predict_batch(user_inputs)
+    except Exception as e:
+        metrics.inc('errors')
         # Catch any unexpected errors during the message processing
         raise Exception(f"{e}")
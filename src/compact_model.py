@@ -0,0 +1,392 @@
+'''
+Compact inference format for the TF-IDF + Naive Bayes pipeline. Instead of unpickling the whole
+sklearn Pipeline (which imports sklearn and rebuilds a Python dict with the vocabulary), the model
+is exported as plain NumPy arrays that are memory-mapped when loaded:
+
+    vocabulary.npy        sorted fixed-width string table, terms are looked up by binary search
+                          (not used by the hashing pipelines, their terms are hashed to a column)
+    buckets.npy           kept columns of a pruned hashing model, sorted
+    idf.npy               idf weight of each term (same order as the vocabulary)
+    feature_log_prob.npy  Naive Bayes log probability of each term for each intent, as float64,
+                          float32, float16 or int8 (weights_dtype in the metadata)
+    quantization_scale.npy, quantization_offset.npy
+                          per intent, the int8 weights w are the log probabilities
+                          scale * (w + 128) + offset
+    class_log_prior.npy   Naive Bayes log prior of each intent
+    classes.npy           intent labels
+    metadata.json         tokenization settings of the vectorizer and its text normalization
+
+CompactPredictor only needs NumPy and gives the same predictions as the original pipeline.
+A compacted export (src/model_compaction.py) keeps only some of the columns, the terms of the
+dropped ones are ignored like unknown terms, and stores the weights with less precision; its
+predictions can then differ slightly from the pipeline.
+'''
+
+import os
+import re
+import json
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+
+from constants import USE_COMPACT_MODEL
+from src.text_normalization import TextNormalizer, normalizer_name, normalizer_from_name
+
+
+COMPACT_FORMAT_VERSION = 4
+# Versions that can still be loaded. Version 1 has no text normalization, version 2 no hashing,
+# version 3 only float64 weights and every column.
+SUPPORTED_FORMAT_VERSIONS = (1, 2, 3, 4)
+# Precisions of the Naive Bayes weights
+WEIGHTS_DTYPES = ('float64', 'float32', 'float16', 'int8')
+# Suffix of the directory that holds the compact version of a .pkl model
+COMPACT_SUFFIX = '_compact'
+
+
+# Returns the directory of the compact version of a model file
+def compact_model_path(model_filename):
+    return f"{os.path.splitext(model_filename)[0]}{COMPACT_SUFFIX}"
+
+
+# MurmurHash3 (x86, 32 bits) of some bytes as a signed integer, the hash used by sklearn's
+# HashingVectorizer
+def murmurhash3_32(data, seed=0):
+    mask = 0xFFFFFFFF
+    c1, c2 = 0xcc9e2d51, 0x1b873593
+    h = seed
+    rounded = len(data) & ~3
+    for start in range(0, rounded, 4):
+        k = (int.from_bytes(data[start:start + 4], 'little') * c1) & mask
+        k = (((k << 15) | (k >> 17)) & mask) * c2 & mask
+        h ^= k
+        h = ((h << 13) | (h >> 19)) & mask
+        h = (h * 5 + 0xe6546b64) & mask
+    k = 0
+    tail = len(data) & 3
+    if tail == 3:
+        k ^= data[rounded + 2] << 16
+    if tail >= 2:
+        k ^= data[rounded + 1] << 8
+    if tail >= 1:
+        k ^= data[rounded]
+        k = (k * c1) & mask
+        k = (((k << 15) | (k >> 17)) & mask) * c2 & mask
+        h ^= k
+    h ^= len(data)
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & mask
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & mask
+    h ^= h >> 16
+    return h - (1 << 32) if h & 0x80000000 else h
+
+
+# Returns the column of a term in a hashing model with n_features columns, like HashingVectorizer
+@lru_cache(maxsize=100000)
+def hashed_column(term, n_features):
+    h = murmurhash3_32(term.encode('utf-8'))
+    if h == -2 ** 31:
+        # Same value as sklearn, where abs(-2**31) overflows
+        return (2 ** 31 - 1 - (n_features - 1)) % n_features
+    return abs(h) % n_features
+
+
+# Returns the settings of the TF-IDF weighting of a hashing pipeline, and its idf weights
+def hashing_weighting(pipeline):
+    vectorizer = pipeline[0]
+    if vectorizer.alternate_sign:
+        raise ValueError("No se admite alternate_sign en el modo de hashing.")
+    if len(pipeline.steps) == 2:
+        return {'sublinear_tf': False, 'norm': vectorizer.norm}, np.ones(vectorizer.n_features)
+    transformer = pipeline[1]
+    if len(pipeline.steps) != 3 or vectorizer.norm is not None:
+        raise ValueError("Solo se admite HashingVectorizer(norm=None) + TfidfTransformer.")
+    idf = transformer.idf_ if transformer.use_idf else np.ones(vectorizer.n_features)
+    return {'sublinear_tf': transformer.sublinear_tf, 'norm': transformer.norm}, idf
+
+
+# Quantizes each row of a matrix to int8 with its own scale and offset, so that
+# row ~= scale * (quantized + 128) + offset. Returns the three arrays.
+def quantize_int8(matrix):
+    offset = matrix.min(axis=1)
+    scale = (matrix.max(axis=1) - offset) / 255
+    # A constant row is stored as zeros
+    scale[scale == 0] = 1.0
+    quantized = np.rint((matrix - offset[:, None]) / scale[:, None]) - 128
+    return np.clip(quantized, -128, 127).astype(np.int8), scale, offset
+
+
+# Exports a fitted TfidfVectorizer + MultinomialNB pipeline (or HashingVectorizer +
+# TfidfTransformer + MultinomialNB) to the compact format. keep_columns (columns of the fitted
+# model) drops the other terms, weights_dtype sets the precision of the Naive Bayes weights.
+def export_compact_model(pipeline, directory, keep_columns=None, weights_dtype='float64'):
+    try:
+        if weights_dtype not in WEIGHTS_DTYPES:
+            raise ValueError(f"Precisión de los pesos desconocida: {weights_dtype}")
+        vectorizer, classifier = pipeline[0], pipeline[-1]
+        hashing = type(vectorizer).__name__ == 'HashingVectorizer'
+        if vectorizer.analyzer != 'word' or vectorizer.tokenizer is not None:
+            raise ValueError("Solo se admite el analizador 'word' con el tokenizador por defecto.")
+        preprocessor = vectorizer.preprocessor
+        if preprocessor is not None and not isinstance(preprocessor, TextNormalizer):
+            raise ValueError("Solo se admite TextNormalizer como preprocesador.")
+        if vectorizer.stop_words is not None:
+            raise ValueError("No se admiten stop words personalizadas.")
+        if hashing:
+            # The columns are the buckets, in their own order
+            weighting, idf = hashing_weighting(pipeline)
+            terms = None
+            if keep_columns is None:
+                columns = np.arange(vectorizer.n_features)
+            else:
+                columns = np.unique(np.asarray(keep_columns, dtype=np.intp))
+                idf = idf[columns]
+        else:
+            weighting = {'sublinear_tf': vectorizer.sublinear_tf, 'norm': vectorizer.norm}
+            if keep_columns is None:
+                terms = np.array(sorted(vectorizer.vocabulary_))
+            else:
+                kept = set(np.asarray(keep_columns).tolist())
+                terms = np.array(sorted(term for term, column in vectorizer.vocabulary_.items()
+                                        if column in kept))
+            # Columns of the fitted model in the alphabetical order of the terms
+            columns = np.array([vectorizer.vocabulary_[term] for term in terms.tolist()], dtype=np.intp)
+            if vectorizer.use_idf:
+                idf = vectorizer.idf_[columns]
+            else:
+                idf = np.ones(len(columns))
+        metadata = {
+            'format_version': COMPACT_FORMAT_VERSION,
+            'lowercase': vectorizer.lowercase,
+            'strip_accents': vectorizer.strip_accents,
+            'token_pattern': vectorizer.token_pattern,
+            'ngram_range': list(vectorizer.ngram_range),
+            'binary': vectorizer.binary,
+            **weighting,
+            'normalization': normalizer_name(preprocessor),
+            'hashing_n_features': vectorizer.n_features if hashing else None,
+            'hashing_pruned': hashing and keep_columns is not None,
+            'weights_dtype': weights_dtype,
+        }
+        feature_log_prob = classifier.feature_log_prob_[:, columns]
+        os.makedirs(directory, exist_ok=True)
+        if not hashing:
+            np.save(os.path.join(directory, 'vocabulary.npy'), terms)
+        elif keep_columns is not None:
+            np.save(os.path.join(directory, 'buckets.npy'), columns)
+        np.save(os.path.join(directory, 'idf.npy'), idf.astype(np.float64))
+        if weights_dtype == 'int8':
+            feature_log_prob, scale, offset = quantize_int8(feature_log_prob)
+            np.save(os.path.join(directory, 'quantization_scale.npy'), scale)
+            np.save(os.path.join(directory, 'quantization_offset.npy'), offset)
+        np.save(os.path.join(directory, 'feature_log_prob.npy'),
+                np.ascontiguousarray(feature_log_prob, dtype=weights_dtype))
+        np.save(os.path.join(directory, 'class_log_prior.npy'), classifier.class_log_prior_)
+        np.save(os.path.join(directory, 'classes.npy'), np.asarray(classifier.classes_, dtype=str))
+        # metadata.json is written last, a directory without it is an incomplete export
+        with open(os.path.join(directory, 'metadata.json'), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, indent=4)
+        return directory
+    except Exception as e:
+        raise Exception(f"Error al exportar el modelo compacto a {directory}: {e}")
+
+
+# Checks whether a directory holds a complete compact model
+def has_compact_model(directory):
+    return os.path.isfile(os.path.join(directory, 'metadata.json'))
+
+
+# Loads a model file the same way IntentClassifier does: its compact version if it has one
+def load_model_file(model_file):
+    compact_path = compact_model_path(model_file)
+    if USE_COMPACT_MODEL and has_compact_model(compact_path):
+        return CompactPredictor(compact_path)
+    import joblib
+    return joblib.load(model_file)
+
+
+class CompactPredictor:
+
+    # Constructor. Memory-maps the arrays of the exported model.
+    def __init__(self, directory):
+        try:
+            self.directory = directory
+            with open(os.path.join(directory, 'metadata.json'), encoding='utf-8') as f:
+                self.metadata = json.load(f)
+            if self.metadata.get('format_version') not in SUPPORTED_FORMAT_VERSIONS:
+                raise ValueError(f"Versión de formato no soportada: {self.metadata.get('format_version')}")
+            load = lambda name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+            # Number of columns of a hashing model, None if it has a vocabulary
+            self._n_features = self.metadata.get('hashing_n_features')
+            self.vocabulary = load('vocabulary') if self._n_features is None else None
+            # Kept columns of a pruned hashing model, None if it has all of them
+            self.buckets = load('buckets') if self.metadata.get('hashing_pruned') else None
+            self.idf = load('idf')
+            self.feature_log_prob = load('feature_log_prob')
+            self.class_log_prior = load('class_log_prior')
+            # Scale and offset of each intent of int8 weights, None for the float weights
+            self.weights_dtype = self.metadata.get('weights_dtype', 'float64')
+            if self.weights_dtype == 'int8':
+                self.quantization_scale = np.asarray(load('quantization_scale'))
+                self.quantization_offset = np.asarray(load('quantization_offset'))
+            else:
+                self.quantization_scale = self.quantization_offset = None
+            self.classes_ = np.asarray(load('classes'))
+            self._token_pattern = re.compile(self.metadata['token_pattern'])
+            self._min_n, self._max_n = self.metadata['ngram_range']
+            self._normalizer = normalizer_from_name(self.metadata.get('normalization'))
+        except Exception as e:
+            raise Exception(f"Error al cargar el modelo compacto desde {directory}: {e}")
+
+
+    # Prepares a message the same way the TfidfVectorizer did before splitting it into terms. Like
+    # in the vectorizer, the text normalization replaces the lowercase and accent settings.
+    def preprocess(self, message):
+        if self._normalizer is not None:
+            message = self._normalizer(message)
+        elif self.metadata['lowercase']:
+            message = message.lower()
+        if self.metadata['strip_accents'] == 'ascii':
+            message = (unicodedata.normalize('NFKD', message)
+                        .encode('ascii', 'ignore').decode('ascii'))
+        elif self.metadata['strip_accents'] == 'unicode':
+            message = ''.join(c for c in unicodedata.normalize('NFKD', message)
+                                if not unicodedata.combining(c))
+        return message
+
+
+    # Splits a message into terms the same way the TfidfVectorizer did
+    def analyze(self, message):
+        tokens = self._token_pattern.findall(self.preprocess(message))
+        if self._max_n == 1:
+            return tokens
+        terms = list(tokens) if self._min_n == 1 else []
+        for n in range(max(2, self._min_n), self._max_n + 1):
+            terms.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return terms
+
+
+    # Returns the columns of the known terms of a list of terms, and which terms are known
+    def term_columns(self, terms):
+        if not terms:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=bool)
+        if self._n_features is not None:
+            # Every term has a column, the one of its hash
+            hashed = np.array([hashed_column(term, self._n_features) for term in terms],
+                                dtype=np.intp)
+            if self.buckets is None:
+                return hashed, np.ones(len(terms), dtype=bool)
+            # Only the kept buckets have a column, the rest are ignored like unknown terms
+            positions = np.minimum(np.searchsorted(self.buckets, hashed), len(self.buckets) - 1)
+            known = self.buckets[positions] == hashed
+        else:
+            positions = np.searchsorted(self.vocabulary, terms)
+            positions = np.minimum(positions, len(self.vocabulary) - 1)
+            known = self.vocabulary[positions] == np.asarray(terms)
+        return positions[known], known
+
+
+    # Returns the columns and the normalized TF-IDF weights of the terms of a message that are
+    # in the vocabulary
+    def vectorize(self, message):
+        positions, _ = self.term_columns(self.analyze(message))
+        columns, counts = np.unique(positions, return_counts=True)
+        weights = counts.astype(np.float64)
+        if self.metadata['binary']:
+            weights[:] = 1.0
+        elif self.metadata['sublinear_tf']:
+            weights = 1.0 + np.log(weights)
+        weights *= self.idf[columns]
+        norm = self.metadata['norm']
+        if norm == 'l2' and weights.size:
+            weights /= np.sqrt(np.dot(weights, weights))
+        elif norm == 'l1' and weights.size:
+            weights /= np.abs(weights).sum()
+        return columns, weights
+
+
+    # Vectorizes a list of messages, returns one (columns, weights) pair per message. Only the
+    # tokenization goes message by message, the terms of all the messages are looked up, counted
+    # and weighted at once. A single message (the chatbot) takes the shorter path of vectorize.
+    def transform(self, messages):
+        if len(messages) == 1:
+            return [self.vectorize(messages[0])]
+        terms = [self.analyze(message) for message in messages]
+        rows = np.repeat(np.arange(len(terms)), [len(message_terms) for message_terms in terms])
+        flat_terms = [term for message_terms in terms for term in message_terms]
+        positions, known = self.term_columns(flat_terms)
+        # One key per (message, column) pair, counting the keys counts the terms of each message
+        width = self.feature_log_prob.shape[1]
+        keys, counts = np.unique(rows[known] * width + positions, return_counts=True)
+        rows, columns = np.divmod(keys, width)
+        weights = counts.astype(np.float64)
+        if self.metadata['binary']:
+            weights[:] = 1.0
+        elif self.metadata['sublinear_tf']:
+            weights = 1.0 + np.log(weights)
+        weights *= self.idf[columns]
+        norm = self.metadata['norm']
+        if norm in ('l1', 'l2') and weights.size:
+            if norm == 'l2':
+                totals = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=len(terms)))
+            else:
+                totals = np.bincount(rows, weights=np.abs(weights), minlength=len(terms))
+            weights /= totals[rows]
+        bounds = np.searchsorted(rows, np.arange(1, len(terms)))
+        return list(zip(np.split(columns, bounds), np.split(weights, bounds)))
+
+
+    # Returns the Naive Bayes joint log likelihood of each intent for each vectorized message.
+    # The columns of all the messages are scored at once and summed message by message. The
+    # weights are used in their stored precision, int8 weights are dequantized only in the
+    # columns of the messages: scale * ((w + 128) @ x) + offset * sum(x).
+    def joint_log_likelihood_transformed(self, vectors):
+        if len(vectors) == 1:
+            columns, weights = vectors[0]
+            log_prob = self.feature_log_prob[:, columns]
+            if self.quantization_scale is None:
+                return (log_prob @ weights + self.class_log_prior)[None, :]
+            return (self.quantization_scale * ((log_prob + 128.0) @ weights)
+                    + self.quantization_offset * weights.sum() + self.class_log_prior)[None, :]
+        scores = np.tile(np.asarray(self.class_log_prior, dtype=np.float64), (len(vectors), 1))
+        lengths = np.array([len(columns) for columns, _ in vectors], dtype=np.intp)
+        if not lengths.sum():
+            return scores
+        columns = np.concatenate([columns for columns, _ in vectors])
+        weights = np.concatenate([weights for _, weights in vectors])
+        nonempty = lengths > 0
+        starts = (np.cumsum(lengths) - lengths)[nonempty]
+        log_prob = self.feature_log_prob[:, columns]
+        if self.quantization_scale is None:
+            scores[nonempty] += np.add.reduceat(log_prob * weights, starts, axis=1).T
+        else:
+            shifted = np.add.reduceat((log_prob + 128.0) * weights, starts, axis=1).T
+            totals = np.add.reduceat(weights, starts)[:, None]
+            scores[nonempty] += (self.quantization_scale * shifted
+                                    + totals * self.quantization_offset)
+        return scores
+
+
+    # Predicts the intent of each vectorized message
+    def predict_transformed(self, vectors):
+        return self.classes_[self.joint_log_likelihood_transformed(vectors).argmax(axis=1)]
+
+
+    # Returns the probability of each intent for each vectorized message
+    def predict_proba_transformed(self, vectors):
+        scores = self.joint_log_likelihood_transformed(vectors)
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        scores /= scores.sum(axis=1, keepdims=True)
+        return scores
+
+
+    # Predicts the intent of each message
+    def predict(self, messages):
+        return self.predict_transformed(self.transform(messages))
+
+
+    # Returns the probability of each intent for each message
+    def predict_proba(self, messages):
+        return self.predict_proba_transformed(self.transform(messages))
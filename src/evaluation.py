@@ -0,0 +1,337 @@
+'''
+Offline evaluation of every model version stored in models/ (the versions of the registry, or the
+model files if there is no registry yet), so versions can be compared with the same data:
+
+    stored    (default) every stored model is loaded as it is served, its compact copy if it has
+              one, and predicts the same labeled test examples with the unknown intent fallback.
+              The test examples come from --test, from data/intents_test.json if it exists, or
+              are a stratified sample of EVALUATION_TEST_SIZE of intents.json (the models trained
+              on those examples then score higher than on new messages).
+    retrain   (--retrain) stratified k-fold cross-validation of intents.json. The configuration of
+              each stored model (vectorizer settings, text normalization, classifier and its
+              parameters) is trained again on every fold. It compares the configurations, not the
+              stored models: versions with the same configuration get the same scores.
+
+The work is spread across a process pool. In the stored mode every version is a task. In the
+retrain mode every fold is first vectorized once for each distinct vectorizer (most versions
+share the same one) and cached on disk; then every (version, fold) pair fits its classifier on
+the cached matrices and predicts the test part. For each version it reports the accuracy, the
+precision and recall of every intent, the confusion matrix and the predictions per second
+(classifying the test messages in batch).
+
+Usage: python -m src.evaluation [--test FILE] [--test-size 0.2] [--seed 0] [--workers N]
+                                [--retrain] [--folds 5] [--versions V1,V2] [--details]
+                                [--output FILE]
+'''
+
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from constants import DATA_PATH, MODELS_PATH, INTENTS_JSON, INTENTS_TEST_JSON, MODEL_REGISTRY_JSON
+from constants import EVALUATION_TEST_SIZE, UNKNOWN_INTENT, UNKNOWN_INTENT_THRESHOLD
+from src.utils import load_data, get_training_examples, stratified_split
+from src.compact_model import load_model_file
+from src.model_registry import ModelRegistry
+
+
+# Texts and intents of the corpus, set in every worker process by init_worker
+_corpus = {}
+
+
+# Sets the corpus in a worker process, so it is sent once per process and not with every task
+def init_worker(X, y):
+    _corpus['X'] = X
+    _corpus['y'] = np.asarray(y, dtype=str)
+
+
+# Returns the stored model versions as registry entries, oldest first. The registry is only read:
+# without one, the model files of the directory are listed.
+def model_versions(models_path=MODELS_PATH):
+    registry = ModelRegistry(models_path)
+    if os.path.isfile(os.path.join(models_path, MODEL_REGISTRY_JSON)):
+        manifest = registry.load()
+    else:
+        manifest = registry.bootstrap()
+    return [entry for entry in manifest['versions']
+            if os.path.isfile(os.path.join(models_path, entry['filename']))]
+
+
+# Splits a trained model into its vectorizer and its classifier. The retrieval engine vectorizes
+# inside the classifier, its vectorizer is None.
+def split_model(model):
+    if hasattr(model, 'steps'):
+        return model[:-1], model[-1]
+    return None, model
+
+
+# Returns the key of an unfitted vectorizer in the cache of vectorized folds, the same for the
+# same settings
+def vectorizer_key(vectorizer):
+    import joblib
+    return joblib.hash(vectorizer)
+
+
+# Returns the folds as lists of (train positions, test positions)
+def stratified_folds(y, n_folds, seed):
+    from sklearn.model_selection import StratifiedKFold
+    splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed)
+    return [(train.tolist(), test.tolist()) for train, test in splitter.split(np.zeros(len(y)), y)]
+
+
+# Cache file of a vectorized fold
+def fold_cache_path(cache_path, key, fold):
+    return os.path.join(cache_path, f"{key}_{fold}.joblib")
+
+
+# Worker task: fits a vectorizer on the train part of a fold, vectorizes both parts and caches
+# them. Returns the time spent vectorizing the test part.
+def vectorize_fold(cache_path, key, fold, vectorizer, train, test):
+    import joblib
+    from sklearn.base import clone
+    X = _corpus['X']
+    vectorizer = clone(vectorizer).fit([X[i] for i in train])
+    X_train = vectorizer.transform([X[i] for i in train])
+    start = time.perf_counter()
+    X_test = vectorizer.transform([X[i] for i in test])
+    seconds = time.perf_counter() - start
+    joblib.dump((X_train, X_test), fold_cache_path(cache_path, key, fold))
+    return seconds
+
+
+# Worker task: fits the classifier of a version on a fold and predicts its test part. Returns the
+# predicted intents and the prediction time.
+def evaluate_fold(cache_path, key, fold, classifier, train, test):
+    import joblib
+    from sklearn.base import clone
+    X, y = _corpus['X'], _corpus['y']
+    if key is None:
+        # The retrieval engine works on the texts
+        X_train, X_test = [X[i] for i in train], [X[i] for i in test]
+    else:
+        X_train, X_test = joblib.load(fold_cache_path(cache_path, key, fold))
+    classifier = clone(classifier).fit(X_train, y[train])
+    start = time.perf_counter()
+    predicted = classifier.predict(X_test)
+    return np.asarray(predicted, dtype=str).tolist(), time.perf_counter() - start
+
+
+# Worker task: loads a stored model the way it is served and predicts every test example in
+# batch, answering with the unknown intent below the confidence threshold like the classifier.
+# Returns the predicted intents and the prediction time.
+def evaluate_model(model_file):
+    X = _corpus['X']
+    model = load_model_file(model_file)
+    start = time.perf_counter()
+    probabilities = model.predict_proba(X)
+    best = probabilities.argmax(axis=1)
+    predicted = np.asarray(model.classes_, dtype=str)[best].tolist()
+    threshold = getattr(model, 'unknown_threshold', UNKNOWN_INTENT_THRESHOLD)
+    if threshold is not None:
+        scores = probabilities[np.arange(len(X)), best]
+        predicted = [UNKNOWN_INTENT if score < threshold else intent
+                        for intent, score in zip(predicted, scores.tolist())]
+    return predicted, time.perf_counter() - start
+
+
+# Computes the metrics of a version from the expected and predicted intents of all its folds
+def score(expected, predicted, seconds):
+    from sklearn.metrics import precision_recall_fscore_support, confusion_matrix
+    labels = sorted(set(expected) | set(predicted))
+    precision, recall, _, support = precision_recall_fscore_support(
+        expected, predicted, labels=labels, zero_division=0)
+    return {
+        'accuracy': float(np.mean(np.asarray(expected) == np.asarray(predicted))),
+        'macro_precision': float(np.mean(precision)),
+        'macro_recall': float(np.mean(recall)),
+        'predictions_per_second': len(expected) / seconds if seconds else None,
+        'per_intent': {label: {'precision': float(p), 'recall': float(r), 'support': int(s)}
+                        for label, p, r, s in zip(labels, precision, recall, support)},
+        'labels': labels,
+        'confusion_matrix': confusion_matrix(expected, predicted, labels=labels).tolist(),
+    }
+
+
+# Returns the examples the stored models are evaluated on: those of test_data, or a stratified
+# sample of test_size of the examples of data
+def test_examples(data, test_data=None, test_size=EVALUATION_TEST_SIZE, seed=0):
+    if test_data is not None:
+        return get_training_examples(test_data)
+    X, y = get_training_examples(data)
+    _, test = stratified_split(y, test_size, seed)
+    return [X[i] for i in test], [y[i] for i in test]
+
+
+# Evaluates the stored model versions. By default the stored models predict the test examples as
+# they are served; with retrain=True their configurations are cross-validated on the intents of
+# data instead.
+def evaluate_versions(data, models_path=MODELS_PATH, n_folds=5, seed=0, workers=None,
+                        test_data=None, versions=None, retrain=False,
+                        test_size=EVALUATION_TEST_SIZE):
+    try:
+        entries = model_versions(models_path)
+        if versions:
+            entries = [entry for entry in entries if entry['version'] in versions]
+        if not entries:
+            raise ValueError(f"No hay modelos para evaluar en {models_path}.")
+        if retrain:
+            if test_data is not None:
+                raise ValueError("La validación cruzada usa el corpus, no un archivo de prueba.")
+            return cross_validate_versions(entries, data, models_path, n_folds, seed, workers)
+        X, y = test_examples(data, test_data, test_size, seed)
+        if not X:
+            raise ValueError("No hay ejemplos de prueba para evaluar los modelos.")
+        results = {}
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                    initargs=(X, y)) as executor:
+            futures = {entry['version']: executor.submit(evaluate_model,
+                                                            os.path.join(models_path, entry['filename']))
+                        for entry in entries}
+            for entry in entries:
+                try:
+                    predicted, seconds = futures[entry['version']].result()
+                except Exception as e:
+                    print(f"No se pudo evaluar la versión {entry['version']}, se omite: {e}")
+                    continue
+                results[entry['version']] = dict(score(y, predicted, seconds),
+                                                    filename=entry['filename'])
+        return results
+    except ValueError:
+        raise
+    except Exception as e:
+        raise Exception(f"Error al evaluar los modelos: {e}")
+
+
+# Cross-validates the configurations of the stored versions: each one is trained again on every
+# fold of the intents of data
+def cross_validate_versions(entries, data, models_path, n_folds, seed, workers):
+    import joblib
+    from sklearn.base import clone
+    X, y = get_training_examples(data)
+    folds = stratified_folds(y, n_folds, seed)
+
+    # Vectorizer and classifier of every version, and the distinct vectorizers to cache. Only the
+    # configuration is needed, every fold is fitted again.
+    plans = []
+    vectorizers = {}
+    for entry in entries:
+        try:
+            model = joblib.load(os.path.join(models_path, entry['filename']))
+        except Exception as e:
+            print(f"No se pudo cargar la versión {entry['version']}, se omite: {e}")
+            continue
+        vectorizer, classifier = split_model(model)
+        vectorizer = clone(vectorizer) if vectorizer is not None else None
+        key = vectorizer_key(vectorizer) if vectorizer is not None else None
+        if key is not None:
+            vectorizers.setdefault(key, vectorizer)
+        plans.append((entry, key, clone(classifier)))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_path, \
+            ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                initargs=(X, y)) as executor:
+        # Stage 1: every fold is vectorized once per distinct vectorizer
+        transform_seconds = {}
+        futures = {(key, fold): executor.submit(vectorize_fold, cache_path, key, fold,
+                                                vectorizer, train, test)
+                    for key, vectorizer in vectorizers.items()
+                    for fold, (train, test) in enumerate(folds)}
+        for (key, fold), future in futures.items():
+            transform_seconds[key] = transform_seconds.get(key, 0) + future.result()
+        # Stage 2: every version is fitted and evaluated on every fold from the cache
+        futures = {entry['version']: [executor.submit(evaluate_fold, cache_path, key, fold,
+                                                        classifier, train, test)
+                                        for fold, (train, test) in enumerate(folds)]
+                    for entry, key, classifier in plans}
+        for entry, key, _ in plans:
+            expected, predicted, seconds = [], [], transform_seconds.get(key, 0)
+            for (_, test), future in zip(folds, futures[entry['version']]):
+                fold_predicted, fold_seconds = future.result()
+                expected.extend(y[i] for i in test)
+                predicted.extend(fold_predicted)
+                seconds += fold_seconds
+            results[entry['version']] = dict(score(expected, predicted, seconds),
+                                                filename=entry['filename'])
+    return results
+
+
+# Prints the precision and recall of every intent and the confusion matrix of a version
+def print_details(version, result):
+    print(f"\nVersión {version}")
+    print(f"{'intención':<30} {'precisión':>10} {'exhaustividad':>14} {'ejemplos':>9}")
+    for label, values in result['per_intent'].items():
+        print(f"{label[:30]:<30} {values['precision']:>10.3f} {values['recall']:>14.3f} "
+                f"{values['support']:>9}")
+    print("Matriz de confusión (filas: intención real, columnas: intención predicha):")
+    for position, (label, row) in enumerate(zip(result['labels'], result['confusion_matrix'])):
+        print(f"{position:>3} {label[:20]:<20} {' '.join(f'{count:>3}' for count in row)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluación de las versiones de los modelos.")
+    parser.add_argument('--data', default=os.path.join(DATA_PATH, INTENTS_JSON),
+                        help="Corpus de intenciones (muestra de prueba o validación cruzada).")
+    parser.add_argument('--models', default=MODELS_PATH, help="Carpeta de los modelos.")
+    parser.add_argument('--test', help="Archivo de prueba con el formato de intents.json (por "
+                                        f"defecto, {INTENTS_TEST_JSON} si existe).")
+    parser.add_argument('--test-size', type=float, default=EVALUATION_TEST_SIZE,
+                        help="Sin archivo de prueba, fracción del corpus que se usa para probar.")
+    parser.add_argument('--retrain', action='store_true',
+                        help="Vuelve a entrenar la configuración de cada versión en una "
+                                "validación cruzada en lugar de evaluar los modelos guardados.")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, help="Procesos (por defecto, uno por núcleo).")
+    parser.add_argument('--versions', help="Versiones a evaluar, separadas por comas.")
+    parser.add_argument('--details', action='store_true',
+                        help="Muestra la precisión por intención y la matriz de confusión.")
+    parser.add_argument('--output', help="Guarda los resultados completos en un archivo JSON.")
+    args = parser.parse_args(argv)
+
+    test_path = args.test
+    default_test_path = os.path.join(os.path.dirname(os.path.abspath(args.data)), INTENTS_TEST_JSON)
+    if test_path is None and not args.retrain and os.path.isfile(default_test_path):
+        test_path = default_test_path
+    try:
+        test_data = load_data(test_path) if test_path else None
+        if test_path and test_data is None:
+            raise ValueError(f"No se pudo leer el archivo {test_path}.")
+        results = evaluate_versions(load_data(args.data), args.models, args.folds, args.seed,
+                                    args.workers, test_data,
+                                    args.versions.split(',') if args.versions else None,
+                                    args.retrain, args.test_size)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if args.retrain:
+        mode = f"configuraciones reentrenadas, validación cruzada de {args.folds} particiones"
+    elif test_path:
+        mode = f"modelos guardados, prueba con {test_path}"
+    else:
+        mode = f"modelos guardados, prueba con el {args.test_size:.0%} de {args.data}"
+        print("Advertencia: los ejemplos de prueba están en intents.json, los modelos entrenados "
+                "con ellos obtienen resultados mejores que con mensajes nuevos.")
+    print(f"Evaluación de {len(results)} versiones ({mode})")
+    print(f"{'versión':<21} {'exactitud':>10} {'precisión':>10} {'exhaustividad':>14} "
+            f"{'predicciones/s':>15}")
+    for version, result in results.items():
+        print(f"{version:<21} {result['accuracy']:>10.3f} {result['macro_precision']:>10.3f} "
+                f"{result['macro_recall']:>14.3f} {result['predictions_per_second'] or 0:>15.0f}")
+    if args.details:
+        for version, result in results.items():
+            print_details(version, result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+        print(f"Resultados guardados en {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+'''
+Feature hashing mode (FEATURE_MODE = 'hashing'). Instead of a vocabulary (a dict with every
+distinct term of the training data, pickled into every model), each term is mapped to one of a
+fixed number of buckets by its hash, and the buckets are weighted with TF-IDF as before:
+
+    HashingVectorizer (HASHING_N_FEATURES buckets, HASHING_NGRAM_RANGE) -> TfidfTransformer
+    -> MultinomialNB
+
+The memory and the size of the model depend on the number of buckets and intents, not on the
+number of distinct terms. Terms that fall in the same bucket share their weight, so with too few
+buckets the accuracy drops (python -m benchmarks.bench_hashing measures it).
+
+Hashing needs no state, so the examples can be vectorized in chunks in parallel processes; only
+the document frequencies of the buckets (TF-IDF) and the counts of Naive Bayes are computed over
+the whole corpus.
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+
+from constants import HASHING_N_FEATURES, HASHING_NGRAM_RANGE, HASHING_TRAINING_WORKERS
+from constants import STREAMING_CHUNK_SIZE
+from src.text_normalization import default_normalizer
+
+
+# Creates an untrained hashing pipeline
+def hashing_pipeline(n_features=HASHING_N_FEATURES, ngram_range=HASHING_NGRAM_RANGE):
+    from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import make_pipeline
+    # Naive Bayes needs non-negative counts (alternate_sign=False), and the TF-IDF weights are
+    # normalized by the transformer, not by the vectorizer (norm=None)
+    vectorizer = HashingVectorizer(n_features=n_features, ngram_range=tuple(ngram_range),
+                                    alternate_sign=False, norm=None,
+                                    preprocessor=default_normalizer())
+    return make_pipeline(vectorizer, TfidfTransformer(), MultinomialNB())
+
+
+# Checks whether a model is a hashing pipeline
+def is_hashing_pipeline(model):
+    return hasattr(model, 'steps') and type(model[0]).__name__ == 'HashingVectorizer'
+
+
+# Hashes a list of texts, in chunks spread over worker processes when there are more texts than
+# one chunk. Returns the sparse matrix of the term counts of every bucket.
+def hash_texts(vectorizer, texts, workers=HASHING_TRAINING_WORKERS, chunk_size=STREAMING_CHUNK_SIZE):
+    import scipy.sparse as sp
+    if len(texts) <= chunk_size or workers == 1:
+        return vectorizer.transform(texts)
+    chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return sp.vstack(list(executor.map(vectorizer.transform, chunks)), format='csr')
+
+
+# Trains a hashing pipeline: the texts are hashed in parallel, then the TF-IDF weights and Naive
+# Bayes are fitted on the hashed counts
+def fit_hashing_pipeline(pipeline, X_train, y_train, workers=HASHING_TRAINING_WORKERS):
+    counts = hash_texts(pipeline[0], list(X_train), workers)
+    # The slice shares its steps with the pipeline, fitting it fits them
+    pipeline[1:].fit(counts, y_train)
+    return pipeline
@@ -0,0 +1,218 @@
+'''
+Incremental training of the Naive Bayes model. Multinomial Naive Bayes only needs, for each intent,
+the number of examples and the sum of the feature vectors of its examples. Those sums are additive,
+so when new examples arrive they are vectorized and added to the stored sums instead of refitting
+the whole corpus.
+
+For the sums to stay valid, the vector of an example must not depend on the rest of the corpus:
+the vocabulary is append-only (new terms get new columns, old columns never move) and the examples
+are represented by their l2-normalized term frequencies. IDF weighting is not used in this mode
+because the idf of every term changes with each new example, so an incremental model does not
+predict exactly like a 'full' one trained on the same examples.
+
+The sums are kept as sparse (intent, term, value) entries, so their memory grows with the number of
+distinct (intent, term) pairs seen, not with the number of examples nor with intents x terms. The
+entries of each chunk are appended as they are and merged with the rest (adding up repeated pairs)
+once they outnumber them, so every entry is merged a logarithmic number of times instead of once
+per chunk. Only to_pipeline builds the dense intents x terms matrix that Naive Bayes needs.
+'''
+
+import os
+from collections import Counter
+
+import numpy as np
+
+from constants import INCREMENTAL_STATE_PATH
+from src.utils import get_training_examples
+from src.text_normalization import default_normalizer, normalizer_name
+
+
+class IncrementalTrainer:
+
+    # Constructor. Starts with empty statistics.
+    def __init__(self, state_path=INCREMENTAL_STATE_PATH, alpha=1.0):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        self.state_path = state_path
+        self.alpha = alpha
+        # Term -> column, new terms are always appended at the end
+        self.vocabulary = {}
+        self.classes = []
+        # Number of examples of each intent, shape (n_intents,)
+        self.class_count = np.zeros(0)
+        # Sum of the feature vectors of the examples of each intent, as (rows, columns, values) of
+        # its nonzero entries: the merged ones, without repeated pairs, and the ones added since
+        # then (see feature_count and _add)
+        self._entries = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))
+        self._pending = []
+        self._pending_size = 0
+        # Hash of the intents file the statistics correspond to
+        self.data_hash = None
+        # Text normalization of the vocabulary, the same one as the full training
+        self.normalizer = default_normalizer()
+        self._analyzer = TfidfVectorizer(preprocessor=self.normalizer).build_analyzer()
+
+
+    # Sums of the feature vectors of every intent as a dense array of shape (n_intents, n_terms)
+    @property
+    def feature_count(self):
+        rows, columns, values = self._merge()
+        feature_count = np.zeros((len(self.classes), len(self.vocabulary)))
+        feature_count[rows, columns] = values
+        return feature_count
+
+
+    @feature_count.setter
+    def feature_count(self, value):
+        value = np.asarray(value, dtype=np.float64)
+        rows, columns = np.nonzero(value)
+        self._entries = (rows, columns, value[rows, columns])
+        self._pending = []
+        self._pending_size = 0
+
+
+    # Adds entries to the sums. They are merged with the previous ones once there are more new
+    # entries than merged ones, which bounds both the memory and the total cost of merging.
+    def _add(self, rows, columns, values):
+        self._pending.append((rows, columns, values))
+        self._pending_size += len(values)
+        if self._pending_size > len(self._entries[2]):
+            self._merge()
+
+
+    # Merges the pending entries with the previous ones, adding up the repeated (intent, term)
+    # pairs. Returns the merged entries.
+    def _merge(self):
+        if self._pending:
+            from scipy import sparse
+            parts = zip(self._entries, *self._pending)
+            rows, columns, values = (np.concatenate(part) for part in parts)
+            sums = sparse.coo_matrix((values, (rows, columns)),
+                                        shape=(len(self.classes), len(self.vocabulary)))
+            sums.sum_duplicates()
+            self._entries = (sums.row, sums.col, sums.data)
+            self._pending = []
+            self._pending_size = 0
+        return self._entries
+
+
+    # Loads the statistics saved on disk. Returns False if there are none.
+    def load(self):
+        if not os.path.isfile(self.state_path):
+            return False
+        try:
+            with np.load(self.state_path, allow_pickle=False) as state:
+                # Statistics of a vocabulary built with another normalization are not reused
+                normalization = str(state['normalization']) if 'normalization' in state else 'none'
+                if normalization != normalizer_name(self.normalizer):
+                    print("Las estadísticas incrementales usan otra normalización del texto.")
+                    return False
+                terms = state['vocabulary'].tolist()
+                self.vocabulary = {term: column for column, term in enumerate(terms)}
+                self.classes = state['classes'].tolist()
+                self.class_count = state['class_count']
+                if 'feature_values' in state:
+                    self._entries = (state['feature_rows'], state['feature_columns'],
+                                        state['feature_values'])
+                else:
+                    # Statistics saved before the sums were sparse
+                    self.feature_count = state['feature_count']
+                self.alpha = float(state['alpha'])
+                self.data_hash = str(state['data_hash']) or None
+            return True
+        except Exception as e:
+            print(f"No se pudieron cargar las estadísticas incrementales: {e}")
+            return False
+
+
+    # Saves the statistics to disk
+    def save(self):
+        try:
+            terms = sorted(self.vocabulary, key=self.vocabulary.get)
+            rows, columns, values = self._merge()
+            temporary = f"{self.state_path}.tmp.npz"
+            np.savez_compressed(temporary,
+                                vocabulary=np.array(terms, dtype=str),
+                                classes=np.array(self.classes, dtype=str),
+                                class_count=self.class_count,
+                                feature_rows=rows,
+                                feature_columns=columns,
+                                feature_values=values,
+                                alpha=self.alpha,
+                                data_hash=self.data_hash or '',
+                                normalization=normalizer_name(self.normalizer))
+            os.replace(temporary, self.state_path)
+        except Exception as e:
+            raise Exception(f"Error al guardar las estadísticas incrementales: {e}")
+
+
+    # Returns a vectorizer that maps texts to l2-normalized term frequencies over the current
+    # vocabulary. It has no state of its own beyond the vocabulary.
+    def vectorizer(self):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        vectorizer = TfidfVectorizer(vocabulary=dict(self.vocabulary), use_idf=False, norm='l2',
+                                        preprocessor=self.normalizer)
+        # With a fixed vocabulary and no idf, fitting only validates the vocabulary
+        return vectorizer.fit([''])
+
+
+    # Adds new examples to the statistics. The cost depends on the number of new examples, not on
+    # the size of the corpus already learned.
+    def update(self, X_new, y_new):
+        if not X_new:
+            return
+        from scipy import sparse
+        from sklearn.preprocessing import normalize
+        # Term frequencies of the new examples, appending their new terms to the vocabulary. It is
+        # the same vector as vectorizer().transform, without copying the vocabulary.
+        indptr, indices, counts = [0], [], []
+        for example in X_new:
+            for term, count in Counter(self._analyzer(example)).items():
+                column = self.vocabulary.get(term)
+                if column is None:
+                    column = self.vocabulary[term] = len(self.vocabulary)
+                indices.append(column)
+                counts.append(count)
+            indptr.append(len(indices))
+        class_index = {intent: row for row, intent in enumerate(self.classes)}
+        for intent in y_new:
+            if intent not in class_index:
+                class_index[intent] = len(self.classes)
+                self.classes.append(intent)
+        n_classes, n_terms = len(self.classes), len(self.vocabulary)
+        if len(self.class_count) < n_classes:
+            self.class_count = np.concatenate([self.class_count,
+                                                np.zeros(n_classes - len(self.class_count))])
+        X = normalize(sparse.csr_matrix((np.array(counts, dtype=np.float64), indices, indptr),
+                                        shape=(len(X_new), n_terms)))
+        # Sum the vectors of the new examples per intent with a single sparse product, and add
+        # only its nonzero values to the sums
+        rows = np.array([class_index[intent] for intent in y_new])
+        Y = sparse.csr_matrix((np.ones(len(rows)), (rows, np.arange(len(rows)))),
+                                shape=(n_classes, len(rows)))
+        sums = (Y @ X).tocoo()
+        self._add(sums.row.astype(np.int64), sums.col.astype(np.int64), sums.data)
+        self.class_count += np.bincount(rows, minlength=n_classes)
+
+
+    # Builds a vectorizer + Naive Bayes pipeline from the statistics. It predicts exactly like a
+    # MultinomialNB fitted on every example seen so far.
+    def to_pipeline(self):
+        from sklearn.naive_bayes import MultinomialNB
+        from sklearn.pipeline import make_pipeline
+        classifier = MultinomialNB(alpha=self.alpha)
+        feature_count = self.feature_count
+        smoothed = feature_count + self.alpha
+        classifier.classes_ = np.array(self.classes)
+        classifier.class_count_ = self.class_count.copy()
+        classifier.feature_count_ = feature_count
+        classifier.feature_log_prob_ = np.log(smoothed) - np.log(smoothed.sum(axis=1, keepdims=True))
+        classifier.class_log_prior_ = np.log(self.class_count) - np.log(self.class_count.sum())
+        classifier.n_features_in_ = feature_count.shape[1]
+        return make_pipeline(self.vectorizer(), classifier)
+
+
+    # Rebuilds the statistics from a whole intents dictionary
+    def fit(self, data):
+        self.__init__(self.state_path, self.alpha)
+        self.update(*get_training_examples(data))
+        return self
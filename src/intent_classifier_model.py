@@ -4,31 +4,62 @@ TF-IDF text representation model to analyze text and predict an associated inten
 '''
 
 import os
-import joblib
+import sys
+import copy
 from datetime import datetime, timedelta
 
-from sklearn.naive_bayes import MultinomialNB
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.pipeline import make_pipeline
+import numpy as np
 
-from constants import MODELS_PATH, INTENTS_JSON_PATH, DATA_PATH, OLD_TRAIN_FILES_PATH
-from constants import OLD_INTENTS_FILES_PATH, INTENTS_JSON, INTENTS_TRAIN_JSON
-from src.utils import load_data, save_json, add_intents, validate_json_structure, move_and_rename_file
+from constants import DATA_PATH, MODELS_PATH, OLD_TRAIN_FILES_PATH, OLD_INTENTS_FILES_PATH
+from constants import SNAPSHOTS_PATH
+from constants import INTENTS_JSON, INTENTS_TRAIN_JSON, USE_COMPACT_MODEL, INCREMENTAL_STATE_PATH
+from constants import TRAINING_MODE, MERGE_NORMALIZE_EXAMPLES, STREAMING_CHUNK_SIZE
+from constants import USE_PREDICTION_CACHE, CLASSIFIER_ENGINE, UNKNOWN_INTENT_THRESHOLD
+from constants import UNKNOWN_INTENT, UNKNOWN_INTENT_RESPONSE, FEATURE_MODE
+from src.utils import load_data, save_json, merge_intents, validate_json_structure, move_and_rename_file
+from src.utils import get_training_examples
+from src.response_store import ResponseStore
+from src.snapshot_store import SnapshotStore
+from src.prediction_cache import PredictionCache, model_preprocessor
+from src.compact_model import CompactPredictor, export_compact_model, compact_model_path
+from src.compact_model import has_compact_model
+from src.model_compaction import compact_model, holdout_validation, format_report
+from src.model_registry import ModelRegistry, file_hash
+from src.incremental_trainer import IncrementalTrainer
+from src.streaming import iter_chunks
+from src.metrics import metrics
+from src.text_normalization import default_normalizer
+from src.hashing_features import hashing_pipeline, is_hashing_pipeline, fit_hashing_pipeline
+from src.tuning import load_tuned_params, build_steps
 
 
 class IntentClassifier:
     
     # Constructor. Load a stored model if available or create and train a new model, then load it.
-    def __init__(self):
+    # data_path and models_path allow several bots (for example one per customer) to keep their
+    # intents and models in their own directories.
+    def __init__(self, data_path=DATA_PATH, models_path=MODELS_PATH):
         try:
+            self.data_path = data_path
+            self.models_path = models_path
+            self.intents_path = os.path.join(data_path, INTENTS_JSON)
+            self.train_path = os.path.join(data_path, INTENTS_TRAIN_JSON)
+            # Archive folders and incremental statistics keep their names inside each directory
+            self.old_train_files_path = os.path.join(data_path,
+                                                        os.path.basename(OLD_TRAIN_FILES_PATH))
+            self.old_intents_files_path = os.path.join(data_path,
+                                                        os.path.basename(OLD_INTENTS_FILES_PATH))
+            self.snapshots_path = os.path.join(data_path, os.path.basename(SNAPSHOTS_PATH))
+            self.incremental_state_path = os.path.join(models_path,
+                                                        os.path.basename(INCREMENTAL_STATE_PATH))
             # Get the most recent model or None if no models exist
             self.model_filename = self.get_most_recent_model()
             if not self.model_filename:  # If no saved model exists
                 # If no model exists, create a new one
                 timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-                self.model_filename = f"{MODELS_PATH}/trained_model_{timestamp}.pkl"
+                self.model_filename = f"{self.models_path}/trained_model_{timestamp}.pkl"
                 self.model = self.create_new_model()
-                data = load_data(INTENTS_JSON_PATH)
+                data = load_data(self.intents_path)
                 self.train(data)
                 self.save_model()
                 print(f"No se encontró un modelo guardado. Se creo uno nuevo en {self.model_filename}.")
@@ -45,25 +76,59 @@ class IntentClassifier:
                     # The date is obtained to incorporate into the file backups
                     timestamp = (datetime.now()+ timedelta(seconds=1)).strftime("%Y-%m-%d_%H-%M-%S")
                     # Use to copy the intents and examples to the intent.json file
-                    intents_data = load_data(INTENTS_JSON_PATH)
+                    intents_data = load_data(self.intents_path)
+                    # Hash of the intents before merging, used by the incremental training
+                    base_hash = file_hash(self.intents_path)
+                    # Keep the current intents and the training file as versions of the snapshot
+                    # store before the merge modifies them
+                    archived = self.archive_datasets(intents_data, train_data, timestamp, base_hash)
+                    # The merge only appends examples and intents, these counts tell which intents
+                    # it changed
+                    example_counts = [len(intent.get('examples', []))
+                                        for intent in intents_data['intents']]
+                    # The incremental statistics are those of Naive Bayes with a vocabulary, the
+                    # retrieval engine always indexes the whole corpus. That mode only trains on the
+                    # examples that were added, which are only collected for it.
+                    incremental = (TRAINING_MODE == 'incremental'
+                                    and CLASSIFIER_ENGINE == 'naive_bayes'
+                                    and FEATURE_MODE == 'vocabulary')
+                    added = [] if incremental else None
                     # Update intents with new data
-                    updated_data = add_intents(intents_data, train_data)
-                    # Move the training file to archive
-                    move_and_rename_file(train_file,
-                                            f"{timestamp}_{INTENTS_TRAIN_JSON}",
-                                            OLD_TRAIN_FILES_PATH) 
-                    # Archive the intents file
-                    move_and_rename_file(INTENTS_JSON_PATH,
-                                            f"{timestamp}_{INTENTS_JSON}",
-                                            OLD_INTENTS_FILES_PATH)
+                    updated_data, merge_stats = merge_intents(intents_data, train_data,
+                                                                MERGE_NORMALIZE_EXAMPLES, added)
+                    print(
+                            f"Intenciones nuevas: {merge_stats['new_intents']}, "
+                            f"intenciones actualizadas: {merge_stats['updated_intents']}, "
+                            f"ejemplos agregados: {merge_stats['added_examples']}, "
+                            f"ejemplos duplicados: {merge_stats['duplicate_examples']}"
+                        )
+                    if archived:
+                        # The training file is kept in the snapshot store
+                        os.remove(train_file)
+                    else:
+                        # Move the training file to archive
+                        move_and_rename_file(train_file,
+                                                f"{timestamp}_{INTENTS_TRAIN_JSON}",
+                                                self.old_train_files_path)
+                        # Archive the intents file
+                        move_and_rename_file(self.intents_path,
+                                                f"{timestamp}_{INTENTS_JSON}",
+                                                self.old_intents_files_path)
                     # Save the updated intents file
-                    save_json(updated_data, INTENTS_JSON_PATH)
-                    print(f"Archivo intents actualizado con éxito en: {INTENTS_JSON_PATH}")
+                    save_json(updated_data, self.intents_path)
+                    print(f"Archivo intents actualizado con éxito en: {self.intents_path}")
+                    if archived:
+                        self.record_intents_version(updated_data, archived['version'], example_counts)
                     # Retrain the model with updated data
-                    self.train(updated_data)
+                    if incremental:
+                        y_new = [intent for intent, _ in added]
+                        X_new = [example for _, example in added]
+                        self.train_incremental(X_new, y_new, updated_data, base_hash)
+                    else:
+                        self.train(updated_data)
                     print(f"Se re-entrenó el modelo actual: {self.model_filename}")            
                     # se modifica el nombre del nuevo archivo del modelo que acaba de ser entrenado
-                    self.model_filename = f"{MODELS_PATH}/trained_model_{timestamp}.pkl"
+                    self.model_filename = f"{self.models_path}/trained_model_{timestamp}.pkl"
                     # Save the new retrained model
                     self.save_model()
                     # Load the new retrained model
@@ -73,71 +138,190 @@ class IntentClassifier:
                             f"La estructura del archivo train, no es válida."
                             f"\nSe mantiene el modelo actual: {self.model_filename}"
                         )
+            # Load the intent -> response map once, it is reloaded only if intents.json changes
+            self.response_store = ResponseStore(self.intents_path)
+            # Results of repeated messages, emptied when the model or intents.json change
+            self.prediction_cache = PredictionCache() if USE_PREDICTION_CACHE else None
         except Exception as e:
             raise Exception(f"Error al inicializar el clasificador: {e}")
 
 
-    # Creates a new model
+    # Creates a new model with the engine set in CLASSIFIER_ENGINE
     def create_new_model(self):        
         try:
+            if CLASSIFIER_ENGINE == 'retrieval':
+                from src.retrieval_engine import RetrievalClassifier
+                return RetrievalClassifier()
+            if CLASSIFIER_ENGINE != 'naive_bayes':
+                raise ValueError(f"Motor de clasificación desconocido: {CLASSIFIER_ENGINE}")
+            if FEATURE_MODE == 'hashing':
+                return hashing_pipeline()
+            if FEATURE_MODE != 'vocabulary':
+                raise ValueError(f"Modo de características desconocido: {FEATURE_MODE}")
+            # sklearn is imported only when a model has to be trained, loading a compact model
+            # does not need it
+            from sklearn.naive_bayes import MultinomialNB
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            from sklearn.pipeline import make_pipeline
             # Pipeline is a structured workflow that automates and organizes the modeling process so 
             # that each step doesn't need to be executed manually.
             # What the pipeline does is chain these two steps together, meaning that when you call 
             # fit() or predict() on the model, the transformation (TF-IDF) is performed first, and 
             # then the classification model (Naive Bayes) is applied to the generated numerical 
             # representation.
-            return make_pipeline(TfidfVectorizer(), MultinomialNB())
+            # The texts are normalized (lowercase, accents and punctuation removed) before TF-IDF.
+            # The settings found by the hyperparameter search (src/tuning.py) replace the defaults.
+            tuned_params = load_tuned_params(self.models_path)
+            if tuned_params is not None:
+                return make_pipeline(*build_steps(tuned_params))
+            return make_pipeline(TfidfVectorizer(preprocessor=default_normalizer()), MultinomialNB())
         except Exception as e:
             raise Exception(f"Error al crear el modelo: {e}")
 
 
-    # Gets the most recent model from the models directory
+    # Gets the active model from the model registry
     def get_most_recent_model(self):        
         try:
-            # List all .pkl files in the models directory
-            model_files = [f for f in os.listdir(MODELS_PATH) if f.endswith('.pkl')]
-            if not model_files:
+            model_file = ModelRegistry(self.models_path).active_model_path()
+            if not model_file:
                 return None  # No models saved
-            # Sort files by modification time and return the most recent
-            model_files.sort(key=lambda x: os.path.getmtime(os.path.join(MODELS_PATH, x)), reverse=True)
-            return os.path.join(MODELS_PATH, model_files[0])  # Return the most recent
-        except FileNotFoundError as e:
-            print(f"Error: No se encontró el directorio de datos. {e}")
-            return None
+            if not os.path.isfile(model_file):
+                print(f"Error: El modelo activo del registro no existe: {model_file}")
+                return None
+            return model_file
         except Exception as e:
             print(f"Error inesperado al obtener el modelo más reciente: {e}")
             return None
 
 
-    # Loads a trained model from a file
+    # Loads a trained model from a file. If the model has a compact version it is memory-mapped
+    # instead of unpickling the whole sklearn pipeline.
     def load_model(self, filename): 
         try:
+            compact_path = compact_model_path(filename)
+            if USE_COMPACT_MODEL and has_compact_model(compact_path):
+                model = CompactPredictor(compact_path)
+                print(f"Modelo compacto cargado desde {compact_path}")
+                return model
+            import joblib
             model = joblib.load(filename)
             print(f"Modelo cargado desde {filename}")
+            # Models saved before the compact format existed are exported the first time they
+            # are loaded, so the next start is fast. Only Naive Bayes pipelines have one.
+            if USE_COMPACT_MODEL and hasattr(model, 'steps'):
+                self.save_compact_model(model, compact_path)
             return model
         except Exception as e:
             raise Exception(f"Error al cargar el modelo desde {filename}: {e}")
 
 
-    # Saves the model to a file
-    def save_model(self):
+    # Saves the model to a file and registers it with the hash of the data it was trained on
+    # (data_path, intents.json by default)
+    def save_model(self, data_path=None):
         try:
+            import joblib
+            os.makedirs(self.models_path, exist_ok=True)
             joblib.dump(self.model, self.model_filename)
             #print(f"Modelo guardado en {self.model_filename}")
         except Exception as e:
             raise Exception(f"Error al guardar el modelo en {self.model_filename}: {e}")
+        if USE_COMPACT_MODEL and hasattr(self.model, 'steps'):
+            # The compact copy of a new model is compacted, checked with held-out examples
+            self.save_compact_model(self.model, compact_model_path(self.model_filename),
+                                    getattr(self, 'validation_examples', None))
+        # Record the new model in the registry, it becomes the active one
+        ModelRegistry(self.models_path).register(self.model_filename,
+                                                    data_hash=file_hash(data_path or self.intents_path),
+                                                    metrics=getattr(self, 'metrics', None))
+
+
+    # Exports the compact version of a model. The .pkl file is always kept, so a failure here
+    # only means that the next start will use the slower joblib path. With validation examples
+    # and their probe (see holdout_validation) it is compacted as set in constants.py, unless that
+    # lowers its accuracy too much.
+    def save_compact_model(self, model, directory, validation=None):
+        try:
+            if validation is None:
+                export_compact_model(model, directory)
+                return
+            X_val, y_val, probe = validation
+            report = compact_model(model, directory, X_val, y_val, probe=probe)
+            if report is not None:
+                print(format_report(report))
+                if hasattr(self, 'metrics'):
+                    self.metrics['compaction'] = {
+                        'feature_selection': report['feature_selection'],
+                        'weights_dtype': report['weights_dtype'],
+                        'accuracy_drop': report['accuracy_drop'],
+                        'bytes_before': report['before']['bytes'],
+                        'bytes_after': report['after']['bytes'],
+                        'published': report['published'],
+                    }
+        except Exception as e:
+            print(f"No se pudo exportar el modelo compacto: {e}")
+
+
+    # Estimates the memory held by the classifier in bytes: the arrays of the model, the terms of
+    # the vocabulary of a pickled pipeline and the size of intents.json. It is an approximation,
+    # good enough to compare classifiers with each other.
+    def memory_usage(self):
+        parts = [step for _, step in self.model.steps] if hasattr(self.model, 'steps') else [self.model]
+        size = 0
+        for part in parts:
+            if hasattr(part, 'memory_usage'):
+                size += part.memory_usage()
+                continue
+            size += sum(value.nbytes for value in vars(part).values() if isinstance(value, np.ndarray))
+            vocabulary = getattr(part, 'vocabulary_', None)
+            if isinstance(vocabulary, dict):
+                size += sys.getsizeof(vocabulary) + sum(sys.getsizeof(term) for term in vocabulary)
+                size += getattr(part, 'idf_', np.empty(0)).nbytes
+        snapshot = self.response_store.snapshot()
+        return size + snapshot.size
+
+
+    # Stores the intents that are about to be replaced and the training file in the snapshot store.
+    # Only the intents that changed since the versions already stored are written, and if
+    # intents.json is still the file written by the last retraining (its hash is intents_hash) its
+    # version is already known and no intent is hashed. Returns the entry of the intents, or None if
+    # they could not be stored, then the files are archived as full copies like before.
+    def archive_datasets(self, intents_data, train_data, timestamp, intents_hash=None):
+        try:
+            snapshots = SnapshotStore(self.snapshots_path)
+            head = snapshots.head()
+            known = None
+            if head and intents_hash and head['file_hash'] == intents_hash:
+                known = head['version']
+            entry = snapshots.save(intents_data, 'intents', f"{timestamp}_{INTENTS_JSON}", known)
+            train_entry = snapshots.save(train_data, 'train', f"{timestamp}_{INTENTS_TRAIN_JSON}")
+            print(f"Versión de los datos guardada en {self.snapshots_path}: {train_entry['name']}")
+            return entry
+        except Exception as e:
+            print(f"No se pudo guardar la versión de los datos, se archivan los archivos: {e}")
+            return None
+
+
+    # Stores the intents.json written by a retraining in the snapshot store as the version that
+    # extends base, hashing only the intents whose number of examples changed and the new ones, and
+    # records it as the head for the next retraining
+    def record_intents_version(self, data, base, example_counts):
+        try:
+            changed = [position for position, count in enumerate(example_counts)
+                        if len(data['intents'][position].get('examples', [])) != count]
+            snapshots = SnapshotStore(self.snapshots_path)
+            version, _ = snapshots.store_version(data, base, changed)
+            snapshots.set_head(version, file_hash(self.intents_path))
+        except Exception as e:
+            print(f"No se pudo guardar la versión de los datos actualizados: {e}")
 
 
-    # Gets the most recent training file to retrain the model if exist
+    # Gets the training file to retrain the model if exist
     def get_train_file(self):        
         try:
-            # We list all the training files in the data directory
-            train_files = [f for f in os.listdir(DATA_PATH) if f == INTENTS_TRAIN_JSON]
-            if not train_files:
+            # There is a single training file with a fixed name, no need to list the directory
+            if not os.path.isfile(self.train_path):
                 return None  # No training file saved
-            # Sort files by modification time and return the most recent
-            train_files.sort(key=lambda x: os.path.getmtime(os.path.join(DATA_PATH, x)), reverse=True)
-            return os.path.join(DATA_PATH, train_files[0])  # Return the most recent
+            return self.train_path
         except FileNotFoundError as e:
             print(f"Error: No se encontró el directorio de datos. {e}")
             return None
@@ -149,6 +333,9 @@ class IntentClassifier:
     # Trains the model with the given data
     def train(self, data):
         try:
+            # A compact model can only predict, training always starts from a new pipeline
+            if not hasattr(self.model, 'fit'):
+                self.model = self.create_new_model()
             # List to save text examples, the text inputs that will be used to train the model.
             X_train = []  
             # List to save the corresponding intents. These intents are the # labels that the model 
@@ -165,32 +352,236 @@ class IntentClassifier:
                     y_train.append(intent)
             # train the model (self.model) using the training data (X_train and y_train).
             # The model will learn to map texts to their corresponding intents.
-            self.model.fit(X_train, y_train)
+            if is_hashing_pipeline(self.model):
+                # The examples are hashed in parallel chunks
+                fit_hashing_pipeline(self.model, X_train, y_train)
+            else:
+                self.model.fit(X_train, y_train)
+            # Summary of the training stored in the model registry. The retrieval engine finds
+            # every training example in its own index, its training accuracy says nothing.
+            self.metrics = {
+                'intents': len(set(y_train)),
+                'examples': len(X_train),
+                'engine': CLASSIFIER_ENGINE,
+            }
+            if hasattr(self.model, 'steps'):
+                hits = sum(predicted == intent
+                            for predicted, intent in zip(self.model.predict(X_train), y_train))
+                self.metrics['train_accuracy'] = round(hits / len(y_train), 4) if y_train else None
+            # Held-out examples that check the compaction of the compact copy when the model is
+            # saved, None if nothing is compacted
+            self.validation_examples = holdout_validation(self.model, X_train, y_train)
         except Exception as e:
             raise Exception(f"Error al entrenar el modelo: {e}")
 
 
+    # Trains a new model on the whole intents.json with the current settings (for example the ones
+    # just found by the hyperparameter search) and makes it the active one. This classifier may be
+    # serving requests, so the new model is built in a copy of it, which is returned. If this one
+    # is the classifier published by the chatbot, the copy replaces it.
+    def retrain(self):
+        try:
+            new_classifier = copy.copy(self)
+            new_classifier.model = self.create_new_model()
+            new_classifier.train(load_data(self.intents_path))
+            timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            new_classifier.model_filename = f"{self.models_path}/trained_model_{timestamp}.pkl"
+            new_classifier.save_model()
+            new_classifier.model = new_classifier.load_model(new_classifier.model_filename)
+            # The cached results belong to the previous model
+            new_classifier.prediction_cache = PredictionCache() if USE_PREDICTION_CACHE else None
+        except Exception as e:
+            raise Exception(f"Error al reentrenar el modelo: {e}")
+        # Imported here, the chatbot module imports this one
+        from src import chatbot
+        if chatbot.classifier is self:
+            chatbot.publish_classifier(new_classifier)
+        return new_classifier
+
+
+    # Trains the model adding only the new examples to the statistics stored on disk. If the stored
+    # statistics do not correspond to the intents file that was just updated (base_hash), they are
+    # rebuilt once from the whole updated corpus.
+    def train_incremental(self, X_new, y_new, updated_data, base_hash):
+        try:
+            trainer = IncrementalTrainer(self.incremental_state_path)
+            if trainer.load() and trainer.data_hash == base_hash:
+                trainer.update(X_new, y_new)
+                print(f"Entrenamiento incremental con {len(X_new)} ejemplos nuevos.")
+            else:
+                trainer.fit(updated_data)
+                print("No hay estadísticas incrementales válidas, se calcularon con todo el corpus.")
+            trainer.data_hash = file_hash(self.intents_path)
+            trainer.save()
+            self.model = trainer.to_pipeline()
+            self.metrics = {
+                'intents': len(trainer.classes),
+                'examples': int(trainer.class_count.sum()),
+                'training_mode': 'incremental',
+            }
+            self.validation_examples = holdout_validation(self.model,
+                                                            *get_training_examples(updated_data))
+        except Exception as e:
+            raise Exception(f"Error al entrenar el modelo de forma incremental: {e}")
+
+
+    # Trains a new model reading a large training file (.json or .jsonl) as a stream. The examples
+    # are added in chunks to incremental statistics, so they are never all in memory: memory grows
+    # with the vocabulary and the number of intents (the sums and the final model), not with the
+    # number of examples. The new model is saved and registered as the active one only if the whole
+    # file is valid.
+    def train_from_file(self, file_path, chunk_size=STREAMING_CHUNK_SIZE):
+        try:
+            trainer = IncrementalTrainer(self.incremental_state_path)
+            for X_chunk, y_chunk in iter_chunks(file_path, chunk_size):
+                trainer.update(X_chunk, y_chunk)
+                print(f"Ejemplos procesados: {int(trainer.class_count.sum())}")
+            self.model = trainer.to_pipeline()
+            self.metrics = {
+                'intents': len(trainer.classes),
+                'examples': int(trainer.class_count.sum()),
+                'training_mode': 'streaming',
+                'source': os.path.basename(file_path),
+            }
+            # The examples of the file are not kept, the compact copy is saved without compaction
+            self.validation_examples = None
+            timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            self.model_filename = f"{self.models_path}/trained_model_{timestamp}.pkl"
+            # The registry records the file the model was trained on, not intents.json
+            self.save_model(data_path=file_path)
+            print(f"Modelo entrenado desde {file_path} y guardado en {self.model_filename}")
+            # The stored incremental statistics are those of the previous model, an incremental
+            # retraining on top of them would drop what was learned from the file. Without them the
+            # next one is computed from the whole intents.json.
+            if os.path.exists(self.incremental_state_path):
+                os.remove(self.incremental_state_path)
+            # The responses still come from intents.json
+            intent_map = self.response_store.snapshot().intent_map
+            missing = [intent for intent in trainer.classes if intent not in intent_map]
+            if missing:
+                print(f"Advertencia: intenciones sin respuesta en intents.json: {', '.join(missing)}")
+        except Exception as e:
+            raise Exception(f"Error al entrenar el modelo desde {file_path}: {e}")
+
+
     # Receives a text message as input and uses the trained model to predict the intent associated 
     # with that message.
     def predict(self, message):
         try:
-            # The model performs the prediction and returns a list of predicted intents, but
-            # since only one message is passed (and therefore only one prediction will be generated), 
-            # the first (and only) value from the list of predictions is selected, which is the 
-            # predicted intent for the message.
-            return self.model.predict([message])[0]
+            # The message is scored like a batch of one, so a message below the confidence
+            # threshold of the model is the unknown intent here too. Only the prediction cache is
+            # skipped.
+            return self.score_batch([message], self.response_store.snapshot())[0]['intent']
         except Exception as e:
+            metrics.inc('errors')
             raise Exception(f"Error al predecir la intención del mensaje: {e}")
 
 
+    # Runs the first stage of the model (TF-IDF) on a list of messages
+    def transform(self, messages):
+        with metrics.timer('tfidf_transform'):
+            if hasattr(self.model, 'steps'):
+                return self.model[:-1].transform(messages)
+            return self.model.transform(messages)
+
+
+    # Runs the last stage of the model (Naive Bayes) on vectorized messages and returns the
+    # probability of every intent for every message
+    def predict_proba_transformed(self, X):
+        with metrics.timer('nb_scoring'):
+            if hasattr(self.model, 'steps'):
+                return self.model[-1].predict_proba(X)
+            return self.model.predict_proba_transformed(X)
+
+
+    # Receives a list of text messages and predicts all of them at once. The messages that are in
+    # the prediction cache are answered from it, the rest are scored together by score_batch.
+    # Returns, for each message, its intent, response and probability.
+    def predict_batch(self, messages):
+        try:
+            messages = list(messages)
+            if not messages:
+                return []
+            snapshot = self.response_store.snapshot()
+            cache = getattr(self, 'prediction_cache', None)
+            if cache is not None:
+                # The cache keys are built with the preprocessing of the current model
+                preprocessor = model_preprocessor(self.model)
+                with metrics.timer('cache_lookup'):
+                    results = cache.lookup(messages, self.model_filename, snapshot, preprocessor)
+            else:
+                results = [None] * len(messages)
+            # Messages that were not in the cache, each distinct message is scored only once
+            pending = {}
+            for position, result in enumerate(results):
+                if result is None:
+                    pending.setdefault(messages[position], []).append(position)
+            if pending:
+                scored = self.score_batch(list(pending), snapshot)
+                for positions, result in zip(pending.values(), scored):
+                    for position in positions:
+                        results[position] = dict(result)
+                if cache is not None:
+                    cache.store(list(pending), scored, self.model_filename, snapshot, preprocessor)
+            metrics.inc('batches')
+            return results
+        except Exception as e:
+            metrics.inc('errors')
+            raise Exception(f"Error al predecir la intención de los mensajes: {e}")
+
+
+    # Runs a list of messages through the model. The whole list is transformed by TF-IDF into a
+    # single sparse matrix and scored by Naive Bayes in one pass, so the pipeline dispatch and
+    # validation overhead is paid once per batch instead of once per message. The responses are
+    # taken from the given snapshot of intents.json.
+    def score_batch(self, messages, snapshot):
+        # Probabilities of every intent for every message, shape (n_messages, n_intents)
+        probabilities = self.predict_proba_transformed(self.transform(messages))
+        best = probabilities.argmax(axis=1)
+        intents = self.model.classes_[best]
+        scores = probabilities[range(len(messages)), best]
+        # Confidence below which the message is answered with the unknown intent fallback
+        threshold = getattr(self.model, 'unknown_threshold', UNKNOWN_INTENT_THRESHOLD)
+        with metrics.timer('response_lookup'):
+            results = []
+            for intent, score in zip(intents.tolist(), scores.tolist()):
+                if threshold is not None and score < threshold:
+                    intent = UNKNOWN_INTENT
+                    metrics.inc('unknown_intents')
+                response = snapshot.intent_map.get(intent)
+                if not response and intent == UNKNOWN_INTENT:
+                    response = UNKNOWN_INTENT_RESPONSE
+                if response:
+                    self.response_store.hits += 1
+                else:
+                    self.response_store.misses += 1
+                results.append({'intent': intent, 'response': response, 'probability': score})
+        return results
+
+
+    # Returns, for each message, the k training examples most similar to it, with their intent and
+    # similarity. Only the retrieval engine keeps the examples.
+    def nearest_examples(self, messages, k=None):
+        if not hasattr(self.model, 'search'):
+            raise Exception("El motor de clasificación del modelo no permite buscar ejemplos.")
+        return self.model.search(messages, k)
+
+
+    # Classifies a single message going through the prediction cache. Like
+    # response_message_to_intent, raises an exception if the intent has no response.
+    def classify(self, message):
+        result = self.predict_batch([message])[0]
+        if not result['response']:
+            result['response'] = self.response_message_to_intent(result['intent'])
+        return result
+
+
     # Returns the response corresponding to the intent
     def response_message_to_intent(self, intent):
         try:
-            data = load_data(INTENTS_JSON_PATH)        
-            # Create a dictionary to quickly search for answers
-            intent_map = {item['intent']: item['response'] for item in data['intents']}
-            # Find the answer corresponding to the intent
-            response = intent_map.get(intent)        
+            # Find the answer corresponding to the intent in the cached map
+            with metrics.timer('response_lookup'):
+                response = self.response_store.get_response(intent)
             if response:
                 return response
             else:
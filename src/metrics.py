@@ -0,0 +1,282 @@
+'''
+Instrumentation of the message path. Every stage (classifier lookup, TF-IDF transform, Naive Bayes
+scoring, response lookup, reloads, GUI update) is timed into a histogram, and the relevant events
+are counted. The metrics can be read in Prometheus text format or as JSON, and they can be enabled
+in production without changing the code through environment variables:
+
+    CHATBOT_METRICS_PORT=9100            serves GET /metrics in Prometheus text format
+    CHATBOT_METRICS_DUMP=metrics.json    writes the metrics as JSON periodically
+    CHATBOT_METRICS_DUMP_INTERVAL=60     seconds between two JSON dumps
+    CHATBOT_PROFILE_SAMPLE_RATE=0.01     profiles that fraction of the messages with cProfile
+    CHATBOT_PROFILE_OUTPUT=profile.txt   where the accumulated profile is written
+
+With several worker processes (src/prefork.py) every worker exports its own metrics: worker i
+serves them on CHATBOT_METRICS_PORT + i and writes them to metrics.i.json (and profile.i.txt).
+'''
+
+import io
+import os
+import json
+import time
+import random
+import bisect
+import cProfile
+import pstats
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from constants import SERVER_HOST, METRICS_PORT, METRICS_DUMP_PATH, METRICS_DUMP_INTERVAL
+from constants import PROFILE_SAMPLE_RATE, PROFILE_OUTPUT_PATH
+
+
+# Upper bounds of the histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                    0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_PREFIX = 'chatbot'
+
+
+class Histogram:
+
+    # Constructor
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One counter per bucket plus one for the values above the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+    # Records a value
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+    # Estimates a quantile (0-1) as the upper bound of the bucket where it falls. Values above the
+    # last bound are reported as the last bound, JSON has no infinity.
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+
+    # Constructor
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._profile_stats = None
+        self._profiled = 0
+
+
+    # Adds value to a counter
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+    # Records the duration in seconds of a stage
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+
+    # Context manager that times the block into the histogram of the stage
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+
+    # Context manager that profiles the block with cProfile for a sampled fraction of the calls.
+    # It does nothing unless CHATBOT_PROFILE_SAMPLE_RATE is set.
+    @contextmanager
+    def profile(self):
+        if not PROFILE_SAMPLE_RATE or random.random() >= PROFILE_SAMPLE_RATE:
+            yield
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._lock:
+                if self._profile_stats is None:
+                    self._profile_stats = pstats.Stats(profiler)
+                else:
+                    self._profile_stats.add(profiler)
+                self._profiled += 1
+
+
+    # Returns the accumulated profile as text, sorted by cumulative time
+    def profile_report(self, limit=40):
+        with self._lock:
+            if self._profile_stats is None:
+                return ''
+            output = io.StringIO()
+            self._profile_stats.stream = output
+            output.write(f"Mensajes perfilados: {self._profiled}\n")
+            self._profile_stats.sort_stats('cumulative').print_stats(limit)
+            return output.getvalue()
+
+
+    # Returns the metrics as a dictionary ready to be serialized to JSON
+    def to_dict(self):
+        with self._lock:
+            return {
+                'uptime_seconds': time.time() - self.started_at,
+                'counters': dict(self.counters),
+                'stages': {
+                    stage: {
+                        'count': histogram.count,
+                        'mean_ms': histogram.sum / histogram.count * 1000 if histogram.count else 0.0,
+                        'p50_ms': histogram.quantile(0.5) * 1000,
+                        'p99_ms': histogram.quantile(0.99) * 1000,
+                    }
+                    for stage, histogram in self.histograms.items()
+                },
+            }
+
+
+    # Returns the metrics in the Prometheus text exposition format
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name}_total counter")
+                lines.append(f"{METRIC_PREFIX}_{name}_total {value}")
+            family = f"{METRIC_PREFIX}_stage_seconds"
+            if self.histograms:
+                lines.append(f"# TYPE {family} histogram")
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{family}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{family}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{family}_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{family}_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+    # Writes the metrics as JSON, and the profile if there is one
+    def dump(self, file_path=METRICS_DUMP_PATH, profile_path=PROFILE_OUTPUT_PATH):
+        temporary = f"{file_path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=4)
+        # Replace the file at once so readers never see it half written
+        os.replace(temporary, file_path)
+        report = self.profile_report()
+        if report and profile_path:
+            with open(profile_path, 'w', encoding='utf-8') as f:
+                f.write(report)
+
+
+# Metrics of the process, shared by every module
+metrics = MetricsRegistry()
+
+
+# Handler of the Prometheus endpoint
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path not in ('/metrics', '/profile'):
+            self.send_error(404)
+            return
+        text = metrics.to_prometheus() if self.path == '/metrics' else metrics.profile_report()
+        body = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    # Requests are not logged to the console
+    def log_message(self, format, *args):
+        pass
+
+
+# Returns the path of a file exported by a worker process, with its number before the extension
+def worker_path(file_path, worker):
+    if not file_path or worker is None:
+        return file_path
+    root, extension = os.path.splitext(file_path)
+    return f"{root}.{worker}{extension}"
+
+
+# Server of the Prometheus endpoint. With several workers the port can be bound by the old and the
+# new process of the same worker while the old one finishes its requests.
+class _MetricsServer(ThreadingHTTPServer):
+
+    # Constructor
+    def __init__(self, address, reuse_port=False):
+        self.allow_reuse_port = reuse_port
+        super().__init__(address, _MetricsHandler)
+
+
+# Starts the exporters configured through environment variables: the HTTP endpoint and the
+# periodic JSON dump. worker is the number of the worker process that exports them, None for a
+# single process. It is safe to call it more than once.
+_exporters_started = False
+_metrics_server = None
+
+def start_exporters(worker=None):
+    global _exporters_started, _metrics_server
+    if _exporters_started:
+        return
+    _exporters_started = True
+    if METRICS_PORT:
+        port = METRICS_PORT + (worker or 0)
+        try:
+            # Same interface as the inference server, the metrics are not exposed beyond it
+            _metrics_server = _MetricsServer((SERVER_HOST, port), reuse_port=worker is not None)
+            threading.Thread(target=_metrics_server.serve_forever, name='metrics-http',
+                                daemon=True).start()
+            print(f"Métricas disponibles en http://{SERVER_HOST}:{port}/metrics")
+        except OSError as e:
+            print(f"No se pudo iniciar el servidor de métricas en el puerto {port}: {e}")
+    if METRICS_DUMP_PATH:
+        dump_path = worker_path(METRICS_DUMP_PATH, worker)
+        profile_path = worker_path(PROFILE_OUTPUT_PATH, worker)
+        def dump_periodically():
+            while True:
+                time.sleep(METRICS_DUMP_INTERVAL)
+                try:
+                    metrics.dump(dump_path, profile_path)
+                except Exception as e:
+                    print(f"Error al guardar las métricas en {dump_path}: {e}")
+        threading.Thread(target=dump_periodically, name='metrics-dump', daemon=True).start()
+
+
+# Stops serving the Prometheus endpoint, so a worker that is finishing its requests leaves the port
+# to the worker that replaces it
+def stop_exporters():
+    global _metrics_server
+    if _metrics_server is not None:
+        _metrics_server.shutdown()
+        _metrics_server.server_close()
+        _metrics_server = None
@@ -0,0 +1,272 @@
+'''
+Compaction of the compact copy of a Naive Bayes model after training. Two reductions, set in
+constants.py:
+
+    feature selection   (COMPACT_FEATURE_SELECTION, COMPACT_KEEP_FEATURES) only a fraction of the
+                        terms is kept: those most related to the intents by their chi² statistic,
+                        or those that appear in the most examples ('df'). Both come from the
+                        fitted model (the Naive Bayes counts and the idf weights), the training
+                        examples are not vectorized again.
+    weights precision   (COMPACT_WEIGHTS_DTYPE) the Naive Bayes log probabilities are stored as
+                        float32, float16 or int8 with a scale and an offset per intent.
+                        CompactPredictor scores with them as they are stored.
+
+The compacted copy is checked before it is published. The model was fitted on every training
+example, so its accuracy on them says little about new messages: a stratified fraction of the
+examples (COMPACT_VALIDATION_FRACTION) is kept out of the fit of a copy of the pipeline (the
+probe), and the full and compacted exports of the probe predict them. The drop in accuracy, and
+the size on disk and the time per message of both copies of the model, are reported. If the
+accuracy drops more than COMPACT_MAX_ACCURACY_DROP the compaction is refused and the full copy is
+kept. The probe is only fitted when the settings compact something.
+
+The copy is written to a temporary directory next to its final place and moved there with a
+rename, so readers never find a half-written compact model.
+
+Usage: python -m src.model_compaction [MODEL.pkl] [--data FILE] [--select chi2|df|none]
+                                      [--keep 0.5] [--dtype int8] [--max-drop 0.01]
+                                      [--holdout 0.2] [--publish]
+'''
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+from constants import DATA_PATH, MODELS_PATH, INTENTS_JSON
+from constants import COMPACT_FEATURE_SELECTION, COMPACT_KEEP_FEATURES, COMPACT_WEIGHTS_DTYPE
+from constants import COMPACT_MAX_ACCURACY_DROP, COMPACT_VALIDATION_FRACTION, COMPACT_VALIDATION_SIZE
+from src.compact_model import CompactPredictor, export_compact_model, compact_model_path
+from src.compact_model import WEIGHTS_DTYPES
+from src.utils import load_data, get_training_examples, stratified_split
+from src.model_registry import ModelRegistry
+
+
+FEATURE_SELECTIONS = ('chi2', 'df')
+
+
+# Checks whether the settings change anything of the full compact copy
+def is_compaction(method, keep, weights_dtype):
+    return (method is not None and keep < 1.0) or weights_dtype != 'float64'
+
+
+# Returns the score of every column of a fitted pipeline for the feature selection, the columns
+# with the highest scores are kept. Columns that no example has (empty hashing buckets) score -inf.
+def feature_scores(pipeline, method):
+    classifier = pipeline[-1]
+    observed = np.asarray(classifier.feature_count_, dtype=np.float64)
+    totals = observed.sum(axis=0)
+    if method == 'chi2':
+        # Same statistic as sklearn.feature_selection.chi2: the Naive Bayes counts are the sums of
+        # the vectors of the examples of each intent
+        class_prob = classifier.class_count_ / classifier.class_count_.sum()
+        expected = np.outer(class_prob, totals)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = ((observed - expected) ** 2 / expected).sum(axis=0)
+    elif method == 'df':
+        # The idf weight decreases with the number of examples of a term. Without idf (incremental
+        # statistics) the total weight of the term is used.
+        weighting = pipeline[-2]
+        idf = getattr(weighting, 'idf_', None) if getattr(weighting, 'use_idf', False) else None
+        scores = -idf if idf is not None else totals.copy()
+    else:
+        raise ValueError(f"Selección de términos desconocida: {method}")
+    scores = np.nan_to_num(scores, nan=-np.inf)
+    scores[totals <= 0] = -np.inf
+    return scores
+
+
+# Returns the columns kept by the feature selection, sorted, or None to keep all of them
+def select_columns(pipeline, method, keep):
+    if method is None or keep >= 1.0:
+        return None
+    if not 0 < keep < 1:
+        raise ValueError(f"La fracción de términos debe estar entre 0 y 1: {keep}")
+    scores = feature_scores(pipeline, method)
+    used = int(np.isfinite(scores).sum())
+    n_keep = max(1, int(round(keep * used)))
+    return np.sort(np.argsort(-scores, kind='stable')[:n_keep])
+
+
+# Returns a random sample of at most size examples, to validate the compaction
+def validation_sample(X, y, size=COMPACT_VALIDATION_SIZE, seed=0):
+    if len(X) <= size:
+        return list(X), list(y)
+    positions = np.random.default_rng(seed).choice(len(X), size, replace=False)
+    return [X[i] for i in positions], [y[i] for i in positions]
+
+
+# Keeps a stratified fraction of the training examples (at most size of them) out of the fit of a
+# copy of the pipeline, so the compaction is measured on examples that copy did not see. Returns
+# (X_val, y_val, probe), or None if the settings do not compact anything or there are too few
+# examples to keep some out.
+def holdout_validation(pipeline, X, y, method=COMPACT_FEATURE_SELECTION, keep=COMPACT_KEEP_FEATURES,
+                        weights_dtype=COMPACT_WEIGHTS_DTYPE, fraction=COMPACT_VALIDATION_FRACTION,
+                        size=COMPACT_VALIDATION_SIZE, seed=0):
+    if not hasattr(pipeline, 'steps') or not is_compaction(method, keep, weights_dtype):
+        return None
+    from sklearn.base import clone
+    train, test = stratified_split(y, fraction, seed)
+    if not test:
+        return None
+    X_val, y_val = validation_sample([X[i] for i in test], [y[i] for i in test], size, seed)
+    probe = clone(pipeline).fit([X[i] for i in train], [y[i] for i in train])
+    return X_val, y_val, probe
+
+
+# Returns the size in bytes of the files of a directory
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, filename)) for filename in os.listdir(directory))
+
+
+# Predicts the validation examples with a compact copy, returns its accuracy, size and latency.
+# With probe_directory, the accuracy and the latency are those of that copy instead.
+def measure(directory, X_val, y_val, probe_directory=None):
+    predictor = CompactPredictor(probe_directory or directory)
+    start = time.perf_counter()
+    predicted = predictor.predict(X_val)
+    seconds = time.perf_counter() - start
+    return {
+        'accuracy': round(float(np.mean(predicted == np.asarray(y_val, dtype=str))), 4),
+        'columns': int(CompactPredictor(directory).feature_log_prob.shape[1]),
+        'bytes': directory_size(directory),
+        'ms_per_message': round(seconds * 1000 / len(X_val), 4),
+    }
+
+
+# Moves a finished export to directory. A new directory is moved with a single rename; an
+# existing one is first renamed away and deleted only after the new one is in place.
+def replace_directory(source, directory):
+    if not os.path.exists(directory):
+        os.rename(source, directory)
+        return
+    previous = tempfile.mkdtemp(dir=os.path.dirname(source), prefix='previous.')
+    os.rename(directory, os.path.join(previous, 'compact'))
+    os.rename(source, directory)
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+# Exports the compact copy of a pipeline to directory, compacted if the settings ask for it and
+# the accuracy on the validation examples does not drop more than max_drop. The accuracy is
+# measured with probe (the pipeline fitted without the validation examples, see
+# holdout_validation), or with the pipeline itself without one. Returns the report of the
+# compaction, or None if there was nothing to compact. With publish=False directory is not
+# written, only the report is made.
+def compact_model(pipeline, directory, X_val, y_val, method=COMPACT_FEATURE_SELECTION,
+                    keep=COMPACT_KEEP_FEATURES, weights_dtype=COMPACT_WEIGHTS_DTYPE,
+                    max_drop=COMPACT_MAX_ACCURACY_DROP, publish=True, probe=None):
+    try:
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        # Exports are written next to directory, so they can be moved into place with a rename
+        with tempfile.TemporaryDirectory(dir=parent,
+                                            prefix=f"{os.path.basename(directory)}.") as temporary:
+            full = export_compact_model(pipeline, os.path.join(temporary, 'full'))
+            if not is_compaction(method, keep, weights_dtype):
+                if publish:
+                    replace_directory(full, directory)
+                return None
+            if not X_val:
+                raise ValueError("No hay ejemplos para validar la compactación.")
+            candidate = export_compact_model(pipeline, os.path.join(temporary, 'candidate'),
+                                                select_columns(pipeline, method, keep), weights_dtype)
+            probe_full = probe_candidate = None
+            if probe is not None:
+                probe_full = export_compact_model(probe, os.path.join(temporary, 'probe_full'))
+                probe_candidate = export_compact_model(probe, os.path.join(temporary, 'probe_candidate'),
+                                                        select_columns(probe, method, keep),
+                                                        weights_dtype)
+            before = measure(full, X_val, y_val, probe_full)
+            after = measure(candidate, X_val, y_val, probe_candidate)
+            accuracy_drop = round(before['accuracy'] - after['accuracy'], 4)
+            accepted = accuracy_drop <= max_drop
+            if publish:
+                replace_directory(candidate if accepted else full, directory)
+        return {
+            'feature_selection': method,
+            'keep_features': keep,
+            'weights_dtype': weights_dtype,
+            'validation_examples': len(X_val),
+            'held_out': probe is not None,
+            'before': before,
+            'after': after,
+            'accuracy_drop': accuracy_drop,
+            'max_accuracy_drop': max_drop,
+            'accepted': accepted,
+            'published': accepted and publish,
+        }
+    except ValueError:
+        raise
+    except Exception as e:
+        raise Exception(f"Error al compactar el modelo en {directory}: {e}")
+
+
+# Returns a one-line summary of a compaction report
+def format_report(report):
+    before, after = report['before'], report['after']
+    verdict = ("aceptada" if report['accepted'] else
+                f"rechazada, la exactitud baja más de {report['max_accuracy_drop']}")
+    return (f"Compactación ({report['feature_selection'] or 'todos los términos'}, "
+            f"{report['weights_dtype']}) {verdict}: exactitud {before['accuracy']:.4f} -> "
+            f"{after['accuracy']:.4f}, columnas {before['columns']} -> {after['columns']}, "
+            f"tamaño {before['bytes'] / 1024:.0f} KB -> {after['bytes'] / 1024:.0f} KB, "
+            f"{before['ms_per_message']:.3f} ms -> {after['ms_per_message']:.3f} ms por mensaje")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compactación del modelo compacto de Naive Bayes.")
+    parser.add_argument('model', nargs='?', help="Modelo .pkl (por defecto, el activo del registro).")
+    parser.add_argument('--data', default=os.path.join(DATA_PATH, INTENTS_JSON),
+                        help="Ejemplos con los que se mide la exactitud.")
+    parser.add_argument('--select', choices=FEATURE_SELECTIONS + ('none',),
+                        default=COMPACT_FEATURE_SELECTION or 'none',
+                        help="Criterio para descartar términos.")
+    parser.add_argument('--keep', type=float, default=COMPACT_KEEP_FEATURES,
+                        help="Fracción de términos que se conservan.")
+    parser.add_argument('--dtype', choices=WEIGHTS_DTYPES, default=COMPACT_WEIGHTS_DTYPE,
+                        help="Precisión de los pesos.")
+    parser.add_argument('--max-drop', type=float, default=COMPACT_MAX_ACCURACY_DROP,
+                        help="Máxima caída de exactitud aceptada.")
+    parser.add_argument('--holdout', type=float, default=COMPACT_VALIDATION_FRACTION,
+                        help="Fracción de los ejemplos que se aparta para medir la exactitud.")
+    parser.add_argument('--sample', type=int, default=COMPACT_VALIDATION_SIZE,
+                        help="Máximo de ejemplos con los que se mide.")
+    parser.add_argument('--publish', action='store_true',
+                        help="Reemplaza la copia compacta del modelo si se acepta la compactación.")
+    args = parser.parse_args(argv)
+
+    import joblib
+    try:
+        model_file = args.model or ModelRegistry(MODELS_PATH).active_model_path()
+        if not model_file:
+            raise ValueError("No hay un modelo activo en el registro.")
+        pipeline = joblib.load(model_file)
+        if not hasattr(pipeline, 'steps'):
+            raise ValueError("Solo se pueden compactar los modelos de Naive Bayes.")
+        data = load_data(args.data)
+        if data is None:
+            raise ValueError(f"No se pudo leer el archivo {args.data}.")
+        method = None if args.select == 'none' else args.select
+        # The model was trained on these examples, the accuracy is measured with a probe fitted
+        # without the held-out part
+        X_val, y_val, probe = holdout_validation(pipeline, *get_training_examples(data), method,
+                                                    args.keep, args.dtype, args.holdout,
+                                                    args.sample) or ([], [], None)
+        report = compact_model(pipeline, compact_model_path(model_file), X_val, y_val, method,
+                                args.keep, args.dtype, args.max_drop, args.publish, probe)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if report is None:
+        print("Nada que compactar: se conservan todos los términos con pesos float64.")
+        return
+    print(format_report(report))
+    if report['published']:
+        print(f"Modelo compacto reemplazado en {compact_model_path(model_file)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+'''
+Registry of the trained models. A small JSON manifest (models/registry.json) records the version,
+file, training data hash and metrics of every model together with a pointer to the active one, so
+finding the model to load is a single lookup instead of listing the directory and sorting the
+files by modification time (which changes with every copy or checkout). It also allows pinning a
+version, rolling back to the previous one and pruning old models with a retention policy.
+
+Every change reads, modifies and writes the manifest while holding an exclusive lock on a file next
+to it (registry.json.lock), so processes that register or activate models at the same time (a
+retraining, the prefork builder, the command line) do not overwrite each other's changes.
+
+Usage: python -m src.model_registry list
+       python -m src.model_registry activate VERSION [--pin]
+       python -m src.model_registry unpin
+       python -m src.model_registry rollback
+       python -m src.model_registry prune --keep N
+'''
+
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# File locks are only available on POSIX systems, elsewhere the manifest is only written atomically
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from constants import MODELS_PATH, MODEL_REGISTRY_JSON, MODEL_RETENTION
+from src.compact_model import compact_model_path
+
+
+# Model files are named <prefix>_<YYYY-MM-DD_HH-MM-SS>.pkl, the timestamp is used as the version
+VERSION_PATTERN = re.compile(r'^(?:trained_model|modelo_entrenado)_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\.pkl$')
+
+
+# Returns the sha256 of a file, used to record which training data produced a model
+def file_hash(file_path):
+    try:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+# Returns the version of a model file or None if the name does not follow the convention
+def version_from_filename(filename):
+    match = VERSION_PATTERN.match(os.path.basename(filename))
+    return match.group(1) if match else None
+
+
+class ModelRegistry:
+
+    # Constructor
+    def __init__(self, models_path=MODELS_PATH, retention=MODEL_RETENTION):
+        self.models_path = models_path
+        self.manifest_path = os.path.join(models_path, MODEL_REGISTRY_JSON)
+        self.retention = retention
+        self.lock_path = f"{self.manifest_path}.lock"
+
+
+    # Holds the lock of the manifest. The lock belongs to the open file, so it excludes other
+    # processes and other registries of the same process, and it is released if the process dies.
+    @contextmanager
+    def locked(self):
+        os.makedirs(self.models_path, exist_ok=True)
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+    # Reads the manifest. If it does not exist yet it is created from the model files found in
+    # the directory, ordered by the timestamp in their names.
+    def load(self):
+        try:
+            return self._read()
+        except FileNotFoundError:
+            with self.locked():
+                return self._load()
+
+
+    # Reads the manifest, or creates it, while the lock is already held
+    def _load(self):
+        try:
+            return self._read()
+        except FileNotFoundError:
+            manifest = self.bootstrap()
+            self.save(manifest)
+            return manifest
+
+
+    # Reads the manifest file
+    def _read(self):
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+    # Builds a manifest from the model files that already exist
+    def bootstrap(self):
+        versions = []
+        if os.path.isdir(self.models_path):
+            for filename in os.listdir(self.models_path):
+                version = version_from_filename(filename)
+                if version:
+                    versions.append({'version': version, 'filename': filename, 'created': None,
+                                        'data_hash': None, 'metrics': {}})
+        versions.sort(key=lambda item: item['version'])
+        return {'active': versions[-1]['version'] if versions else None, 'pinned': False,
+                'versions': versions}
+
+
+    # Writes the manifest atomically so readers never see a half-written file. The temporary name is
+    # unique, so two writers never write into the same file.
+    def save(self, manifest):
+        os.makedirs(self.models_path, exist_ok=True)
+        temporary = f"{self.manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=4)
+        os.replace(temporary, self.manifest_path)
+
+
+    # Returns the entry of a version or None
+    @staticmethod
+    def find(manifest, version):
+        return next((item for item in manifest['versions'] if item['version'] == version), None)
+
+
+    # Returns the absolute path of the active model or None if there are no models
+    def active_model_path(self):
+        manifest = self.load()
+        entry = self.find(manifest, manifest.get('active'))
+        if entry is None:
+            return None
+        return os.path.join(self.models_path, entry['filename'])
+
+
+    # Adds a new model. It becomes the active one unless a version is pinned.
+    def register(self, model_filename, data_hash=None, metrics=None, activate=True):
+        with self.locked():
+            manifest = self._load()
+            filename = os.path.basename(model_filename)
+            version = version_from_filename(filename) or datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            entry = self.find(manifest, version)
+            if entry is None:
+                entry = {'version': version}
+                manifest['versions'].append(entry)
+                manifest['versions'].sort(key=lambda item: item['version'])
+            entry.update({'filename': filename, 'created': datetime.now().isoformat(timespec='seconds'),
+                            'data_hash': data_hash, 'metrics': metrics or {}})
+            if activate and not manifest.get('pinned'):
+                manifest['active'] = version
+            self.save(manifest)
+        if self.retention:
+            self.prune(self.retention)
+        return version
+
+
+    # Makes a version the active one. If pin is True, new models will not replace it until unpin
+    # is called.
+    def activate(self, version, pin=False):
+        with self.locked():
+            manifest = self._load()
+            if self.find(manifest, version) is None:
+                raise ValueError(f"La versión {version} no existe en el registro.")
+            manifest['active'] = version
+            manifest['pinned'] = pin
+            self.save(manifest)
+
+
+    # Allows new models to become active again
+    def unpin(self):
+        with self.locked():
+            manifest = self._load()
+            manifest['pinned'] = False
+            self.save(manifest)
+
+
+    # Activates the version registered before the active one and pins it, so the model that was
+    # rolled back is not activated again by the next retraining
+    def rollback(self):
+        with self.locked():
+            manifest = self._load()
+            versions = [item['version'] for item in manifest['versions']]
+            if manifest.get('active') not in versions or versions.index(manifest['active']) == 0:
+                raise ValueError("No hay una versión anterior a la activa.")
+            manifest['active'] = versions[versions.index(manifest['active']) - 1]
+            manifest['pinned'] = True
+            self.save(manifest)
+            return manifest['active']
+
+
+    # Deletes the files of the oldest versions, keeping the newest `keep` ones and always the
+    # active one. Returns the deleted versions.
+    def prune(self, keep):
+        with self.locked():
+            manifest = self._load()
+            keep_versions = {item['version'] for item in manifest['versions'][-keep:]} if keep else set()
+            keep_versions.add(manifest.get('active'))
+            removed = []
+            remaining = []
+            for entry in manifest['versions']:
+                if entry['version'] in keep_versions:
+                    remaining.append(entry)
+                    continue
+                model_file = os.path.join(self.models_path, entry['filename'])
+                try:
+                    if os.path.exists(model_file):
+                        os.remove(model_file)
+                    shutil.rmtree(compact_model_path(model_file), ignore_errors=True)
+                    removed.append(entry['version'])
+                except OSError as e:
+                    print(f"No se pudo eliminar el modelo {model_file}: {e}")
+                    remaining.append(entry)
+            if removed:
+                manifest['versions'] = remaining
+                self.save(manifest)
+            return removed
+
+
+# Command line interface to inspect and manage the registry
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Registro de modelos del chatbot.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="Lista las versiones registradas.")
+    activate = commands.add_parser('activate', help="Activa una versión.")
+    activate.add_argument('version')
+    activate.add_argument('--pin', action='store_true', help="Fija la versión activa.")
+    commands.add_parser('unpin', help="Permite que los nuevos modelos se activen.")
+    commands.add_parser('rollback', help="Vuelve a la versión anterior y la fija.")
+    prune = commands.add_parser('prune', help="Elimina los modelos antiguos.")
+    prune.add_argument('--keep', type=int, default=MODEL_RETENTION, required=MODEL_RETENTION is None,
+                        help="Número de versiones más recientes que se conservan.")
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry(retention=None)
+    try:
+        if args.command == 'list':
+            manifest = registry.load()
+            for entry in manifest['versions']:
+                marker = '*' if entry['version'] == manifest['active'] else ' '
+                print(f"{marker} {entry['version']}  {entry['filename']}  {entry.get('metrics') or ''}")
+            print(f"Versión fijada: {'sí' if manifest.get('pinned') else 'no'}")
+        elif args.command == 'activate':
+            registry.activate(args.version, pin=args.pin)
+            print(f"Versión activa: {args.version}")
+        elif args.command == 'unpin':
+            registry.unpin()
+            print("Los nuevos modelos se activarán automáticamente.")
+        elif args.command == 'rollback':
+            print(f"Versión activa: {registry.rollback()}")
+        elif args.command == 'prune':
+            removed = registry.prune(args.keep)
+            print(f"Versiones eliminadas: {', '.join(removed) if removed else 'ninguna'}")
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
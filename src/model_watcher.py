@@ -0,0 +1,137 @@
+'''
+Background watcher of the data/ and models/ directories. When a new intents_train.json or a new
+model file appears, or another version is activated in the model registry, a new classifier is
+prepared on a worker thread and then published with a single reference swap, so the requests in
+progress finish with the old model and the new requests use the new one. Nothing is blocked or
+dropped while the new model is prepared.
+
+Retraining is CPU bound and would hold the GIL that the requests of the serving process need for
+the whole training, so when there is a training file the new model is trained, saved and
+registered in a separate process (like PreforkSupervisor.build does), and this process only loads
+the finished model.
+'''
+
+import os
+import sys
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import DATA_PATH, MODELS_PATH, INTENTS_TRAIN_JSON, MODEL_WATCH_INTERVAL
+from constants import MODEL_REGISTRY_JSON
+from src import chatbot
+
+
+class ModelWatcher:
+
+    # Constructor
+    def __init__(self, interval=MODEL_WATCH_INTERVAL, data_path=DATA_PATH, models_path=MODELS_PATH):
+        self.interval = interval
+        self.data_path = data_path
+        self.models_path = models_path
+        self.reloads = 0
+        self._stop = threading.Event()
+        self._thread = None
+        # A single worker, so two reloads never run at the same time
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-reload')
+        self._pending = None
+        self._signature = None
+
+
+    # Returns a value that changes when a training file or a model file is added, removed or
+    # modified, or when the active version of the registry changes
+    def signature(self):
+        train_file = os.path.join(self.data_path, INTENTS_TRAIN_JSON)
+        try:
+            stat = os.stat(train_file)
+            train = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            train = None
+        try:
+            models = frozenset(
+                (entry.name, entry.stat().st_mtime_ns)
+                for entry in os.scandir(self.models_path)
+                if entry.name.endswith('.pkl') or entry.name == MODEL_REGISTRY_JSON
+            )
+        except FileNotFoundError:
+            models = frozenset()
+        return train, models
+
+
+    # Starts the watcher thread
+    def start(self):
+        self.acknowledge()
+        self._thread = threading.Thread(target=self._run, name='model-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+
+    # Stops the watcher thread and waits for the reload in progress, if any
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+
+
+    # Checks the directories once. Returns True when they changed and the change has been stable
+    # for a whole check, so a file that is still being copied is not read.
+    def poll(self):
+        current = self.signature()
+        if current == self._signature:
+            self._pending = None
+            return False
+        if current != self._pending:
+            self._pending = current
+            return False
+        self._pending = None
+        return True
+
+
+    # Takes the current state of the directories as already handled
+    def acknowledge(self):
+        self._signature = self.signature()
+
+
+    # Checks the directories periodically
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.poll():
+                continue
+            future = self._executor.submit(self._reload)
+            # Wait for the reload so the files it writes are not detected as a new change
+            future.result()
+            self.acknowledge()
+
+
+    # Builds and publishes the new classifier. A training file is trained on in another process
+    # (spawned, since this one has threads), then the model it registered is loaded here.
+    def _reload(self):
+        print("Se detectaron cambios en los datos o modelos, preparando un nuevo modelo...")
+        if os.path.isfile(os.path.join(self.data_path, INTENTS_TRAIN_JSON)):
+            process = multiprocessing.get_context('spawn').Process(
+                target=build_classifier, args=(self.data_path, self.models_path), name='model-build')
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                print("No fue posible preparar el nuevo modelo, se mantiene el actual.")
+                return
+        if chatbot.reload_classifier() is not None:
+            self.reloads += 1
+
+
+# Body of the process that prepares a new model. Building the classifier retrains, saves and
+# registers the model if there is a training file. The exit code tells whether it could be built.
+def build_classifier(data_path=DATA_PATH, models_path=MODELS_PATH):
+    from src.intent_classifier_model import IntentClassifier
+    try:
+        built = IntentClassifier(data_path, models_path).model is not None
+    except Exception as e:
+        print(f"Error al preparar el nuevo modelo: {e}")
+        built = False
+    sys.exit(0 if built else 1)
+
+
+# Starts a watcher with the default settings and returns it
+def start_model_watcher(interval=MODEL_WATCH_INTERVAL):
+    return ModelWatcher(interval).start()
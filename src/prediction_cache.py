@@ -0,0 +1,184 @@
+'''
+Fast path for repeated messages. Chat traffic is very repetitive ("Hola", "Gracias", "Adiós"), so
+before running the model a message is looked up in two tiers:
+
+    exact-match index  the normalized examples of intents.json mapped to their intent, built once
+                       per version of the file. A message that is exactly a training example gets
+                       its intent without being scored by the model.
+    LRU/TTL cache      the last results of the model, by normalized message, bounded in size and
+                       in age.
+
+The key of a message is the text its model tokenizes: the message goes through the preprocessing
+of the loaded model (its text normalization, or the lowercase and accent settings of its
+vectorizer), so two messages share a key only when the model cannot tell them apart.
+
+Both tiers are tied to the version of the model and to the digest of intents.json, and they are
+emptied as soon as either of them changes.
+'''
+
+import time
+import string
+import threading
+from collections import OrderedDict
+
+from constants import PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL
+from src.metrics import metrics
+
+
+# Characters removed around a message. They are never part of a term for the TF-IDF tokenizer, so
+# removing them does not change the prediction. '_' is a word character and is kept.
+MESSAGE_STRIP_CHARS = string.whitespace + '¿¡!?.,;:"\'()[]{}-…'
+
+
+# Returns the function that prepares the texts of a model before its tokenizer, or None if the
+# model has none that is known
+def model_preprocessor(model):
+    if hasattr(model, 'steps'):
+        return model[0].build_preprocessor()
+    if hasattr(model, 'vectorizer'):
+        # Retrieval engine
+        return model.vectorizer.build_preprocessor()
+    return getattr(model, 'preprocess', None)
+
+
+# Normalizes a message into its cache key: the preprocessing of the model (lowercase if it has
+# none), surrounding punctuation removed and inner whitespace collapsed. It only removes
+# differences the model does not see.
+def normalize_message(message, preprocessor=None):
+    message = preprocessor(message) if preprocessor is not None else message.lower()
+    return " ".join(message.split()).strip(MESSAGE_STRIP_CHARS)
+
+
+class PredictionCache:
+
+    # Constructor
+    def __init__(self, max_size=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL):
+        self.max_size = max_size
+        # Seconds a result stays valid, None keeps it until it is evicted
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._index = {}
+        self._version = None
+        self._lock = threading.Lock()
+        # Counters exposed through stats()
+        self.exact_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+
+    # Builds the exact-match index from the intents of a response snapshot. Examples that appear in
+    # more than one intent are ambiguous and are left to the model.
+    def build_index(self, snapshot, preprocessor=None):
+        index = {}
+        ambiguous = set()
+        for item in snapshot.data['intents']:
+            intent = item['intent']
+            if not snapshot.intent_map.get(intent):
+                continue
+            for example in item['examples']:
+                key = normalize_message(example, preprocessor)
+                if index.get(key, intent) != intent:
+                    ambiguous.add(key)
+                index[key] = intent
+        for key in ambiguous:
+            del index[key]
+        return index
+
+
+    # Empties both tiers if the model or intents.json changed since they were filled. Must be
+    # called with the lock held.
+    def _check_version(self, model_version, snapshot, preprocessor):
+        version = (model_version, snapshot.digest)
+        if version == self._version:
+            return
+        if self._version is not None:
+            self.invalidations += 1
+            metrics.inc('cache_invalidations')
+        self._entries.clear()
+        self._index = self.build_index(snapshot, preprocessor)
+        self._version = version
+
+
+    # Looks up a list of messages. Returns, for each one, its cached result (intent, response and
+    # probability) or None. The probability of an exact match is None, since the model was not run.
+    # preprocessor is the one of the model (see model_preprocessor).
+    def lookup(self, messages, model_version, snapshot, preprocessor=None):
+        keys = [normalize_message(message, preprocessor) for message in messages]
+        results = []
+        now = time.monotonic()
+        exact_hits = hits = 0
+        with self._lock:
+            self._check_version(model_version, snapshot, preprocessor)
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    result, expires_at = entry
+                    if expires_at is None or now < expires_at:
+                        self._entries.move_to_end(key)
+                        hits += 1
+                        results.append(dict(result))
+                        continue
+                    del self._entries[key]
+                    self.expirations += 1
+                intent = self._index.get(key)
+                if intent is not None:
+                    exact_hits += 1
+                    results.append({'intent': intent, 'response': snapshot.intent_map[intent],
+                                    'probability': None})
+                else:
+                    results.append(None)
+            self.hits += hits
+            self.exact_hits += exact_hits
+            self.misses += len(keys) - hits - exact_hits
+        metrics.inc('cache_hits', hits)
+        metrics.inc('cache_exact_hits', exact_hits)
+        metrics.inc('cache_misses', len(keys) - hits - exact_hits)
+        return results
+
+
+    # Stores the results of the model for a list of messages, evicting the least recently used
+    # entries when the cache is full
+    def store(self, messages, results, model_version, snapshot, preprocessor=None):
+        if not self.max_size:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            # The model or intents.json changed while the messages were being scored
+            if self._version != (model_version, snapshot.digest):
+                return
+            for message, result in zip(messages, results):
+                key = normalize_message(message, preprocessor)
+                self._entries[key] = (dict(result), expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+    # Empties the cache, the index is rebuilt on the next lookup
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index = {}
+            self._version = None
+
+
+    # Returns the counters of the cache
+    def stats(self):
+        lookups = self.exact_hits + self.hits + self.misses
+        return {
+            'exact_hits': self.exact_hits,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round((self.exact_hits + self.hits) / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'index_size': len(self._index),
+        }
@@ -0,0 +1,300 @@
+'''
+Pre-fork multi-process serving. A single Python process is limited by the GIL to one core, so the
+supervisor loads the classifier once, binds the listening socket and forks N workers that run the
+usual InferenceServer on that shared socket. The workers inherit the loaded model: the arrays of a
+compact model are memory-mapped from the same files, and the objects of a pickled pipeline are
+shared copy-on-write (they are frozen out of the garbage collector before forking so the children
+do not touch their pages), so memory per worker stays flat.
+
+Each worker accepts one connection at a time from the shared socket, so a busy worker leaves the
+new connections to the idle ones. The supervisor:
+    - restarts a worker that exits unexpectedly
+    - watches data/ and models/ like ModelWatcher, and when they change (or on SIGHUP) it prepares
+      the new model in a child process, which retrains it if there is a training file, so the
+      supervisor keeps restarting workers meanwhile. Then it loads the new model once and rolls
+      the workers: a new generation is forked and starts accepting, then the old one is asked to
+      stop (SIGTERM), closes its idle connections, finishes the requests in progress and exits
+    - stops all the workers on SIGTERM or Ctrl+C
+
+The /metrics endpoint reports the metrics of the worker that answers the request. The exporters of
+src/metrics.py are started in every worker, not in the supervisor, which serves no messages: worker
+i exports its metrics on CHATBOT_METRICS_PORT + i.
+
+Usage: python -m src.server --workers 4 [other options of src.server]
+'''
+
+import os
+import gc
+import time
+import signal
+import socket
+import asyncio
+
+from constants import MODEL_WATCH_INTERVAL, PREFORK_GRACEFUL_TIMEOUT, PREFORK_RESTART_DELAY
+from src import chatbot
+from src.server import InferenceServer
+from src.model_watcher import ModelWatcher
+from src.intent_classifier_model import IntentClassifier
+from src.metrics import start_exporters, stop_exporters
+
+
+# Seconds between two iterations of the supervisor loop
+SUPERVISOR_TICK = 0.2
+# Seconds a worker waits before accepting a new connection for each connection it already serves
+ACCEPT_DELAY_PER_CONNECTION = 0.001
+
+
+# Binds the listening socket shared by all the workers
+def create_listening_socket(host, port, backlog=1024):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+# Accepts the connections of the shared socket one at a time and serves them. A worker waits a
+# little before accepting in proportion to the connections it already serves, so the idle workers
+# take the new ones first.
+async def accept_connections(server, sock):
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    while True:
+        if server.connections:
+            await asyncio.sleep(ACCEPT_DELAY_PER_CONNECTION * len(server.connections))
+        connection, _ = await loop.sock_accept(sock)
+        reader, writer = await asyncio.open_connection(sock=connection)
+        task = loop.create_task(server.handle_connection(reader, writer))
+        # Keep a reference until the connection is closed
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+
+# Body of a worker process. Serves the shared socket until it receives SIGTERM, then finishes the
+# requests in progress and returns. worker is the number of the worker, used by the exporters.
+async def run_worker(sock, options, worker=None, graceful_timeout=PREFORK_GRACEFUL_TIMEOUT):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stop.set)
+    start_exporters(worker)
+    server = InferenceServer(watch=False, **options)
+    # The classifier was loaded by the supervisor, this only starts the batcher
+    await server.prepare()
+    accept = loop.create_task(accept_connections(server, sock))
+    await stop.wait()
+    accept.cancel()
+    # The worker that replaces this one exports the metrics from now on
+    stop_exporters()
+    if not await server.drain(graceful_timeout):
+        print(f"Proceso {os.getpid()}: se cerraron conexiones con peticiones en curso.")
+    await server.stop()
+
+
+class PreforkSupervisor:
+
+    # Constructor. args are the command line options of src.server.
+    def __init__(self, args):
+        self.host = args.host
+        self.port = args.port
+        self.workers = args.workers
+        self.options = {
+            'max_batch_size': args.max_batch_size,
+            'max_wait_ms': args.max_wait_ms,
+            'max_queue_size': args.max_queue_size,
+        }
+        # The supervisor checks the directories itself, without a watcher thread, so it never
+        # forks while another thread holds a lock
+        self.watcher = ModelWatcher() if args.watch else None
+        self.sock = None
+        # pid -> (generation, start time, worker number) of every running worker
+        self.children = {}
+        # pid of the process that prepares a new model, if there is one
+        self.builder = None
+        self.generation = 0
+        self.restarts = 0
+        self.rolls = 0
+        self._stopping = False
+        self._roll_requested = False
+
+
+    # Forks a worker of the current generation. worker is its number, from 0 to workers - 1.
+    def spawn(self, worker):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                # Ctrl+C reaches the whole process group, the supervisor decides when to stop
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                signal.signal(signal.SIGHUP, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                asyncio.run(run_worker(self.sock, self.options, worker))
+            except BaseException as e:
+                print(f"Error en el proceso {os.getpid()}: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = (self.generation, time.monotonic(), worker)
+        return pid
+
+
+    # Moves the objects loaded so far out of the garbage collector, so the collections of the
+    # workers do not write to the pages they share with the supervisor
+    @staticmethod
+    def freeze():
+        gc.collect()
+        gc.freeze()
+
+
+    # Collects the workers that exited. A worker of the current generation that exits is replaced,
+    # waiting a little if it crashed right after starting. When the process that prepares a new
+    # model exits, the model is loaded and the workers are rolled.
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid == self.builder:
+                self.builder = None
+                if not self._stopping:
+                    self.reload(os.waitstatus_to_exitcode(status) == 0)
+                continue
+            generation, started, worker = self.children.pop(pid, (None, 0, None))
+            # Workers of an old generation exit after draining
+            if generation != self.generation or self._stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            print(f"El proceso {pid} terminó inesperadamente (código {code}), se inicia uno nuevo.")
+            self.restarts += 1
+            if time.monotonic() - started < PREFORK_RESTART_DELAY:
+                time.sleep(PREFORK_RESTART_DELAY)
+            self.spawn(worker)
+
+
+    # Prepares the new model in a child process. Building it retrains the model if there is a
+    # training file, which can take long, and the supervisor has to keep reaping and restarting
+    # the workers meanwhile. The new model is saved and registered, so loading it afterwards is fast.
+    def build(self):
+        print("Se detectaron cambios en los datos o modelos, preparando un nuevo modelo...")
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                signal.signal(signal.SIGHUP, signal.SIG_IGN)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                code = 0 if IntentClassifier().model else 1
+            except BaseException as e:
+                print(f"Error al preparar el nuevo modelo: {e}")
+            finally:
+                os._exit(code)
+        self.builder = pid
+
+
+    # Loads the model prepared by the builder process in the supervisor and, if it could be loaded,
+    # rolls the workers
+    def reload(self, built=True):
+        if built:
+            gc.unfreeze()
+            new_classifier = chatbot.reload_classifier()
+            self.freeze()
+        else:
+            print("No fue posible preparar el nuevo modelo, se mantiene el actual.")
+            new_classifier = None
+        if self.watcher:
+            self.watcher.acknowledge()
+        if new_classifier is not None:
+            self.roll()
+
+
+    # Replaces every worker with a new one. The new generation starts accepting connections before
+    # the old one is asked to stop, so no connection is refused during the roll.
+    def roll(self):
+        old = [pid for pid, (generation, _, _) in self.children.items()
+                if generation == self.generation]
+        self.generation += 1
+        for worker in range(self.workers):
+            self.spawn(worker)
+        for pid in old:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        self.rolls += 1
+        print(f"Procesos renovados (generación {self.generation}).")
+
+
+    # Stops every worker, waiting for them to finish their requests, and the process that prepares a
+    # new model if there is one
+    def shutdown(self):
+        # The workers that exit from now on are not replaced, also when the loop ended with an error
+        self._stopping = True
+        processes = list(self.children) + ([self.builder] if self.builder else [])
+        for pid in processes:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + PREFORK_GRACEFUL_TIMEOUT + 5
+        while (self.children or self.builder) and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        for pid in list(self.children) + ([self.builder] if self.builder else []):
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.children.clear()
+        self.builder = None
+        self.sock.close()
+
+
+    # Handler of SIGTERM and SIGINT
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+
+    # Handler of SIGHUP
+    def _request_roll(self, signum, frame):
+        self._roll_requested = True
+
+
+    # Loads the model, forks the workers and supervises them until SIGTERM or Ctrl+C
+    def run(self):
+        self.sock = create_listening_socket(self.host, self.port)
+        # The exporters are started by the workers, the metrics are recorded there
+        if chatbot.get_or_train_classifier(exporters=False) is None:
+            self.sock.close()
+            raise Exception("No se pudo cargar el clasificador.")
+        if self.watcher:
+            self.watcher.acknowledge()
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGHUP, self._request_roll)
+        self.freeze()
+        for worker in range(self.workers):
+            self.spawn(worker)
+        print(f"Servidor de inferencia escuchando en http://{self.host}:{self.port} "
+                f"con {self.workers} procesos")
+        next_check = time.monotonic() + MODEL_WATCH_INTERVAL
+        try:
+            while not self._stopping:
+                time.sleep(SUPERVISOR_TICK)
+                self.reap()
+                # Only one new model is prepared at a time
+                if self.builder is not None:
+                    continue
+                if self._roll_requested:
+                    self._roll_requested = False
+                    self.build()
+                elif self.watcher and time.monotonic() >= next_check:
+                    next_check = time.monotonic() + MODEL_WATCH_INTERVAL
+                    if self.watcher.poll():
+                        self.build()
+        finally:
+            self.shutdown()
+            print("Servidor detenido.")
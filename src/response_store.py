@@ -0,0 +1,111 @@
+'''
+In-memory store of the intent -> response map defined in intents.json. The file is read, parsed
+and validated once, and it is only reloaded when its modification time or its content hash
+changes, so answering a message does not require any disk I/O or JSON parsing.
+'''
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import namedtuple
+
+from constants import RESPONSE_STORE_CHECK_INTERVAL
+from src.utils import validate_json_structure
+from src.metrics import metrics
+
+
+# Immutable version of the loaded file. A new one is built completely before being published, so
+# readers always see either the old map or the new one, never a half-built dictionary.
+Snapshot = namedtuple('Snapshot', ['mtime_ns', 'size', 'digest', 'data', 'intent_map', 'loaded_at'])
+
+
+class ResponseStore:
+
+    # Constructor. Loads the intents file for the first time.
+    def __init__(self, file_path, check_interval=RESPONSE_STORE_CHECK_INTERVAL):
+        self.file_path = file_path
+        # Minimum number of seconds between two checks of the file on disk
+        self.check_interval = check_interval
+        # Counters exposed through stats()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.failed_reloads = 0
+        # Only writers take the lock, readers just read the current snapshot reference
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._last_check = 0.0
+        self.reload(force=True)
+
+
+    # Reads the file again if its modification time or its content changed. Returns True if a
+    # new snapshot was published.
+    def reload(self, force=False):
+        with self._lock:
+            self._last_check = time.monotonic()
+            current = self._snapshot
+            try:
+                stat = os.stat(self.file_path)
+                # Nothing changed on disk since the last load
+                if (not force and current and stat.st_mtime_ns == current.mtime_ns
+                        and stat.st_size == current.size):
+                    return False
+                with open(self.file_path, 'rb') as f:
+                    raw = f.read()
+                digest = hashlib.sha256(raw).hexdigest()
+                # The file was touched or copied but its content is the same
+                if current and digest == current.digest:
+                    self._snapshot = current._replace(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                    return False
+                with metrics.timer('response_reload'):
+                    data = json.loads(raw.decode('utf-8'))
+                    if not validate_json_structure(data):
+                        raise ValueError(f"La estructura del archivo {self.file_path} no es válida.")
+                    # Create a dictionary to quickly search for answers
+                    intent_map = {item['intent']: item.get('response') for item in data['intents']}
+                # Publish the new snapshot with a single reference assignment
+                self._snapshot = Snapshot(stat.st_mtime_ns, stat.st_size, digest, data,
+                                            intent_map, time.time())
+                self.reloads += 1
+                metrics.inc('response_reloads')
+                return True
+            except Exception as e:
+                self.failed_reloads += 1
+                metrics.inc('errors')
+                # Keep answering with the previous version if there is one
+                if current is None:
+                    raise Exception(f"Error al cargar las respuestas desde {self.file_path}: {e}")
+                print(f"Error al recargar {self.file_path}, se mantiene la versión anterior: {e}")
+                return False
+
+
+    # Returns the current snapshot, checking the file on disk at most once per check_interval
+    def snapshot(self):
+        if time.monotonic() - self._last_check >= self.check_interval:
+            self.reload()
+        return self._snapshot
+
+
+    # Returns the response corresponding to the intent or None if the intent does not exist
+    def get_response(self, intent):
+        response = self.snapshot().intent_map.get(intent)
+        if response:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return response
+
+
+    # Returns the counters of the store
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads,
+            'failed_reloads': self.failed_reloads,
+            'intents': len(snapshot.intent_map) if snapshot else 0,
+            'digest': snapshot.digest if snapshot else None,
+        }
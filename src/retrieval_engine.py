@@ -0,0 +1,160 @@
+'''
+Nearest-example retrieval engine, an alternative to MultinomialNB (CLASSIFIER_ENGINE =
+'retrieval'). Every training example is indexed with its TF-IDF weights in a sparse inverted index
+(term -> postings of examples and weights). A message is answered with the k most similar training
+examples by cosine similarity and their intents, so every prediction comes with its evidence and a
+confidence: the similarity of the closest example. Below unknown_threshold the message is answered
+with the "unknown intent" fallback.
+
+The postings are scored term at a time, starting with the terms that can add the most to the
+score. As soon as the k-th best partial score is higher than everything the remaining terms could
+add, no example that has not been seen yet can reach the top k, so the rest of the postings (the
+long ones of the most common, least informative terms) are skipped and only the candidates already
+found are scored exactly.
+
+It has the same interface as CompactPredictor (transform, predict_transformed,
+predict_proba_transformed, classes_), so IntentClassifier uses it without knowing which engine it
+has.
+'''
+
+import numpy as np
+import scipy.sparse as sp
+
+from constants import RETRIEVAL_TOP_K, RETRIEVAL_UNKNOWN_THRESHOLD
+from src.text_normalization import default_normalizer
+
+
+class RetrievalClassifier:
+
+    # Constructor
+    def __init__(self, top_k=RETRIEVAL_TOP_K, unknown_threshold=RETRIEVAL_UNKNOWN_THRESHOLD):
+        self.top_k = top_k
+        # Minimum similarity of the closest example to accept its intent
+        self.unknown_threshold = unknown_threshold
+
+
+    # Returns the settings of the engine, so sklearn.base.clone can build an unfitted copy
+    def get_params(self, deep=True):
+        return {'top_k': self.top_k, 'unknown_threshold': self.unknown_threshold}
+
+
+    # Changes the settings of the engine
+    def set_params(self, **params):
+        for name, value in params.items():
+            setattr(self, name, value)
+        return self
+
+
+    # Indexes the training examples
+    def fit(self, X_train, y_train):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        self.vectorizer = TfidfVectorizer(dtype=np.float32, preprocessor=default_normalizer())
+        # One l2-normalized row per example, so the dot product is the cosine similarity
+        self.examples_matrix = self.vectorizer.fit_transform(X_train).tocsr()
+        self.examples_matrix.sort_indices()
+        # Inverted index: one row of postings per term
+        self.postings = self.examples_matrix.T.tocsr()
+        # Largest weight of each term in any example, bounds what a term can add to a score
+        self.max_weight = self.postings.max(axis=1).toarray().ravel()
+        self.classes_, self.example_labels = np.unique(np.asarray(y_train, dtype=str),
+                                                        return_inverse=True)
+        self.examples = list(X_train)
+        return self
+
+
+    # Vectorizes a list of messages
+    def transform(self, messages):
+        return self.vectorizer.transform(messages)
+
+
+    # Returns the positions and cosine similarities of the k training examples most similar to
+    # one vectorized message, from the most to the least similar
+    def search_vector(self, columns, weights, k):
+        if not columns.size:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+        # Terms in decreasing order of the most they can add to a score
+        bounds = weights * self.max_weight[columns]
+        order = np.argsort(-bounds)
+        columns, weights, bounds = columns[order], weights[order], bounds[order]
+        # remaining[i]: the most that the terms from i on can add to any score
+        remaining = np.append(np.cumsum(bounds[::-1])[::-1], 0.0)
+        ids = np.empty(0, dtype=np.intp)
+        scores = np.empty(0, dtype=np.float32)
+        stop = len(columns)
+        for position, (column, weight) in enumerate(zip(columns, weights)):
+            if len(ids) >= k:
+                threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+                # Early termination: an example not seen yet can score at most remaining[position]
+                if threshold >= remaining[position]:
+                    stop = position
+                    break
+            start, end = self.postings.indptr[column], self.postings.indptr[column + 1]
+            ids = np.concatenate((ids, self.postings.indices[start:end]))
+            scores = np.concatenate((scores, self.postings.data[start:end] * weight))
+            ids, inverse = np.unique(ids, return_inverse=True)
+            scores = np.bincount(inverse, weights=scores).astype(np.float32)
+        if stop < len(columns) and len(ids) > k:
+            # Only the candidates that can still reach the k-th score are scored exactly
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+            ids = ids[scores + remaining[stop] >= threshold]
+        if stop < len(columns):
+            query = sp.csr_matrix((weights, (np.zeros(len(columns), dtype=np.intp), columns)),
+                                    shape=(1, self.examples_matrix.shape[1]))
+            scores = (self.examples_matrix[ids] @ query.T).toarray().ravel()
+        if len(ids) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        return ids[order], scores[order]
+
+
+    # Returns, for each vectorized message, its k most similar training examples
+    def search_transformed(self, X, k=None):
+        k = k or self.top_k
+        X = X.tocsr()
+        return [self.search_vector(X.indices[X.indptr[row]:X.indptr[row + 1]],
+                                    X.data[X.indptr[row]:X.indptr[row + 1]], k)
+                for row in range(X.shape[0])]
+
+
+    # Returns, for each message, its k most similar training examples with their intent and
+    # similarity
+    def search(self, messages, k=None):
+        return [
+            [{'example': self.examples[index], 'intent': str(self.classes_[self.example_labels[index]]),
+                'similarity': float(score)} for index, score in zip(ids, scores)]
+            for ids, scores in self.search_transformed(self.transform(messages), k)
+        ]
+
+
+    # Returns, for each vectorized message, the similarity of the closest example of each intent
+    # among its k nearest examples (0 for the intents that are not among them). It is not a
+    # probability distribution: the value of the predicted intent is the confidence.
+    def predict_proba_transformed(self, X):
+        scores = np.zeros((X.shape[0], len(self.classes_)))
+        for row, (ids, similarities) in enumerate(self.search_transformed(X)):
+            np.maximum.at(scores[row], self.example_labels[ids], similarities)
+        return scores
+
+
+    # Predicts the intent of each vectorized message: the intent of its closest example
+    def predict_transformed(self, X):
+        return self.classes_[self.predict_proba_transformed(X).argmax(axis=1)]
+
+
+    # Predicts the intent of each message
+    def predict(self, messages):
+        return self.predict_transformed(self.transform(messages))
+
+
+    # Returns the similarity of each intent for each message
+    def predict_proba(self, messages):
+        return self.predict_proba_transformed(self.transform(messages))
+
+
+    # Returns the memory used by the index in bytes
+    def memory_usage(self):
+        matrices = (self.examples_matrix, self.postings)
+        return (sum(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in matrices)
+                + self.max_weight.nbytes + self.example_labels.nbytes
+                + sum(len(example) for example in self.examples))
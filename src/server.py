@@ -0,0 +1,457 @@
+'''
+Asynchronous HTTP/JSON inference service built only on the standard library (asyncio). Messages
+that arrive within a short window are grouped into a single vectorized predict_batch call and the
+results are sent back to each client. The queue of pending messages is bounded, when it is full
+new requests are rejected with 503 so that clients back off instead of piling up latency.
+
+Usage: python -m src.server [--host HOST] [--port PORT] [--max-batch-size N] [--max-wait-ms MS]
+                            [--max-queue-size N] [--no-watch] [--workers N]
+
+Endpoints:
+    POST /predict   {"message": "..."} or {"messages": ["...", "..."]}, with an optional
+                    "tenant" to use the bot of a customer (see src/tenants.py)
+    GET  /metrics   latency percentiles, batch sizes, counters and prediction cache stats in JSON
+    GET  /metrics/prometheus   per-stage histograms and counters in Prometheus text format
+    GET  /health    200 when the classifier is loaded
+'''
+
+import os
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+
+from constants import SERVER_HOST, SERVER_PORT, SERVER_MAX_BATCH_SIZE, SERVER_MAX_WAIT_MS
+from constants import SERVER_MAX_QUEUE_SIZE, SERVER_LATENCY_WINDOW, SERVER_MAX_BODY_SIZE
+from constants import SERVER_READ_TIMEOUT
+from src.chatbot import get_or_train_classifier, get_classifier, tenant_manager
+from src.tenants import TenantNotFoundError
+from src.model_watcher import ModelWatcher
+from src.metrics import metrics as stage_metrics
+
+
+# Raised when the queue of pending messages is full
+class QueueFullError(Exception):
+    pass
+
+
+class LatencyMetrics:
+
+    # Constructor. Keeps the most recent latencies in a bounded window.
+    def __init__(self, window=SERVER_LATENCY_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.requests = 0
+        self.messages = 0
+        self.rejected = 0
+        self.errors = 0
+        self.batches = 0
+
+
+    # Records the latency in seconds of one message
+    def observe(self, seconds):
+        self.latencies.append(seconds)
+
+
+    # Returns the value below which the given percentage of the latencies falls
+    @staticmethod
+    def percentile(values, percent):
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+    # Returns the metrics as a dictionary ready to be serialized to JSON
+    def to_dict(self, queue_size=0):
+        latencies = list(self.latencies)
+        batch_sizes = list(self.batch_sizes)
+        return {
+            'requests': self.requests,
+            'messages': self.messages,
+            'batches': self.batches,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'queue_size': queue_size,
+            'latency_ms': {
+                'p50': self.percentile(latencies, 50) * 1000,
+                'p99': self.percentile(latencies, 99) * 1000,
+                'max': max(latencies, default=0.0) * 1000,
+            },
+            'batch_size': {
+                'mean': sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0.0,
+                'max': max(batch_sizes, default=0),
+            },
+        }
+
+
+class MicroBatcher:
+
+    # Constructor. The queue is created lazily because it must belong to the running event loop.
+    def __init__(self, max_batch_size=SERVER_MAX_BATCH_SIZE, max_wait_ms=SERVER_MAX_WAIT_MS,
+                    max_queue_size=SERVER_MAX_QUEUE_SIZE, metrics=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.metrics = metrics or LatencyMetrics()
+        self.queue = None
+        self._worker = None
+
+
+    # Starts the task that groups the queued messages into batches
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        # Messages taken from the queue by the task and not answered yet
+        self._batch = []
+        self._start_worker()
+
+
+    # Creates the batching task
+    def _start_worker(self):
+        self._worker = asyncio.create_task(self._run())
+        self._worker.add_done_callback(self._worker_done)
+
+
+    # Called when the batching task ends. If it died with an error, the messages it had taken and
+    # the queued ones are failed with that error, so no request waits forever, and a new task is
+    # started to serve the next requests.
+    def _worker_done(self, task):
+        if task.cancelled() or task.exception() is None:
+            return
+        error = task.exception()
+        self.metrics.errors += 1
+        stage_metrics.inc('errors')
+        print(f"Error en la tarea de procesamiento por lotes, se reinicia: {error}")
+        items = self._batch
+        while not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        for _, future, _, _ in items:
+            if not future.done():
+                future.set_exception(Exception(f"Error al procesar el lote de mensajes: {error}"))
+        self._batch = []
+        self._start_worker()
+
+
+    # Stops the batching task
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+
+    # Queues the messages of a tenant (None for the default classifier) and waits for their
+    # results. Raises QueueFullError if there is no room for all of them.
+    async def submit(self, messages, tenant=None):
+        if self.queue.maxsize - self.queue.qsize() < len(messages):
+            self.metrics.rejected += 1
+            raise QueueFullError("La cola de mensajes está llena, intente más tarde.")
+        loop = asyncio.get_running_loop()
+        futures = []
+        for message in messages:
+            future = loop.create_future()
+            self.queue.put_nowait((message, future, time.perf_counter(), tenant))
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+
+    # Takes messages from the queue until the batch is full or the waiting window expires, then
+    # classifies the whole batch in a worker thread so the event loop keeps accepting requests.
+    # The messages of each tenant are classified together with the classifier of the tenant.
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch = batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Also take whatever is already waiting, without waiting any longer
+            while len(batch) < self.max_batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[3], []).append(item)
+            await asyncio.gather(*(self._process(loop, tenant, items)
+                                    for tenant, items in groups.items()))
+            self._batch = []
+
+
+    # Classifies the messages of one tenant and sets the results of their futures
+    async def _process(self, loop, tenant, items):
+        messages = [message for message, _, _, _ in items]
+        try:
+            results = await loop.run_in_executor(None, self._predict, messages, tenant)
+        except Exception as e:
+            self.metrics.errors += 1
+            for _, future, _, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.metrics.batches += 1
+        self.metrics.batch_sizes.append(len(items))
+        now = time.perf_counter()
+        for (_, future, queued_at, _), result in zip(items, results):
+            self.metrics.observe(now - queued_at)
+            stage_metrics.observe('server_request', now - queued_at)
+            if not future.done():
+                future.set_result(result)
+
+
+    # Classifies a list of messages with the current classifier of the tenant. Counted, timed and
+    # sampled by the profiler like process_messages.
+    @staticmethod
+    def _predict(messages, tenant=None):
+        stage_metrics.inc('messages', len(messages))
+        try:
+            with stage_metrics.profile(), stage_metrics.timer('process_messages'):
+                with stage_metrics.timer('classifier_lookup'):
+                    classifier = get_classifier(tenant)
+                if classifier is None:
+                    raise Exception("No se pudo cargar el clasificador.")
+                return classifier.predict_batch(messages)
+        except Exception:
+            stage_metrics.inc('errors')
+            raise
+
+
+class InferenceServer:
+
+    # Constructor
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, watch=True, **batcher_options):
+        self.host = host
+        self.port = port
+        self.batcher = MicroBatcher(**batcher_options)
+        self.server = None
+        # Publishes new models in the background when data/ or models/ change
+        self.watcher = ModelWatcher() if watch else None
+        # Writers of the open connections, and of those waiting for their next request
+        self.connections = set()
+        self.idle = set()
+        # Set by drain(), the connections are closed after their current request
+        self.closing = False
+        # Limits of a request, see SERVER_MAX_BODY_SIZE and SERVER_READ_TIMEOUT
+        self.max_body_size = SERVER_MAX_BODY_SIZE
+        self.read_timeout = SERVER_READ_TIMEOUT
+
+
+    # Loads the classifier and starts the batcher, without listening yet
+    async def prepare(self):
+        loop = asyncio.get_running_loop()
+        # The model is loaded before accepting connections so the first request is not slow
+        if await loop.run_in_executor(None, get_or_train_classifier) is None:
+            raise Exception("No se pudo cargar el clasificador.")
+        self.batcher.start()
+        if self.watcher:
+            self.watcher.start()
+
+
+    # Loads the classifier, starts the batcher and starts listening. If sock is given, the server
+    # accepts connections on that already bound socket instead of binding host and port.
+    async def start(self, sock=None):
+        await self.prepare()
+        if sock is not None:
+            self.server = await asyncio.start_server(self.handle_connection, sock=sock)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        return self.server
+
+
+    # Stops listening and stops the batcher
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.batcher.stop()
+        if self.watcher:
+            await asyncio.get_running_loop().run_in_executor(None, self.watcher.stop)
+
+
+    # Closes the idle connections and waits up to timeout seconds for the requests in progress.
+    # The connections that are still busy are closed after sending their response.
+    async def drain(self, timeout):
+        self.closing = True
+        for writer in list(self.idle):
+            writer.close()
+        deadline = time.monotonic() + timeout
+        while self.connections and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return not self.connections
+
+
+    # Serves the requests of one connection. Connections are kept alive between requests, and
+    # closed when a client is slower than read_timeout to send a request.
+    async def handle_connection(self, reader, writer):
+        self.connections.add(writer)
+        try:
+            while not self.closing:
+                self.idle.add(writer)
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.read_timeout)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError,
+                        asyncio.TimeoutError):
+                    break
+                finally:
+                    self.idle.discard(writer)
+                lines = head.decode('latin-1').split("\r\n")
+                try:
+                    method, path, _ = lines[0].split(" ", 2)
+                except ValueError:
+                    await self.send(writer, 400, {'error': 'Petición HTTP inválida.'}, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                body = b""
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                    if length < 0:
+                        raise ValueError
+                except ValueError:
+                    # Without a valid length the body cannot be skipped, the connection is closed
+                    await self.send(writer, 400, {'error': 'Cabecera Content-Length inválida.'}, False)
+                    break
+                if length > self.max_body_size:
+                    # The body is not read, the connection is closed
+                    await self.send(writer, 413, {'error': f"El cuerpo de la petición supera el "
+                                                            f"máximo de {self.max_body_size} bytes."},
+                                    False)
+                    break
+                if length:
+                    try:
+                        body = await asyncio.wait_for(reader.readexactly(length), self.read_timeout)
+                    except asyncio.TimeoutError:
+                        await self.send(writer, 408, {'error': 'Tiempo de espera agotado.'}, False)
+                        break
+                keep_alive = headers.get('connection', '').lower() != 'close' and not self.closing
+                status, payload = await self.route(method, path, body)
+                await self.send(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.idle.discard(writer)
+            self.connections.discard(writer)
+            writer.close()
+
+
+    # Dispatches a request and returns the HTTP status and the JSON payload
+    async def route(self, method, path, body):
+        metrics = self.batcher.metrics
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok', 'pid': os.getpid()}
+        if method == 'GET' and path == '/metrics':
+            payload = metrics.to_dict(self.batcher.queue.qsize())
+            classifier = get_or_train_classifier()
+            if classifier is not None and classifier.prediction_cache is not None:
+                payload['prediction_cache'] = classifier.prediction_cache.stats()
+            payload['tenants'] = tenant_manager.stats()
+            return 200, payload
+        if method == 'GET' and path == '/metrics/prometheus':
+            return 200, stage_metrics.to_prometheus()
+        if method != 'POST' or path != '/predict':
+            return 404, {'error': f"Ruta no encontrada: {method} {path}"}
+        metrics.requests += 1
+        try:
+            request = json.loads(body or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("Se esperaba un objeto JSON.")
+            single = 'message' in request
+            messages = [request['message']] if single else request.get('messages')
+            if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+                raise ValueError("Se esperaba 'message' (texto) o 'messages' (lista de textos).")
+            tenant = request.get('tenant')
+            if tenant is not None and not isinstance(tenant, str):
+                raise ValueError("'tenant' debe ser un texto.")
+        except (ValueError, AttributeError) as e:
+            return 400, {'error': f"{e}"}
+        if not messages:
+            return 200, {'results': []}
+        try:
+            if tenant is not None:
+                # A cold tenant is loaded here, outside the batcher, so it does not delay the
+                # messages of the other tenants
+                await asyncio.get_running_loop().run_in_executor(None, tenant_manager.get, tenant)
+            results = await self.batcher.submit(messages, tenant)
+        except QueueFullError as e:
+            return 503, {'error': f"{e}"}
+        except TenantNotFoundError as e:
+            return 404, {'error': f"{e}"}
+        except Exception as e:
+            return 500, {'error': f"{e}"}
+        metrics.messages += len(messages)
+        return 200, results[0] if single else {'results': results}
+
+
+    # Writes a JSON response, or a plain text one if the payload is a string
+    @staticmethod
+    async def send(writer, status, payload, keep_alive):
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 408: 'Request Timeout',
+                    413: 'Content Too Large', 500: 'Internal Server Error',
+                    503: 'Service Unavailable'}
+        if isinstance(payload, str):
+            body = payload.encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        head = (
+            f"HTTP/1.1 {status} {reasons.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+# Reads the command line options
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor HTTP de inferencia del chatbot.")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--max-batch-size', type=int, default=SERVER_MAX_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=SERVER_MAX_WAIT_MS)
+    parser.add_argument('--max-queue-size', type=int, default=SERVER_MAX_QUEUE_SIZE)
+    parser.add_argument('--no-watch', dest='watch', action='store_false',
+                        help="No recargar el modelo al detectar cambios en data/ o models/.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Número de procesos que atienden peticiones (ver src/prefork.py).")
+    return parser.parse_args(argv)
+
+
+async def serve(args):
+    server = InferenceServer(args.host, args.port, watch=args.watch,
+                                max_batch_size=args.max_batch_size,
+                                max_wait_ms=args.max_wait_ms,
+                                max_queue_size=args.max_queue_size)
+    await server.start()
+    print(f"Servidor de inferencia escuchando en http://{args.host}:{args.port}")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.workers > 1:
+        from src.prefork import PreforkSupervisor
+        PreforkSupervisor(args).run()
+    else:
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            print("Servidor detenido.")
@@ -0,0 +1,321 @@
+'''
+Content-addressed store of the versions of the datasets (intents.json and the training files),
+which replaces archiving a full copy of each file on every retraining. Inside data/snapshots/:
+
+    objects/<ab>/<sha256>.json   one intent (name, examples, response...) serialized as JSON and
+                                 named by the sha256 of its content
+    versions/<sha256>.json       one version of a dataset: the list of the hashes of its intents
+                                 and the rest of its keys, named by the sha256 of the version
+    index.jsonl                  history of the snapshots taken (name, kind, date and version), one
+                                 line per snapshot, appended without rewriting the previous ones
+    head.json                    version and file hash of the intents.json written by the last
+                                 retraining
+
+An intent that did not change between two versions is the same object, and a version that was
+already stored is the same version, so both are written only once: a snapshot writes only the
+intents that changed since the versions already stored. Hashing is also avoided: the version of
+intents.json that a retraining writes is derived from the version it extends, hashing only the
+intents the merge changed, and when the file is unchanged at the next retraining (head.json) it is
+recorded without hashing any intent. Any snapshot can be rebuilt on demand as the original
+dictionary.
+
+Usage: python -m src.snapshot_store list
+       python -m src.snapshot_store restore NAME [--output FILE]
+       python -m src.snapshot_store import [--remove]
+       python -m src.snapshot_store stats
+'''
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+
+from constants import DATA_PATH, SNAPSHOTS_PATH, OLD_TRAIN_FILES_PATH, OLD_INTENTS_FILES_PATH
+from src.utils import load_data, save_json
+
+
+SNAPSHOT_INDEX_JSONL = 'index.jsonl'
+# History written by the versions that rewrote the whole index on every snapshot, still read
+LEGACY_INDEX_JSON = 'index.json'
+SNAPSHOT_HEAD_JSON = 'head.json'
+# Kinds of datasets and the legacy archive folder of each one
+SNAPSHOT_KINDS = {
+    'intents': os.path.basename(OLD_INTENTS_FILES_PATH),
+    'train': os.path.basename(OLD_TRAIN_FILES_PATH),
+}
+
+
+# Serializes a JSON value in a stable way: the same value always gives the same bytes. The order
+# of the keys is kept, so the restored file has the same order as the original.
+def canonical_json(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+# Writes bytes to a file atomically, a reader or a crash never leaves half an object
+def write_atomic(file_path, content):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temporary = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(content)
+    os.replace(temporary, file_path)
+
+
+class SnapshotStore:
+
+    # Constructor
+    def __init__(self, snapshots_path=SNAPSHOTS_PATH):
+        self.snapshots_path = snapshots_path
+        self.objects_path = os.path.join(snapshots_path, 'objects')
+        self.versions_path = os.path.join(snapshots_path, 'versions')
+        self.index_path = os.path.join(snapshots_path, SNAPSHOT_INDEX_JSONL)
+        self.legacy_index_path = os.path.join(snapshots_path, LEGACY_INDEX_JSON)
+        self.head_path = os.path.join(snapshots_path, SNAPSHOT_HEAD_JSON)
+        self._lock = threading.Lock()
+
+
+    # Returns the path of an intent object
+    def object_path(self, digest):
+        return os.path.join(self.objects_path, digest[:2], f"{digest}.json")
+
+
+    # Returns the path of a version
+    def version_path(self, digest):
+        return os.path.join(self.versions_path, f"{digest}.json")
+
+
+    # Stores a content under its hash if it is not stored yet. Returns the hash and whether it
+    # was written.
+    @staticmethod
+    def store(content, path_of):
+        digest = hashlib.sha256(content).hexdigest()
+        file_path = path_of(digest)
+        if os.path.exists(file_path):
+            return digest, False
+        write_atomic(file_path, content)
+        return digest, True
+
+
+    # Reads the history of snapshots. A line that could not be parsed (a write interrupted by a
+    # crash) is skipped.
+    def load_index(self):
+        snapshots = []
+        try:
+            with open(self.legacy_index_path, 'r', encoding='utf-8') as f:
+                snapshots.extend(json.load(f)['snapshots'])
+        except FileNotFoundError:
+            pass
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        snapshots.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return {'snapshots': snapshots}
+
+
+    # Appends an entry to the history. It is a single write at the end of the file, the previous
+    # entries are never rewritten.
+    def append_index(self, entry):
+        os.makedirs(self.snapshots_path, exist_ok=True)
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock, open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+    # Returns the version and the file hash of the intents.json written by the last retraining, or
+    # None
+    def head(self):
+        try:
+            with open(self.head_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+
+    # Records the version of the intents.json that was just written and the hash of the file
+    def set_head(self, version, file_hash):
+        write_atomic(self.head_path, canonical_json({'version': version, 'file_hash': file_hash}))
+
+
+    # Stores the intents and the version of a dataset that are not stored yet. Returns the hash of
+    # the version and the number of intents written. With base, the hash of a stored version that
+    # data extends (the same intents in the same positions, plus new intents at the end), only the
+    # intents at the positions in changed and the new ones are serialized and hashed, the others
+    # take the hashes of base.
+    def store_version(self, data, base=None, changed=()):
+        base_chunks = []
+        if base is not None:
+            with open(self.version_path(base), 'rb') as f:
+                base_chunks = json.loads(f.read())['chunks']
+        changed = set(changed)
+        written = 0
+        chunks = []
+        for position, intent in enumerate(data['intents']):
+            if position < len(base_chunks) and position not in changed:
+                chunks.append(base_chunks[position])
+                continue
+            digest, new = self.store(canonical_json(intent), self.object_path)
+            chunks.append(digest)
+            written += new
+        version = {'chunks': chunks,
+                    'extra': {key: value for key, value in data.items() if key != 'intents'}}
+        version_digest, _ = self.store(canonical_json(version), self.version_path)
+        return version_digest, written
+
+
+    # Stores a version of a dataset and records it in the history with the given name. Only the
+    # intents and the version that are not stored yet are written. version is the hash of data if
+    # it is already stored (see head), then nothing is hashed. Returns the entry of the history.
+    def save(self, data, kind, name=None, version=None):
+        try:
+            if kind not in SNAPSHOT_KINDS:
+                raise ValueError(f"Tipo de conjunto de datos desconocido: {kind}")
+            written = 0
+            if version is None or not os.path.exists(self.version_path(version)):
+                version, written = self.store_version(data)
+            entry = {
+                'name': name or f"{datetime.now():%Y-%m-%d_%H-%M-%S}_{kind}",
+                'kind': kind,
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'version': version,
+                'intents': len(data['intents']),
+                'examples': sum(len(intent.get('examples', [])) for intent in data['intents']),
+                'written_intents': written,
+            }
+            self.append_index(entry)
+            return entry
+        except Exception as e:
+            raise Exception(f"Error al guardar la versión de los datos ({kind}): {e}")
+
+
+    # Stores a version of a dataset from its file
+    def save_file(self, file_path, kind, name=None):
+        data = load_data(file_path)
+        if data is None:
+            raise Exception(f"No se pudo leer el archivo {file_path}.")
+        return self.save(data, kind, name or os.path.basename(file_path))
+
+
+    # Returns the entries of the history, optionally only those of a kind
+    def list(self, kind=None):
+        return [entry for entry in self.load_index()['snapshots']
+                if kind is None or entry['kind'] == kind]
+
+
+    # Returns the entry of a snapshot by its name, or by the beginning of its version hash
+    def find(self, name):
+        for entry in reversed(self.list()):
+            if entry['name'] == name or (len(name) >= 8 and entry['version'].startswith(name)):
+                return entry
+        raise ValueError(f"No existe la versión {name} en {self.snapshots_path}.")
+
+
+    # Rebuilds the dictionary of a snapshot
+    def load(self, name):
+        try:
+            entry = self.find(name)
+            with open(self.version_path(entry['version']), 'rb') as f:
+                version = json.loads(f.read())
+            intents = []
+            for digest in version['chunks']:
+                with open(self.object_path(digest), 'rb') as f:
+                    intents.append(json.loads(f.read()))
+            return {'intents': intents, **version['extra']}
+        except ValueError:
+            raise
+        except Exception as e:
+            raise Exception(f"Error al reconstruir la versión {name}: {e}")
+
+
+    # Writes a snapshot as a JSON file
+    def restore(self, name, file_path):
+        save_json(self.load(name), file_path)
+        return file_path
+
+
+    # Adds the files of the legacy archive folders (full copies of every version) to the store.
+    # With remove=True the files are deleted once they are stored.
+    def import_archives(self, data_path=DATA_PATH, remove=False):
+        imported = []
+        for kind, folder in SNAPSHOT_KINDS.items():
+            directory = os.path.join(data_path, folder)
+            if not os.path.isdir(directory):
+                continue
+            known = {entry['name'] for entry in self.list(kind)}
+            for filename in sorted(os.listdir(directory)):
+                file_path = os.path.join(directory, filename)
+                if not filename.endswith('.json'):
+                    continue
+                if filename not in known:
+                    try:
+                        imported.append(self.save_file(file_path, kind, filename))
+                    except Exception as e:
+                        print(f"No se pudo importar {file_path}: {e}")
+                        continue
+                if remove:
+                    os.remove(file_path)
+        return imported
+
+
+    # Returns the number of snapshots, distinct versions and intent objects, and the bytes used
+    def stats(self):
+        sizes = {}
+        for name, path in (('objects', self.objects_path), ('versions', self.versions_path)):
+            files = [os.path.join(root, filename) for root, _, filenames in os.walk(path)
+                        for filename in filenames]
+            sizes[name] = (len(files), sum(os.path.getsize(file_path) for file_path in files))
+        return {
+            'snapshots': len(self.list()),
+            'versions': sizes['versions'][0],
+            'objects': sizes['objects'][0],
+            'bytes': sizes['objects'][1] + sizes['versions'][1],
+        }
+
+
+# Command line interface to inspect and restore the stored versions
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Versiones guardadas de los datos del chatbot.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="Lista las versiones guardadas.")
+    restore = commands.add_parser('restore', help="Reconstruye una versión como archivo JSON.")
+    restore.add_argument('name', help="Nombre de la versión o inicio de su hash.")
+    restore.add_argument('--output', help="Archivo de salida (por defecto, el nombre de la versión).")
+    import_archives = commands.add_parser('import', help=f"Importa las carpetas "
+                                            f"{', '.join(SNAPSHOT_KINDS.values())}.")
+    import_archives.add_argument('--remove', action='store_true',
+                                    help="Elimina los archivos importados.")
+    commands.add_parser('stats', help="Muestra el espacio usado.")
+    args = parser.parse_args(argv)
+
+    store = SnapshotStore()
+    try:
+        if args.command == 'list':
+            for entry in store.list():
+                print(f"{entry['name']:<40} {entry['kind']:<8} {entry['version'][:12]}  "
+                        f"intenciones: {entry['intents']}, ejemplos: {entry['examples']}")
+        elif args.command == 'restore':
+            entry = store.find(args.name)
+            output = args.output or entry['name']
+            if not output.endswith('.json'):
+                output = f"{output}.json"
+            print(f"Versión restaurada en {store.restore(args.name, output)}")
+        elif args.command == 'import':
+            imported = store.import_archives(remove=args.remove)
+            print(f"Archivos importados: {len(imported)}")
+        elif args.command == 'stats':
+            stats = store.stats()
+            print(f"Instantáneas: {stats['snapshots']}, versiones distintas: {stats['versions']}, "
+                    f"intenciones distintas: {stats['objects']}, espacio: {stats['bytes']} bytes")
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+'''
+Streaming ingestion of large training files. Instead of loading the whole document with json.load
+and building the full X_train/y_train lists, the examples are read one at a time and fed to the
+incremental trainer in fixed-size chunks, so the examples are never all in memory. Peak memory
+grows with the vocabulary and the number of intents of the file, not with its number of examples.
+
+Two formats are accepted:
+    JSON Lines (.jsonl)  one {"intent": "...", "example": "..."} object per line
+    JSON (.json)         the usual {"intents": [...]} document, parsed one intent at a time
+                         (with ijson if it is installed, otherwise with an incremental decoder)
+
+With the JSON format the largest unit kept in memory is one intent, so very large corpora should
+use JSON Lines.
+
+Usage: python -m src.streaming validate FILE
+       python -m src.streaming train FILE [--chunk-size N]
+'''
+
+import re
+import sys
+import json
+import argparse
+from itertools import islice
+
+from constants import STREAMING_CHUNK_SIZE, STREAMING_MAX_INTENT_SIZE
+from src.utils import check_intent
+
+
+# Size of the blocks read from disk by the incremental JSON decoder
+READ_BLOCK_SIZE = 1 << 16
+INTENTS_ARRAY_START = re.compile(r'"intents"\s*:\s*\[')
+
+
+# Returns whether the file uses the JSON Lines format
+def is_jsonl(file_path):
+    return file_path.endswith('.jsonl')
+
+
+# Yields the items of the "intents" array of a JSON document one at a time, reading the file in
+# blocks. Only the item being decoded is kept in memory, and an item that is still not valid JSON
+# after max_item_size characters is reported as an error instead of reading the rest of the file.
+def iter_json_intents(f, max_item_size=STREAMING_MAX_INTENT_SIZE):
+    try:
+        import ijson
+        yield from ijson.items(f, 'intents.item')
+        return
+    except ImportError:
+        pass
+    decoder = json.JSONDecoder()
+    buffer = f.read(READ_BLOCK_SIZE)
+    if not buffer.lstrip().startswith('{'):
+        raise ValueError("El archivo no es un objeto JSON.")
+    # Find the beginning of the array
+    while True:
+        match = INTENTS_ARRAY_START.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        block = f.read(READ_BLOCK_SIZE)
+        if not block:
+            raise ValueError("El archivo no contiene 'intents'.")
+        # Keep the end of the buffer in case the key was split between two blocks
+        buffer = buffer[-32:] + block
+    position = 0
+    eof = False
+    while True:
+        # Skip whitespace and commas between items
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer):
+            if buffer[position] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError as e:
+                # The item is not complete yet, unless it is already too large to be one
+                if len(buffer) - position > max_item_size:
+                    raise ValueError(f"El arreglo 'intents' no es JSON válido o contiene una "
+                                        f"intención de más de {max_item_size} caracteres: {e}")
+                end = None
+            if end is not None:
+                yield item
+                position = end
+                # Drop what was already decoded
+                if position > READ_BLOCK_SIZE:
+                    buffer = buffer[position:]
+                    position = 0
+                continue
+        if eof:
+            raise ValueError("El arreglo 'intents' está incompleto o no es JSON válido.")
+        # Read more. The amount read grows with the buffer, so a large item is decoded only a
+        # logarithmic number of times.
+        buffer = buffer[position:]
+        position = 0
+        block = f.read(max(READ_BLOCK_SIZE, len(buffer)))
+        eof = not block
+        buffer += block
+
+
+# Yields the intents of a file. In JSON Lines every line becomes an intent with a single example.
+def iter_intents(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        if not is_jsonl(file_path):
+            yield from iter_json_intents(f)
+            return
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Línea {number} no es JSON válido: {e}")
+            if not isinstance(record, dict):
+                raise ValueError(f"Línea {number}: se esperaba un objeto con 'intent' y 'example'.")
+            if 'examples' not in record:
+                record = {'intent': record.get('intent'), 'examples': [record.get('example')]}
+            yield record
+
+
+# Yields the (example, intent) pairs of a file, validating every intent as it is read. Raises
+# ValueError at the first invalid intent.
+def iter_examples(file_path):
+    empty = True
+    for intent in iter_intents(file_path):
+        if not isinstance(intent, dict):
+            raise ValueError(f"Cada intención debe ser un diccionario, se encontró: {type(intent)}")
+        check_intent(intent)
+        empty = False
+        for example in intent['examples']:
+            yield example, intent['intent']
+    if empty:
+        raise ValueError("El archivo no contiene 'intents' o está vacío.")
+
+
+# Splits the stream of examples into lists of at most chunk_size texts and intents
+def iter_chunks(file_path, chunk_size=STREAMING_CHUNK_SIZE):
+    examples = iter_examples(file_path)
+    while True:
+        chunk = list(islice(examples, chunk_size))
+        if not chunk:
+            return
+        yield [example for example, _ in chunk], [intent for _, intent in chunk]
+
+
+# Validates the structure of a file reading it as a stream. Returns a boolean, like
+# validate_json_structure does for a loaded dictionary.
+def validate_json_stream(file_path):
+    try:
+        for _ in iter_examples(file_path):
+            pass
+        return True
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Error de validación: {e}")
+        return False
+    except Exception as e:
+        print(f"Error inesperado: {e}")
+        return False
+
+
+# Command line interface
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Entrenamiento en streaming con archivos grandes.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    validate = commands.add_parser('validate', help="Valida un archivo .json o .jsonl.")
+    validate.add_argument('file')
+    train = commands.add_parser('train', help="Entrena y publica un modelo a partir de un archivo.")
+    train.add_argument('file')
+    train.add_argument('--chunk-size', type=int, default=STREAMING_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.command == 'validate':
+        valid = validate_json_stream(args.file)
+        print("El archivo es válido." if valid else "El archivo no es válido.")
+        sys.exit(0 if valid else 1)
+    from src.intent_classifier_model import IntentClassifier
+    try:
+        classifier = IntentClassifier()
+        classifier.train_from_file(args.file, args.chunk_size)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+'''
+Hosting of several bots (one per customer) in the same process. Every tenant has its own intents
+and models directories:
+
+    tenants/<tenant>/data/intents.json
+    tenants/<tenant>/data/intents_train.json   (optional, retrains the model like in data/)
+    tenants/<tenant>/models/
+
+The classifier of a tenant is loaded the first time it is used. The loaded classifiers are kept in
+least recently used order within a memory budget, and the ones that were not used for the longest
+time are evicted when it is exceeded. When several requests of a cold tenant arrive at the same
+time only one of them loads the classifier, the others wait for it.
+'''
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from constants import TENANTS_PATH, TENANT_MEMORY_BUDGET_MB, INTENTS_JSON
+from src.intent_classifier_model import IntentClassifier
+from src.metrics import metrics
+
+
+# Tenant ids are used as directory names
+TENANT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+# Raised when a tenant id is not valid or the tenant has no intents file
+class TenantNotFoundError(Exception):
+    pass
+
+
+class TenantManager:
+
+    # Constructor. memory_budget is in bytes, None means no limit.
+    def __init__(self, tenants_path=TENANTS_PATH, memory_budget=TENANT_MEMORY_BUDGET_MB * 1024 ** 2):
+        self.tenants_path = tenants_path
+        self.memory_budget = memory_budget
+        # tenant -> classifier, from the least to the most recently used
+        self._classifiers = OrderedDict()
+        self._sizes = {}
+        # tenant -> Future of the load in progress
+        self._loading = {}
+        self._lock = threading.Lock()
+        # Counters exposed through stats()
+        self.hits = 0
+        self.loads = 0
+        self.shared_loads = 0
+        self.failed_loads = 0
+        self.evictions = 0
+
+
+    # Returns the data and models directories of a tenant
+    def tenant_paths(self, tenant):
+        if not isinstance(tenant, str) or not TENANT_ID_PATTERN.match(tenant):
+            raise TenantNotFoundError(f"Identificador de cliente no válido: {tenant!r}")
+        directory = os.path.join(self.tenants_path, tenant)
+        return os.path.join(directory, 'data'), os.path.join(directory, 'models')
+
+
+    # Returns the tenants that have an intents file
+    def list_tenants(self):
+        if not os.path.isdir(self.tenants_path):
+            return []
+        return sorted(tenant for tenant in os.listdir(self.tenants_path)
+                        if TENANT_ID_PATTERN.match(tenant)
+                        and os.path.isfile(os.path.join(self.tenants_path, tenant, 'data', INTENTS_JSON)))
+
+
+    # Returns the classifier of a tenant, loading it if it is not in memory
+    def get(self, tenant):
+        with self._lock:
+            classifier = self._classifiers.get(tenant)
+            if classifier is not None:
+                self._classifiers.move_to_end(tenant)
+                self.hits += 1
+                return classifier
+            future = self._loading.get(tenant)
+            loader = future is None
+            if loader:
+                future = self._loading[tenant] = Future()
+            else:
+                self.shared_loads += 1
+        # Another request is already loading this tenant
+        if not loader:
+            return future.result()
+        # The waiting requests are always woken up, and the failed load is forgotten so the next
+        # request tries again
+        try:
+            classifier = self._load(tenant)
+            self._publish(tenant, classifier)
+        except Exception as e:
+            with self._lock:
+                self.failed_loads += 1
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(classifier)
+            return classifier
+        finally:
+            with self._lock:
+                self._loading.pop(tenant, None)
+
+
+    # Builds the classifier of a tenant. It is loaded outside the lock, so other tenants are
+    # served meanwhile.
+    def _load(self, tenant):
+        data_path, models_path = self.tenant_paths(tenant)
+        if not os.path.isfile(os.path.join(data_path, INTENTS_JSON)):
+            raise TenantNotFoundError(f"El cliente '{tenant}' no existe o no tiene {INTENTS_JSON}.")
+        print(f"Cargando el modelo del cliente '{tenant}'...")
+        with metrics.timer('tenant_load'):
+            classifier = IntentClassifier(data_path, models_path)
+        metrics.inc('tenant_loads')
+        return classifier
+
+
+    # Stores a loaded classifier and evicts the least recently used tenants while the memory
+    # budget is exceeded. The tenant that was just loaded is never evicted.
+    def _publish(self, tenant, classifier):
+        size = classifier.memory_usage()
+        with self._lock:
+            self._classifiers[tenant] = classifier
+            self._classifiers.move_to_end(tenant)
+            self._sizes[tenant] = size
+            self.loads += 1
+            while (self.memory_budget is not None and len(self._classifiers) > 1
+                    and sum(self._sizes.values()) > self.memory_budget):
+                evicted, _ = self._classifiers.popitem(last=False)
+                del self._sizes[evicted]
+                self.evictions += 1
+                metrics.inc('tenant_evictions')
+                print(f"Se liberó de memoria el modelo del cliente '{evicted}'.")
+
+
+    # Loads the classifier of a tenant again (for example after adding a training file) and
+    # replaces the one in memory. The requests in progress finish with the previous one.
+    def reload(self, tenant):
+        classifier = self._load(tenant)
+        self._publish(tenant, classifier)
+        return classifier
+
+
+    # Removes a tenant from memory, it is loaded again the next time it is used
+    def evict(self, tenant):
+        with self._lock:
+            if self._classifiers.pop(tenant, None) is None:
+                return False
+            del self._sizes[tenant]
+            return True
+
+
+    # Returns the counters of the manager and the tenants in memory
+    def stats(self):
+        with self._lock:
+            return {
+                'tenants': list(self._classifiers),
+                'memory_bytes': sum(self._sizes.values()),
+                'memory_budget_bytes': self.memory_budget,
+                'hits': self.hits,
+                'loads': self.loads,
+                'shared_loads': self.shared_loads,
+                'failed_loads': self.failed_loads,
+                'evictions': self.evictions,
+            }
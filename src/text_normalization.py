@@ -0,0 +1,126 @@
+'''
+Normalization of Spanish text, applied in the same way to the training examples, to the messages
+to predict and to the examples compared when a training file is merged. "¿Cómo estás?",
+"como estas" and "COMO ESTÁS" become the same text ("como estas"), so they share their features
+instead of each spelling adding its own terms to the vocabulary of the model:
+
+    lowercase           "COMO" -> "como"
+    accent folding      "está" -> "esta", "pingüino" -> "pinguino". The ñ is kept: "año" and "ano"
+                        are different words.
+    punctuation         ¿ ¡ and the rest of the punctuation are replaced by spaces
+    light stemming      optional (TEXT_STEMMING), removes the plural and the gender ending:
+                        "amigos", "amiga", "amigas" -> "amig"
+
+The folding and the punctuation are done with a single translation table built when the module is
+imported, and the results are memoized: the stems by token and the normalized texts by text, since
+chat messages and their words repeat a lot.
+'''
+
+import string
+import unicodedata
+from functools import lru_cache
+
+from constants import TEXT_NORMALIZATION, TEXT_STEMMING
+
+
+# Characters replaced by a space
+PUNCTUATION = string.punctuation + '¿¡«»“”‘’…–—·'
+# Letters with a diacritic that are kept as they are
+KEPT_LETTERS = 'ñÑ'
+# Number of tokens and of texts whose normalization is memoized
+TOKEN_CACHE_SIZE = 100000
+TEXT_CACHE_SIZE = 100000
+
+
+# Builds the translation table: punctuation to spaces, and every Latin letter with a diacritic
+# (except the kept ones) to its base letter
+def build_translation_table():
+    table = {character: ' ' for character in PUNCTUATION}
+    # Latin-1 Supplement, Latin Extended-A and Latin Extended-B
+    for code in range(0xC0, 0x250):
+        character = chr(code)
+        if character in KEPT_LETTERS:
+            continue
+        base = "".join(c for c in unicodedata.normalize('NFKD', character)
+                        if not unicodedata.combining(c))
+        if base and base != character:
+            table[character] = base.lower()
+    # Combining accents of texts that arrive decomposed
+    for code in range(0x300, 0x370):
+        table[chr(code)] = None
+    return str.maketrans(table)
+
+
+TRANSLATION_TABLE = build_translation_table()
+
+
+# Removes the plural and the gender ending of a normalized token. Short tokens are not changed, so
+# "los", "mes" or "tu" are kept.
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def stem_token(token):
+    if len(token) > 4 and token.endswith('ces'):
+        # "veces" -> "vez", "luces" -> "luz"
+        token = token[:-3] + 'z'
+    elif len(token) > 4 and token.endswith('es') and token[-3] not in 'aeiou':
+        token = token[:-2]
+    elif len(token) > 3 and token.endswith('s'):
+        token = token[:-1]
+    if len(token) > 3 and token[-1] in 'aeo':
+        token = token[:-1]
+    return token
+
+
+# Normalizes a text: lowercase, accent folding, punctuation removed, whitespace collapsed and,
+# with stem=True, light stemming of every token
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def normalize_text(text, stem=False):
+    if not text.isascii():
+        # Composes the letters that arrive as a base letter followed by a combining accent, so a
+        # decomposed ñ is not folded to n
+        text = unicodedata.normalize('NFC', text)
+    tokens = text.lower().translate(TRANSLATION_TABLE).split()
+    if stem:
+        tokens = [stem_token(token) for token in tokens]
+    return " ".join(tokens)
+
+
+class TextNormalizer:
+
+    # Constructor
+    def __init__(self, stem=TEXT_STEMMING):
+        self.stem = stem
+
+
+    # Normalizes a text. The normalizer is the preprocessor of the vectorizer of the models, so it
+    # is pickled with them and the model always predicts with the normalization it was trained with.
+    def __call__(self, text):
+        return normalize_text(text, self.stem)
+
+
+    # Name of the normalization, stored with the statistics and the compact models
+    @property
+    def name(self):
+        return 'fold_stem' if self.stem else 'fold'
+
+
+    def __repr__(self):
+        return f"TextNormalizer(stem={self.stem})"
+
+
+# Returns the normalizer of the new models, None if the normalization is disabled
+def default_normalizer():
+    return TextNormalizer(TEXT_STEMMING) if TEXT_NORMALIZATION else None
+
+
+# Returns the name of the normalization of a normalizer ('none' without one)
+def normalizer_name(normalizer):
+    return normalizer.name if normalizer is not None else 'none'
+
+
+# Returns the normalizer with the given name
+def normalizer_from_name(name):
+    if name in (None, 'none'):
+        return None
+    if name not in ('fold', 'fold_stem'):
+        raise ValueError(f"Normalización de texto desconocida: {name}")
+    return TextNormalizer(stem=name == 'fold_stem')
@@ -0,0 +1,197 @@
+'''
+Hyperparameter search for the TF-IDF + Naive Bayes pipeline. Every combination of the values of
+TUNING_VECTORIZER_GRID (n-grams, min_df, sublinear_tf) and TUNING_CLASSIFIER_GRID (alpha) is a
+candidate, scored by its accuracy in a stratified k-fold cross-validation of intents.json.
+
+The candidates only differ in a few vectorizer settings, so each fold is tokenized and vectorized
+once per vectorizer setting and cached on disk (the workers of src/evaluation.py); the classifiers
+are fitted on the cached matrices in a process pool. The search goes fold by fold and, after each
+fold, only the best 1 / TUNING_ELIMINATION_RATE of the candidates go on to the next one, so poor
+candidates stop early and their vectorizers are not computed for the remaining folds.
+
+The best candidate that went through every fold is saved in models/tuned_params.json, which
+create_new_model uses for every new model, and a new model trained with it on the whole corpus
+becomes the active one.
+
+Usage: python -m src.tuning [--folds 5] [--seed 0] [--workers N] [--elimination-rate 2]
+                            [--no-save] [--output FILE]
+'''
+
+import os
+import sys
+import json
+import math
+import argparse
+import itertools
+import tempfile
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from constants import DATA_PATH, MODELS_PATH, INTENTS_JSON, TUNED_PARAMS_JSON
+from constants import TUNING_VECTORIZER_GRID, TUNING_CLASSIFIER_GRID, TUNING_ELIMINATION_RATE
+from src.utils import load_data, save_json, get_training_examples
+from src.evaluation import init_worker, vectorizer_key, stratified_folds, vectorize_fold, evaluate_fold
+from src.text_normalization import default_normalizer
+
+
+# Returns every combination of the values of a grid as a list of dictionaries
+def expand_grid(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+# Creates the vectorizer and the classifier of a set of parameters
+def build_steps(params):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.naive_bayes import MultinomialNB
+    vectorizer = TfidfVectorizer(preprocessor=default_normalizer(), **params['vectorizer'])
+    return vectorizer, MultinomialNB(**params['classifier'])
+
+
+# Reads the parameters chosen by the last search, None if there was no search
+def load_tuned_params(models_path=MODELS_PATH):
+    file_path = os.path.join(models_path, TUNED_PARAMS_JSON)
+    if not os.path.isfile(file_path):
+        return None
+    try:
+        params = load_data(file_path)
+        # JSON has no tuples
+        vectorizer = dict(params['vectorizer'])
+        if 'ngram_range' in vectorizer:
+            vectorizer['ngram_range'] = tuple(vectorizer['ngram_range'])
+        return {'vectorizer': vectorizer, 'classifier': dict(params['classifier'])}
+    except Exception as e:
+        print(f"No se pudieron leer los parámetros de {file_path}, se usan los de por defecto: {e}")
+        return None
+
+
+# Searches the best parameters. Returns the candidates, best first, each with its parameters,
+# the folds it was evaluated on and its accuracy over them.
+def search(data, n_folds=5, seed=0, workers=None, vectorizer_grid=TUNING_VECTORIZER_GRID,
+            classifier_grid=TUNING_CLASSIFIER_GRID, elimination_rate=TUNING_ELIMINATION_RATE):
+    try:
+        X, y = get_training_examples(data)
+        if not X:
+            raise ValueError("No hay ejemplos para buscar los parámetros.")
+        labels = np.asarray(y, dtype=str)
+        folds = stratified_folds(y, n_folds, seed)
+        vectorizers = {}
+        candidates = []
+        for vectorizer_params in expand_grid(vectorizer_grid):
+            vectorizer, _ = build_steps({'vectorizer': vectorizer_params, 'classifier': {}})
+            key = vectorizer_key(vectorizer)
+            vectorizers[key] = vectorizer
+            for classifier_params in expand_grid(classifier_grid):
+                candidates.append({'params': {'vectorizer': vectorizer_params,
+                                                'classifier': classifier_params},
+                                    'key': key, 'hits': 0, 'examples': 0, 'folds': 0})
+
+        alive = list(candidates)
+        with tempfile.TemporaryDirectory() as cache_path, \
+                ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                    initargs=(X, y)) as executor:
+            for fold, (train, test) in enumerate(folds):
+                # The fold is vectorized only for the vectorizers that still have candidates
+                keys = {candidate['key'] for candidate in alive}
+                for future in [executor.submit(vectorize_fold, cache_path, key, fold,
+                                                vectorizers[key], train, test) for key in keys]:
+                    future.result()
+                futures = [executor.submit(evaluate_fold, cache_path, candidate['key'], fold,
+                                            build_steps(candidate['params'])[1], train, test)
+                            for candidate in alive]
+                for candidate, future in zip(alive, futures):
+                    predicted, _ = future.result()
+                    candidate['hits'] += int(np.sum(np.asarray(predicted) == labels[test]))
+                    candidate['examples'] += len(test)
+                    candidate['folds'] += 1
+                # Early stopping: the worst candidates are not evaluated on the next folds
+                alive.sort(key=lambda candidate: -candidate['hits'] / candidate['examples'])
+                if elimination_rate and fold < len(folds) - 1:
+                    alive = alive[:math.ceil(len(alive) / elimination_rate)]
+                # The cached matrices of the vectorizers left without candidates are not needed
+                for key in keys - {candidate['key'] for candidate in alive}:
+                    for cached in range(fold + 1):
+                        os.remove(os.path.join(cache_path, f"{key}_{cached}.joblib"))
+
+        # Candidates that went through more folds first, then the most accurate. The sort is
+        # stable, ties keep the order of the grid.
+        candidates.sort(key=lambda candidate: (-candidate['folds'],
+                                                -candidate['hits'] / candidate['examples']))
+        return [{'params': candidate['params'], 'folds': candidate['folds'],
+                    'accuracy': round(candidate['hits'] / candidate['examples'], 4)}
+                for candidate in candidates]
+    except ValueError:
+        raise
+    except Exception as e:
+        raise Exception(f"Error al buscar los parámetros: {e}")
+
+
+# Saves the parameters of the best candidate, so that new models use them
+def save_tuned_params(result, n_folds, models_path=MODELS_PATH):
+    os.makedirs(models_path, exist_ok=True)
+    file_path = os.path.join(models_path, TUNED_PARAMS_JSON)
+    save_json({
+        'vectorizer': result['params']['vectorizer'],
+        'classifier': result['params']['classifier'],
+        'accuracy': result['accuracy'],
+        'folds': n_folds,
+        'created': datetime.now().isoformat(timespec='seconds'),
+    }, file_path)
+    return file_path
+
+
+# Describes the parameters of a candidate in one line
+def format_params(params):
+    return ", ".join(f"{name}={value}" for name, value in
+                        {**params['vectorizer'], **params['classifier']}.items())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Búsqueda de los parámetros de TF-IDF y Naive Bayes.")
+    parser.add_argument('--data', default=os.path.join(DATA_PATH, INTENTS_JSON),
+                        help="Corpus de intenciones para la validación cruzada.")
+    parser.add_argument('--models', default=MODELS_PATH, help="Carpeta de los modelos.")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, help="Procesos (por defecto, uno por núcleo).")
+    parser.add_argument('--elimination-rate', type=float, default=TUNING_ELIMINATION_RATE,
+                        help="Tras cada partición sigue 1/N de los candidatos (0 evalúa todos).")
+    parser.add_argument('--no-save', action='store_true',
+                        help="Solo muestra los resultados, no guarda los parámetros ni entrena.")
+    parser.add_argument('--output', help="Guarda los resultados de todos los candidatos en JSON.")
+    args = parser.parse_args(argv)
+
+    try:
+        data = load_data(args.data)
+        if data is None:
+            raise ValueError(f"No se pudo leer el archivo {args.data}.")
+        results = search(data, args.folds, args.seed, args.workers,
+                            elimination_rate=args.elimination_rate or None)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"{len(results)} candidatos, validación cruzada de {args.folds} particiones")
+    print(f"{'exactitud':>10} {'particiones':>12}  parámetros")
+    for result in results:
+        print(f"{result['accuracy']:>10.4f} {result['folds']:>12}  {format_params(result['params'])}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+        print(f"Resultados guardados en {args.output}")
+    if args.no_save:
+        return
+    print(f"Parámetros guardados en {save_tuned_params(results[0], args.folds, args.models)}")
+    from src.intent_classifier_model import IntentClassifier
+    try:
+        classifier = IntentClassifier(os.path.dirname(os.path.abspath(args.data)), args.models)
+        new_classifier = classifier.retrain()
+        print(f"Modelo entrenado con los nuevos parámetros: {new_classifier.model_filename}")
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
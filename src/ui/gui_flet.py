@@ -1,5 +1,5 @@
-''' 
-To resolve the issue of not finding the /src folder when importing functions, change the current 
+'''
+To resolve the issue of not finding the /src folder when importing functions, change the current
 working directory of the Python process to the root directory of the project.
 '''
 import os
@@ -13,114 +13,147 @@ if project_root not in sys.path:
     sys.path.append(project_root)   # Add the root directory to sys.path
 
 
+from concurrent.futures import ThreadPoolExecutor
+
 import flet as ft
-from src.chatbot import process_message
+from constants import GUI_MAX_HISTORY_CONTROLS
+from src.chatbot import process_message, get_or_train_classifier
+from src.metrics import metrics
 
 # Create a column to display errors
 error_column = ft.Column(scroll=ft.ScrollMode.ADAPTIVE, expand=True, visible=False)
+# Loading the model and classifying the messages run in a single background thread, so the window
+# never waits for them and the responses arrive in the same order as the messages
+inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chatbot')
+
+
+# Removes the oldest controls of a list so it keeps at most max_controls
+def trim_controls(controls, max_controls):
+    excess = len(controls) - max_controls
+    if excess > 0:
+        del controls[:excess]
+
+
+# Creates a row with a message of the conversation, right-aligned for the user and left-aligned
+# for the chatbot
+def message_row(text, user=False):
+    return ft.Row(
+        [ft.Text(text,
+                    text_align=ft.TextAlign.RIGHT if user else ft.TextAlign.LEFT,
+                    selectable=True)
+        ],
+        # Aligns to the right or left when using wrap, otherwise 'alignment'
+        run_alignment=ft.MainAxisAlignment.END if user else ft.MainAxisAlignment.START,
+        #the Row will put child controls into additional rows (runs) if they don't fit a single row.
+        wrap=True
+    )
+
+
+# Creates the indicator shown while the chatbot prepares a response. Its content is replaced by
+# the response when it is ready.
+def typing_indicator():
+    return ft.Container(content=ft.Row([ft.ProgressRing(width=14, height=14, stroke_width=2),
+                                        ft.Text("Chatbot está escribiendo...", italic=True)]))
+
 
 def main(page: ft.Page):
     try:
+        # The model is loaded (or trained) in the background as soon as the app starts, the first
+        # message waits for it in the queue of the worker thread
+        preload = inference_executor.submit(get_or_train_classifier)
         # Window settings
         page.window.width = 400             # window's width is 400 px
         page.window.height = 600            # window's height is 600 px
         page.window.resizable = False       # window is not resizable
         page.window.maximizable = False     # window is not maximizable
-        page.window.center()                # window is aligned in the center of the screen    
-        # Create a container to display the conversation history
-        # auto_scroll=True performs automatic scrolling, if scroll_to is used it must be false
-        conversation_history = ft.Column(scroll=ft.ScrollMode.ADAPTIVE,
-                                            auto_scroll=False, 
-                                            expand=True,
-                                        )
-        # Add initial text to the page""
-        conversation_history.controls.append(ft.TextField("¡Hola! Soy un chatbot. "
-                                                            "\n¿Cómo puedo ayudarte?",
-                                                            multiline=True, 
-                                                            border=ft.InputBorder.NONE)
-                                            )
-        page.add(conversation_history)    
+        page.window.center()                # window is aligned in the center of the screen
+        # Create a list to display the conversation history. ListView only builds the rows that
+        # are visible, and auto_scroll keeps the newest messages visible.
+        conversation_history = ft.ListView(expand=True, spacing=10, auto_scroll=True)
+        # Add initial text to the page
+        conversation_history.controls.append(message_row("¡Hola! Soy un chatbot. "
+                                                            "\n¿Cómo puedo ayudarte?"))
+        # Shown until the model is ready
+        loading_status = ft.Text("Cargando el modelo...", italic=True,
+                                    visible=not preload.done())
+        page.add(conversation_history, loading_status)
         # Variable to track whether the conversation has ended
         conversation_ended = False
 
+        # Hides the loading status when the model is ready
+        def on_model_ready(future):
+            loading_status.visible = False
+            if future.result() is None:
+                show_error("No fue posible cargar el modelo.")
+            page.update()
+
+        # Adds controls to the history, dropping the oldest ones beyond the limit
+        def add_to_history(*controls):
+            conversation_history.controls.extend(controls)
+            trim_controls(conversation_history.controls, GUI_MAX_HISTORY_CONTROLS)
+
+        # Shows an error below the conversation
+        def show_error(message):
+            error_column.controls.append(ft.Text(message, selectable=True))
+            trim_controls(error_column.controls, GUI_MAX_HISTORY_CONTROLS)
+            error_column.visible = True
+            # Scroll down to the bottom to always keep the newest error visible
+            error_column.scroll_to(offset=-1, duration=1)
+
+        # Runs in the worker thread: obtains the response and puts it in place of the typing
+        # indicator of its message
+        def answer(user_input, placeholder):
+            try:
+                # The response is obtained based on the message entered by the user
+                response = process_message(user_input)
+                placeholder.content = message_row(f"Chatbot: \n{response}")
+            except Exception as e:
+                print(f"Error in the answer function: {e}")
+                placeholder.visible = False
+                show_error(f"Error al procesar tu mensaje: \n{e}")
+            # Refresh the page to show the response
+            with metrics.timer('gui_update'):
+                page.update()
+
         # Function that is executed when the user sends the message
         def on_submit(e):
-            # Reference a variable that is in the scope of a parent function (but not 
+            # Reference a variable that is in the scope of a parent function (but not
             # in global scope).
             nonlocal conversation_ended
             try:
                 # If the conversation has already ended, do not process any more entries
                 if conversation_ended:
-                    return        
+                    return
                 # Remove spaces at the beginning and end
                 user_input = input_field.value.strip()
+                if not user_input:
+                    return
+                # Clear the text field for the next interaction
+                input_field.value = ""
+                input_field.focus()
                 # If the user types 'exit' or 'Exit', we end the conversation
                 if user_input.lower() == 'exit':
-                    conversation_history.controls.append(ft.TextField("Gracias por conversar. "
-                                                                        "¡Hasta luego!",
-                                                                        multiline=True, 
-                                                                        border=ft.InputBorder.NONE)
-                                                        )
-                    # Scroll down to the bottom to always keep the newest messages visible
-                    conversation_history.scroll_to(offset=-1, duration=1)
-                    # Disable the text field and mark the conversation as over
+                    add_to_history(message_row("Gracias por conversar. ¡Hasta luego!"))
+                    # Disable the text field and mark the conversation as over. The messages
+                    # already sent are still answered.
                     input_field.disabled = True
                     conversation_ended = True
                     # Refresh page to reflect disabled status
-                    page.update() 
-                    return  # End the conversation        
-                # Add user input to history (right-aligned and multi-line)
-                conversation_history.controls.append(
-                    ft.Row(
-                        [ft.TextField(f"Tú: \n{user_input}",
-                                        text_align= ft.TextAlign.RIGHT,
-                                        multiline=True, 
-                                        border=ft.InputBorder.NONE)
-                        ],
-                        # Aligns to the right when using wrap, otherwise 'alignment'
-                        run_alignment=ft.MainAxisAlignment.END,
-                        #the Row will put child controls into additional rows (runs) if they don't 
-                        # fit a single row.            
-                        wrap=True
-                    )
-                )
-                # The response is obtained based on the message entered by the user
-                response = process_message(user_input)         
-                # Add the chatbot's response to the history (left-aligned and multi-line)
-                conversation_history.controls.append(
-                    ft.Row(
-                        [ft.TextField(f"Chatbot: \n{response}",
-                                        multiline=True, 
-                                        border=ft.InputBorder.NONE)
-                        ],
-                        # Aligns to the left when using wrap, otherwise 'alignment'
-                        run_alignment=ft.MainAxisAlignment.START,
-                        #the Row will put child controls into additional rows (runs) if they don't 
-                        # fit a single row.
-                        wrap=True, 
-                    )
-                )        
-                # Refresh the page to reflect the full history
+                    page.update()
+                    return  # End the conversation
+                # Add user input to history and a typing indicator that is replaced by the
+                # response when the worker thread has it
+                placeholder = typing_indicator()
+                add_to_history(message_row(f"Tú: \n{user_input}", user=True), placeholder)
+                with metrics.timer('gui_update'):
+                    page.update()
+                inference_executor.submit(answer, user_input, placeholder)
+            except Exception as e:
+                print(f"Error in the on_submit function: {e}")
+                show_error(f"Error al procesar tu mensaje: \n{e}")
                 page.update()
-                # Scroll down to the bottom to always keep the newest messages visible
-                conversation_history.scroll_to(offset=-1, duration=1)
-                # Clear the text field for the next interaction
                 input_field.value = ""
                 input_field.focus()
-            except Exception as e:
-                    print(f"Error in the on_submit function: {e}")
-                    error_column.controls.append(ft.TextField(f"Error al procesar tu mensaje: \n{e}", 
-                                                                multiline=True, 
-                                                                border=ft.InputBorder.UNDERLINE)
-                                                )
-                    error_column.visible=True
-                    page.update()
-                    # Scroll down to the bottom to always keep the newest messages visible
-                    conversation_history.scroll_to(offset=-1, duration=1)
-                    # Scroll down to the bottom to always keep the newest error visible
-                    error_column.scroll_to(offset=-1, duration=1)
-                    input_field.value = ""
-                    input_field.focus()
 
         # Create a text field to enter messages
         input_field = ft.TextField(label="Escribe tu mensaje", on_submit=on_submit)
@@ -129,21 +162,18 @@ def main(page: ft.Page):
         input_field.focus()
         # Add the error column to the page to display errors
         page.add(error_column)
+        preload.add_done_callback(on_model_ready)
     except Exception as e:
         print(f"Error in main function: {e}")
-        error_column.controls.append(ft.TextField(f"Hubo un error en la aplicación: {e}", 
-                                                    multiline=True, 
-                                                    border=ft.InputBorder.UNDERLINE)
-                                    )
+        error_column.controls.append(ft.Text(f"Hubo un error en la aplicación: {e}", selectable=True))
         error_column.visible=True
         page.update()
-        # Scroll down to the bottom to always keep the newest messages visible
-        conversation_history.scroll_to(offset=-1, duration=1)
         # Scroll down to the bottom to always keep the newest error visible
         error_column.scroll_to(offset=-1, duration=1)
-        input_field.value = ""
-        input_field.focus()        
 
 
-# Run the Flet application
-ft.app(target=main)
+# Run the Flet application. Only when the file is run directly: the worker processes of the
+# training (see src/hashing_features.py) import this module again when they are started with spawn,
+# and each one would open another window.
+if __name__ == '__main__':
+    ft.app(target=main)
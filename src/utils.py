@@ -1,5 +1,9 @@
 import json
 import os
+import random
+
+from constants import TEXT_STEMMING
+from src.text_normalization import normalize_text
 
 # Load a JSON file and return dictionary with data from a JSON file
 def load_data(file_path):    
@@ -27,6 +31,34 @@ def load_data(file_path):
         raise  # Re-raise the exception for further handling if needed
 
 
+# Returns the training examples of an intents dictionary as two parallel lists: the texts and
+# their intents
+def get_training_examples(data):
+    X_train = []
+    y_train = []
+    for intent_data in data['intents']:
+        for example in intent_data['examples']:
+            X_train.append(example)
+            y_train.append(intent_data['intent'])
+    return X_train, y_train
+
+
+# Splits the positions of the examples into a training part and a test part with about fraction
+# of the examples of every intent. Intents with a single example stay in the training part.
+def stratified_split(y, fraction, seed=0):
+    rng = random.Random(seed)
+    positions = {}
+    for position, intent in enumerate(y):
+        positions.setdefault(intent, []).append(position)
+    train, test = [], []
+    for intent_positions in positions.values():
+        rng.shuffle(intent_positions)
+        n_test = min(len(intent_positions) - 1, max(1, round(fraction * len(intent_positions))))
+        test.extend(intent_positions[:n_test])
+        train.extend(intent_positions[n_test:])
+    return sorted(train), sorted(test)
+
+
 # Saves data to a specified JSON file
 def save_json(data, file_path):    
     try:
@@ -53,6 +85,35 @@ def save_json(data, file_path):
         print(f"Error al intentar abrir el archivo {file_path}: {e}")
 
 
+# Checks that a single intent has the expected structure. Raises ValueError (or KeyError) with
+# the reason if it does not. Used by validate_json_structure and by the streaming validation.
+def check_intent(intent):
+    # Check that 'intent' is not None or empty
+    if 'intent' not in intent or not intent['intent']:
+        raise ValueError(f"La intención: '{intent['intent']}', no tiene un valor válido para 'intent'.")        
+    # Check that 'examples' contains at least one non-empty, non-None example
+    if ('examples' not in intent or 
+            not isinstance(intent['examples'], list) or 
+            len(intent['examples']) == 0):                    
+        raise ValueError(
+                            f"La intención '{intent['intent']}' "
+                            f"no tiene ejemplos válidos ('examples')."
+                        )
+    if any(example is None or example.strip() == "" for example in intent['examples']):
+        raise ValueError(
+                            f"Al menos un ejemplo de la intención '{intent['intent']}' "
+                            f"es inválido (None o vacío)."
+                        )       
+    # Check that 'response' is None or not empty
+    if ('response' in intent and 
+            (intent['response'] is None or 
+            intent['response'].strip() == "")):
+        raise ValueError(
+                            f"La intención '{intent['intent']}' tiene un 'response' "
+                            f"inválido (None o vacío)."
+                        )
+
+
 # Validates that the data object has the expected structure and returns a boolean or an
 # error messages
 def validate_json_structure(data):    
@@ -67,30 +128,7 @@ def validate_json_structure(data):
             raise ValueError("El archivo no contiene 'intents' o está vacío.")       
         # Validate each intent within 'intents'
         for intent in data['intents']:
-            # Check that 'intent' is not None or empty
-            if 'intent' not in intent or not intent['intent']:
-                raise ValueError(f"La intención: '{intent['intent']}', no tiene un valor válido para 'intent'.")        
-            # Check that 'examples' contains at least one non-empty, non-None example
-            if ('examples' not in intent or 
-                    not isinstance(intent['examples'], list) or 
-                    len(intent['examples']) == 0):                    
-                raise ValueError(
-                                    f"La intención '{intent['intent']}' "
-                                    f"no tiene ejemplos válidos ('examples')."
-                                )
-            if any(example is None or example.strip() == "" for example in intent['examples']):
-                raise ValueError(
-                                    f"Al menos un ejemplo de la intención '{intent['intent']}' "
-                                    f"es inválido (None o vacío)."
-                                )       
-            # Check that 'response' is None or not empty
-            if ('response' in intent and 
-                    (intent['response'] is None or 
-                    intent['response'].strip() == "")):
-                raise ValueError(
-                                    f"La intención '{intent['intent']}' tiene un 'response' "
-                                    f"inválido (None o vacío)."
-                                )
+            check_intent(intent)
         # If all checks passed, the structure is valid
         return True
     except ValueError as e:
@@ -109,41 +147,88 @@ def validate_json_structure(data):
         return False
 
 
+# Returns the key used to detect duplicated examples. With normalize=True the key is the example
+# as the model sees it (src/text_normalization.py), so examples that only differ in case, accents,
+# punctuation or whitespace (and in the endings, with TEXT_STEMMING) are the same example.
+def example_key(example, normalize=False):
+    if not normalize:
+        return example
+    return normalize_text(example, TEXT_STEMMING)
+
+
+# Merges the intents of train_data into intents_data without duplicating intents or examples.
+# The intents and examples of the base data are indexed once in a dict and in sets, so the merge
+# is linear in the total number of examples. train_data can be a dictionary with the 'intents' key
+# or any iterable of intents, which are consumed one at a time. Returns the updated intents_data
+# and the counts of the merge. If a list is passed as added, the added examples are appended to it
+# as (intent, example), otherwise they are only counted.
+def merge_intents(intents_data, train_data, normalize=False, added=None):
+    if not isinstance(intents_data, dict) or "intents" not in intents_data:
+        raise KeyError("Falta la clave 'intents' en intents_data.")
+    if isinstance(train_data, dict):
+        if "intents" not in train_data:
+            raise KeyError("Falta la clave 'intents' en train_data.")
+        train_data = train_data["intents"]
+    stats = {'new_intents': 0, 'updated_intents': 0, 'added_examples': 0,
+                'duplicate_examples': 0}
+    # Intent name -> intent dictionary, and intent name -> keys of its examples
+    intent_index = {}
+    example_index = {}
+    for intent in intents_data["intents"]:
+        intent_index.setdefault(intent["intent"], intent)
+        keys = example_index.setdefault(intent["intent"], set())
+        keys.update(example_key(example, normalize) for example in intent["examples"])
+    # Intents that existed before the merge and received new examples
+    base_intents = set(intent_index)
+    updated = set()
+    for new_intent in train_data:
+        # Ensure each new intent is a dictionary
+        if not isinstance(new_intent, dict):
+            raise TypeError(
+                                f"Cada new_intent en train_data debe ser un dictionario, "
+                                f"pero se encontró: {type(new_intent)}"
+                            )
+        name = new_intent["intent"]
+        existing_intent = intent_index.get(name)
+        if existing_intent is not None and "examples" not in new_intent:
+            raise KeyError(f"La clave 'examples' no existe en intent: {name}")
+        if existing_intent is None:
+            # If the intention does not exist, add it with its examples that are not repeated
+            existing_intent = dict(new_intent, examples=[])
+            intents_data["intents"].append(existing_intent)
+            intent_index[name] = existing_intent
+            example_index[name] = set()
+            stats['new_intents'] += 1
+        keys = example_index[name]
+        added_to_intent = 0
+        for example in new_intent.get("examples", []):
+            if not example or not example.strip():
+                continue
+            key = example_key(example, normalize)
+            if key in keys:
+                stats['duplicate_examples'] += 1
+                continue
+            keys.add(key)
+            existing_intent["examples"].append(example)
+            if added is not None:
+                added.append((name, example))
+            added_to_intent += 1
+        stats['added_examples'] += added_to_intent
+        if added_to_intent and name in base_intents:
+            updated.add(name)
+    stats['updated_intents'] = len(updated)
+    return intents_data, stats
+
+
 # Add intents from the new file to the base file without duplicating intents and adding
 # only new examples.
-def add_intents(intents_data, train_data):
+def add_intents(intents_data, train_data, normalize=False):
     try:
         # Verify that intents_data and train_data are valid dictionaries
         if not isinstance(intents_data, dict) or not isinstance(train_data, dict):
             raise TypeError("Tanto intents_data como train_data deben ser diccionarios válidos.")
-        # Verify that 'intents' key exists in both datasets
-        if "intents" not in intents_data or "intents" not in train_data:
-            raise KeyError("Falta la clave 'intents' en intents_data o train_data.")        
-        # Iterate over each new intent in the 'new_data' file   
-        for new_intent in train_data["intents"]:
-            # Ensure each new intent is a dictionary
-            if not isinstance(new_intent, dict):
-                raise TypeError(
-                                    f"Cada new_intent en train_data debe ser un dictionario, "
-                                    f"pero se encontró: {type(new_intent)}"
-                                )            
-            # Find if the intent already exists in the base file
-            existing_intent = next((intent 
-                                    for intent in intents_data["intents"] 
-                                    if intent["intent"] == new_intent["intent"]), None)
-            if existing_intent:
-                if "examples" not in new_intent:
-                    raise KeyError(f"La clave 'examples' no existe en intent: {new_intent['intent']}")
-                # If the intent already exists, add only the new examples (without duplicating examples)
-                new_examples = [example 
-                                for example in new_intent["examples"] 
-                                if example not in existing_intent["examples"] and example.strip()]
-                if new_examples:
-                    existing_intent["examples"].extend(new_examples)
-            else:
-                # If the intention does not exist, add it completely
-                intents_data["intents"].append(new_intent)
-        return intents_data
+        updated_data, stats = merge_intents(intents_data, train_data, normalize)
+        return updated_data
     except TypeError as e:
         # Handle type errors (e.g., incorrect data types)
         print(f"Type error: {e}")
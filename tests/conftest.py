@@ -0,0 +1,51 @@
+'''
+Shared fixtures of the tests. The modules of the chatbot import constants.py and src/ from the
+root of the repository, which is added to the path so the tests run from any directory.
+'''
+
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Small intents dictionary with the schema of data/intents.json
+@pytest.fixture
+def intents():
+    return {'intents': [
+        {'intent': 'Saludo', 'examples': ['Hola', 'Buenos días', 'Hola, ¿qué tal?', 'Buenas tardes',
+                                            '¿Qué tal estás?', 'Hola amigo'],
+            'response': '¡Hola! ¿En qué puedo ayudarte hoy?'},
+        {'intent': 'Despedida', 'examples': ['Adiós', 'Hasta luego', 'Nos vemos', 'Chao amigo',
+                                                'Hasta mañana', 'Nos vemos pronto'],
+            'response': '¡Hasta pronto!'},
+        {'intent': 'Agradecimiento', 'examples': ['Gracias', 'Muchas gracias', 'Te lo agradezco',
+                                                    'Mil gracias', 'Gracias por la ayuda',
+                                                    'Gracias de verdad'],
+            'response': '¡De nada!'},
+    ]}
+
+
+# Writes a JSON file
+def write_json(data, file_path):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+
+
+# Data directory of a bot with the intents of the fixture
+@pytest.fixture
+def data_path(tmp_path, intents):
+    path = tmp_path / 'data'
+    path.mkdir()
+    write_json(intents, path / 'intents.json')
+    return str(path)
+
+
+# Classifier trained on the intents of the fixture, with its own data and models directories
+@pytest.fixture
+def classifier(tmp_path, data_path):
+    from src.intent_classifier_model import IntentClassifier
+    return IntentClassifier(data_path, str(tmp_path / 'models'))
@@ -0,0 +1,44 @@
+'''
+Benchmark suite: the corpus generator is reproducible and produces valid intents, and the
+comparison of two runs reports only the regressions above the threshold.
+'''
+
+from benchmarks.common import spanish_corpus
+from benchmarks.suite import compare, prepare_workspace, run_in_process
+from src.utils import validate_json_structure
+
+
+def test_corpus_is_reproducible():
+    corpus = spanish_corpus(5, 10, vocabulary_size=200, seed=7)
+    assert corpus == spanish_corpus(5, 10, vocabulary_size=200, seed=7)
+    assert corpus != spanish_corpus(5, 10, vocabulary_size=200, seed=8)
+
+
+def test_corpus_looks_like_the_intents_file():
+    corpus = spanish_corpus(8, 25, vocabulary_size=500)
+    assert validate_json_structure(corpus)
+    assert len(corpus['intents']) == 8
+    assert len({intent['intent'] for intent in corpus['intents']}) == 8
+    examples = [example for intent in corpus['intents'] for example in intent['examples']]
+    assert len(examples) == 200
+    assert all(intent['response'] for intent in corpus['intents'])
+    assert any(example.startswith('¿') for example in examples)
+    assert any(character in 'áéíóú' for example in examples for character in example)
+
+
+def test_only_regressions_above_the_threshold():
+    previous = {'results': {'train': {'seconds': 1.0, 'peak_rss_mb': 100.0},
+                            'load_model': {'seconds': 0.5, 'peak_rss_mb': 50.0}}}
+    current = {'results': {'train': {'seconds': 1.05, 'peak_rss_mb': 130.0},
+                            'load_model': {'seconds': 0.4, 'peak_rss_mb': 50.0},
+                            'predict_batch': {'seconds': 9.0, 'peak_rss_mb': 10.0}}}
+    regressions = compare(previous, current, threshold=0.1)
+    assert [(name, field) for name, field, *_ in regressions] == [('train', 'peak_rss_mb')]
+
+
+def test_benchmark_runs_on_a_small_workspace(tmp_path):
+    options = {'intents': 4, 'examples': 10, 'vocabulary': 100, 'seed': 0, 'messages': 20,
+                'repeat': 1}
+    prepare_workspace(str(tmp_path / 'workspace'), options)
+    result = run_in_process('predict_batch', str(tmp_path / 'workspace'), options)
+    assert result['seconds'] > 0 and result['peak_rss_mb'] > 0
@@ -0,0 +1,115 @@
+'''
+Bulk classification of log files: the results follow the input in every format, and a run that
+was interrupted goes on from its checkpoint, also with a compressed input, and writes the same
+output as a run that was not.
+'''
+
+import os
+import gzip
+import json
+
+import pytest
+
+from src import bulk_classify
+from src.bulk_classify import classify_file, iter_records, main
+
+
+MESSAGES = ['Hola, ¿qué tal?', 'Muchas gracias', 'Adiós', '', 'Hasta mañana', 'Mil gracias',
+            'Buenas tardes', 'Gracias de verdad', 'Nos vemos pronto']
+
+
+# Writes the messages in a format, compressed if the name ends in .gz
+def write_input(path, file_format):
+    if file_format == 'text':
+        content = ''.join(f"{message}\n" for message in MESSAGES)
+    elif file_format == 'jsonl':
+        content = ''.join(json.dumps({'message': message}, ensure_ascii=False) + '\n'
+                            for message in MESSAGES)
+    else:
+        # A quoted message can span several lines
+        content = 'id,message\n' + ''.join(f'{number},"{message}"\n'
+                                            for number, message in enumerate(MESSAGES))
+        content = content.replace('Hasta mañana', 'Hasta\nmañana')
+    data = content.encode('utf-8')
+    with (gzip.open(path, 'wb') if str(path).endswith('.gz') else open(path, 'wb')) as f:
+        f.write(data)
+    return str(path)
+
+
+# Reads a JSON Lines output
+def read_output(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.parametrize('name', ['log.txt', 'log.jsonl', 'log.csv', 'log.csv.gz'])
+def test_results_follow_the_input(classifier, tmp_path, name):
+    file_format = bulk_classify.input_format(name)
+    input_path = write_input(tmp_path / name, file_format)
+    output_path = str(tmp_path / 'resultados.jsonl')
+    state = classify_file(input_path, output_path, classifier.model_filename,
+                            classifier.intents_path, chunk_size=2, workers=1, with_text=True)
+    assert state['done'] and state['records'] == len(MESSAGES)
+    rows = read_output(output_path)
+    assert [row['record'] for row in rows] == list(range(len(MESSAGES)))
+    expected = MESSAGES if file_format != 'csv' else \
+        [message.replace('Hasta mañana', 'Hasta\nmañana') for message in MESSAGES]
+    assert [row['message'] for row in rows] == expected
+    for row in rows:
+        if row['message']:
+            assert row['intent'] == classifier.predict(row['message'])
+        else:
+            assert row['intent'] is None
+
+
+@pytest.mark.parametrize('name', ['log.txt', 'log.csv', 'log.jsonl.gz', 'log.csv.gz'])
+def test_resume_writes_the_same_output(classifier, tmp_path, monkeypatch, name):
+    input_path = write_input(tmp_path / name, bulk_classify.input_format(name))
+    complete = str(tmp_path / 'completo.jsonl')
+    states = []
+    save_checkpoint = bulk_classify.save_checkpoint
+    monkeypatch.setattr(bulk_classify, 'save_checkpoint',
+                        lambda path, state: (states.append(dict(state)), save_checkpoint(path, state)))
+    classify_file(input_path, complete, classifier.model_filename, classifier.intents_path,
+                    chunk_size=2, workers=1)
+    # The run stops after the second chunk, with a chunk written but not recorded
+    interrupted = str(tmp_path / 'interrumpido.jsonl')
+    with open(complete, 'rb') as f:
+        written = f.read()
+    with open(interrupted, 'wb') as f:
+        f.write(written[:states[1]['output_bytes'] + 10])
+    save_checkpoint(interrupted + bulk_classify.CHECKPOINT_SUFFIX, states[1])
+    state = classify_file(input_path, interrupted, intents_path=classifier.intents_path,
+                            chunk_size=2, workers=1, resume=True)
+    assert state['done'] and state['records'] == len(MESSAGES)
+    with open(interrupted, 'rb') as f:
+        assert f.read() == written
+
+
+def test_compressed_input_is_only_read_forward(tmp_path, monkeypatch):
+    input_path = write_input(tmp_path / 'log.txt.gz', 'text')
+    plain_path = write_input(tmp_path / 'log.txt', 'text')
+    monkeypatch.setattr(bulk_classify, 'SKIP_BLOCK_SIZE', 4)
+    seek = gzip.GzipFile.seek
+    # tell() asks for the current position with seek(0, 1), only moving is forbidden
+    def no_seek(f, offset, whence=0):
+        assert whence == 1 and offset == 0, "seek en un .gz"
+        return seek(f, offset, whence)
+    monkeypatch.setattr(gzip.GzipFile, 'seek', no_seek)
+    records = list(iter_records(plain_path, 'text'))
+    for offset, _ in records:
+        assert list(iter_records(input_path, 'text', offset=offset)) == \
+            list(iter_records(plain_path, 'text', offset=offset))
+
+
+def test_resume_rejects_another_input(classifier, tmp_path):
+    input_path = write_input(tmp_path / 'log.txt', 'text')
+    output_path = str(tmp_path / 'resultados.csv')
+    classify_file(input_path, output_path, classifier.model_filename, classifier.intents_path,
+                    workers=1)
+    with open(output_path, encoding='utf-8') as f:
+        assert f.readline().strip() == 'record,intent,response_id,confidence'
+    other = write_input(tmp_path / 'otro.txt', 'text')
+    with pytest.raises(SystemExit):
+        main([other, output_path, '--model', classifier.model_filename, '--intents',
+                classifier.intents_path, '--workers', '1', '--resume'])
@@ -0,0 +1,111 @@
+'''
+The compact copy of a model predicts like the pipeline it was exported from, the classifier serves
+it instead of the pickle, and a compaction is only published when it passes the validation.
+'''
+
+import os
+
+import numpy as np
+import pytest
+
+from src.compact_model import CompactPredictor, export_compact_model, has_compact_model
+from src.intent_classifier_model import IntentClassifier
+from src.model_compaction import compact_model, holdout_validation
+from src.text_normalization import TextNormalizer
+from src.utils import get_training_examples
+
+
+MESSAGES = ['hola, ¿qué tal?', 'Muchas GRACIAS', 'adiós, hasta mañana', 'nos vemos luego',
+            'palabras desconocidas', '']
+
+
+@pytest.fixture
+def examples(intents):
+    return get_training_examples(intents)
+
+
+# Vectorizer + Naive Bayes pipelines like the ones the classifier trains
+def pipelines():
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import make_pipeline
+    return {
+        'tfidf': make_pipeline(TfidfVectorizer(), MultinomialNB()),
+        'normalized': make_pipeline(TfidfVectorizer(preprocessor=TextNormalizer()), MultinomialNB()),
+        'bigrams': make_pipeline(TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True),
+                                    MultinomialNB(alpha=0.5)),
+    }
+
+
+@pytest.mark.parametrize('name', list(pipelines()))
+def test_compact_copy_predicts_like_the_pipeline(tmp_path, examples, name):
+    X, y = examples
+    pipeline = pipelines()[name].fit(X, y)
+    directory = export_compact_model(pipeline, str(tmp_path / 'compact'))
+    assert has_compact_model(directory)
+    predictor = CompactPredictor(directory)
+    assert list(predictor.classes_) == list(pipeline.classes_)
+    np.testing.assert_allclose(predictor.predict_proba(MESSAGES), pipeline.predict_proba(MESSAGES),
+                                rtol=1e-9, atol=1e-12)
+    assert list(predictor.predict(MESSAGES)) == list(pipeline.predict(MESSAGES))
+
+
+def test_classifier_serves_the_compact_copy(classifier):
+    reloaded = IntentClassifier(classifier.data_path, classifier.models_path)
+    assert isinstance(reloaded.model, CompactPredictor)
+    np.testing.assert_allclose(reloaded.model.predict_proba(MESSAGES),
+                                classifier.model.predict_proba(MESSAGES), rtol=1e-9, atol=1e-12)
+    assert [result['intent'] for result in reloaded.predict_batch(MESSAGES)] == \
+        [result['intent'] for result in classifier.predict_batch(MESSAGES)]
+
+
+def test_default_compaction_publishes_an_equivalent_copy(tmp_path, examples):
+    X, y = examples
+    pipeline = pipelines()['tfidf'].fit(X, y)
+    directory = str(tmp_path / 'compact')
+    # With the default settings nothing is compacted and no validation is needed
+    assert holdout_validation(pipeline, X, y) is None
+    assert compact_model(pipeline, directory, None, None) is None
+    np.testing.assert_allclose(CompactPredictor(directory).predict_proba(MESSAGES),
+                                pipeline.predict_proba(MESSAGES), rtol=1e-9, atol=1e-12)
+
+
+def test_publishing_replaces_the_previous_copy(tmp_path, examples):
+    X, y = examples
+    directory = str(tmp_path / 'compact')
+    first = pipelines()['tfidf'].fit(X[:12], y[:12])
+    compact_model(first, directory, None, None)
+    second = pipelines()['tfidf'].fit(X, y)
+    compact_model(second, directory, None, None)
+    assert list(CompactPredictor(directory).classes_) == list(second.classes_)
+    # No temporary directories are left next to the published copy
+    assert os.listdir(tmp_path) == ['compact']
+
+
+def test_held_out_compaction_report(tmp_path, examples):
+    X, y = examples
+    pipeline = pipelines()['tfidf'].fit(X, y)
+    X_val, y_val, probe = holdout_validation(pipeline, X, y, keep=0.5, method='df', fraction=0.2)
+    # The probe is fitted on the examples that were not kept out
+    assert X_val and probe[-1].class_count_.sum() + len(X_val) == len(X)
+    assert set(y_val) == set(y)
+    report = compact_model(pipeline, str(tmp_path / 'compact'), X_val, y_val, method='df',
+                            keep=0.5, max_drop=1.0, probe=probe)
+    assert report['held_out'] and report['published']
+    assert report['after']['columns'] < report['before']['columns']
+
+
+def test_rejected_compaction_publishes_the_full_copy(tmp_path, examples):
+    X, y = examples
+    pipeline = pipelines()['tfidf'].fit(X, y)
+    directory = str(tmp_path / 'compact')
+    # No compaction can lower the accuracy by a negative amount
+    report = compact_model(pipeline, directory, X, y, method='chi2', keep=0.2,
+                            weights_dtype='int8', max_drop=-1.0)
+    assert not report['accepted'] and not report['published']
+    predictor = CompactPredictor(directory)
+    assert len(predictor.idf) == len(pipeline[0].vocabulary_)
+    np.testing.assert_allclose(predictor.predict_proba(MESSAGES), pipeline.predict_proba(MESSAGES),
+                                rtol=1e-9, atol=1e-12)
+    with pytest.raises(ValueError):
+        compact_model(pipeline, directory, [], [], method='df', keep=0.5)
@@ -0,0 +1,66 @@
+'''
+Offline evaluation: the stored models are scored as they are served on a stratified test sample or
+a test file, and --retrain cross-validates their configurations on the corpus.
+'''
+
+import os
+import json
+
+import pytest
+
+from src.evaluation import evaluate_versions, main, model_versions
+from src.intent_classifier_model import IntentClassifier
+from src.utils import get_training_examples, stratified_split
+from conftest import write_json
+
+
+# Classifier fixture plus a second version trained with one more example
+@pytest.fixture
+def two_versions(classifier):
+    write_json({'intents': [{'intent': 'Saludo', 'examples': ['Buenas noches']}]},
+                os.path.join(classifier.data_path, 'intents_train.json'))
+    IntentClassifier(classifier.data_path, classifier.models_path)
+    return classifier
+
+
+def test_stratified_split_keeps_every_intent(intents):
+    _, y = get_training_examples(intents)
+    train, test = stratified_split(y, 0.34, seed=1)
+    assert sorted(train + test) == list(range(len(y)))
+    assert len(test) == 6
+    assert {y[i] for i in test} == {y[i] for i in train} == set(y)
+    assert (train, test) == stratified_split(y, 0.34, seed=1)
+
+
+def test_stored_models_are_scored_as_served(two_versions, intents):
+    versions = [entry['version'] for entry in model_versions(two_versions.models_path)]
+    assert len(versions) == 2
+    results = evaluate_versions(intents, two_versions.models_path, workers=1, test_data=intents)
+    assert list(results) == versions
+    X, y = get_training_examples(intents)
+    served = IntentClassifier(two_versions.data_path, two_versions.models_path)
+    accuracy = sum(served.predict(text) == intent for text, intent in zip(X, y)) / len(X)
+    assert results[versions[-1]]['accuracy'] == pytest.approx(accuracy)
+    assert sum(map(sum, results[versions[-1]]['confusion_matrix'])) == len(X)
+
+
+def test_retrain_compares_configurations(two_versions, intents):
+    results = evaluate_versions(intents, two_versions.models_path, n_folds=3, workers=1,
+                                retrain=True)
+    first, second = results.values()
+    # Both versions have the same configuration, so they get the same scores
+    assert first['accuracy'] == second['accuracy']
+    assert sum(map(sum, first['confusion_matrix'])) == len(get_training_examples(intents)[0])
+    with pytest.raises(ValueError):
+        evaluate_versions(intents, two_versions.models_path, retrain=True, test_data=intents)
+
+
+def test_command_line(two_versions, tmp_path, capsys):
+    output = str(tmp_path / 'resultados.json')
+    main(['--data', two_versions.intents_path, '--models', two_versions.models_path,
+            '--workers', '1', '--test-size', '0.5', '--details', '--output', output])
+    assert 'Matriz de confusión' in capsys.readouterr().out
+    with open(output, encoding='utf-8') as f:
+        assert len(json.load(f)) == 2
+    with pytest.raises(SystemExit):
+        main(['--data', two_versions.intents_path, '--models', str(tmp_path / 'vacío')])
@@ -0,0 +1,34 @@
+'''
+Chat window: importing it does not open the window, and the history keeps only the newest rows.
+Skipped when flet is not installed.
+'''
+
+import os
+
+import pytest
+
+ft = pytest.importorskip('flet')
+
+
+@pytest.fixture
+def gui(monkeypatch):
+    # The module changes the working directory to the root of the project when it is imported
+    monkeypatch.chdir(os.getcwd())
+    opened = []
+    monkeypatch.setattr(ft, 'app', lambda *args, **kwargs: opened.append(kwargs))
+    from src.ui import gui_flet
+    assert opened == []
+    return gui_flet
+
+
+def test_history_keeps_the_newest_rows(gui):
+    controls = list(range(10))
+    gui.trim_controls(controls, 4)
+    assert controls == [6, 7, 8, 9]
+    gui.trim_controls(controls, 10)
+    assert controls == [6, 7, 8, 9]
+
+
+def test_rows_are_aligned_by_sender(gui):
+    assert gui.message_row('hola', user=True).run_alignment == ft.MainAxisAlignment.END
+    assert gui.message_row('¡Hola!').run_alignment == ft.MainAxisAlignment.START
@@ -0,0 +1,61 @@
+'''
+Feature hashing mode: the texts hashed in parallel chunks give the same counts as a single call,
+the compact copy of a hashing pipeline predicts like it, and the classifier trains one when
+FEATURE_MODE is 'hashing'.
+'''
+
+import numpy as np
+import pytest
+from sklearn.utils import murmurhash3_32
+
+from src import intent_classifier_model
+from src.compact_model import CompactPredictor, export_compact_model, hashed_column
+from src.hashing_features import hashing_pipeline, is_hashing_pipeline, hash_texts
+from src.hashing_features import fit_hashing_pipeline
+from src.intent_classifier_model import IntentClassifier
+from src.utils import get_training_examples
+
+
+MESSAGES = ['hola, ¿qué tal?', 'Muchas GRACIAS', 'adiós, hasta mañana', 'palabras desconocidas', '']
+
+
+def test_chunked_hashing_matches_a_single_call(intents):
+    X, _ = get_training_examples(intents)
+    vectorizer = hashing_pipeline(n_features=2 ** 10, ngram_range=(1, 2))[0]
+    serial = hash_texts(vectorizer, X, workers=1)
+    chunked = hash_texts(vectorizer, X, workers=2, chunk_size=5)
+    assert serial.shape == chunked.shape == (len(X), 2 ** 10)
+    assert (serial != chunked).nnz == 0
+
+
+def test_parallel_fit_matches_the_pipeline_fit(intents):
+    X, y = get_training_examples(intents)
+    fitted = fit_hashing_pipeline(hashing_pipeline(n_features=2 ** 10), X, y, workers=1)
+    expected = hashing_pipeline(n_features=2 ** 10).fit(X, y)
+    np.testing.assert_allclose(fitted.predict_proba(MESSAGES), expected.predict_proba(MESSAGES))
+
+
+def test_compact_copy_hashes_like_sklearn(tmp_path, intents):
+    X, y = get_training_examples(intents)
+    pipeline = fit_hashing_pipeline(hashing_pipeline(n_features=2 ** 10), X, y, workers=1)
+    vectorizer = pipeline[0]
+    for term in ['hola', 'gracias', 'adiós', 'ñandú', 'x' * 7]:
+        assert hashed_column(term, 2 ** 10) == abs(murmurhash3_32(term)) % 2 ** 10
+    predictor = CompactPredictor(export_compact_model(pipeline, str(tmp_path / 'compact')))
+    np.testing.assert_allclose(predictor.predict_proba(MESSAGES), pipeline.predict_proba(MESSAGES),
+                                rtol=1e-9, atol=1e-12)
+    # Keeping only the buckets used by the examples gives the same predictions on known words
+    used = np.unique(vectorizer.transform(X).indices)
+    pruned = CompactPredictor(export_compact_model(pipeline, str(tmp_path / 'pruned'),
+                                                    keep_columns=used))
+    assert list(pruned.predict(MESSAGES[:3])) == list(pipeline.predict(MESSAGES[:3]))
+
+
+def test_classifier_trains_a_hashing_model(monkeypatch, data_path, tmp_path):
+    monkeypatch.setattr(intent_classifier_model, 'FEATURE_MODE', 'hashing')
+    classifier = IntentClassifier(data_path, str(tmp_path / 'models'))
+    assert is_hashing_pipeline(classifier.model)
+    assert classifier.predict('Muchas gracias') == 'Agradecimiento'
+    monkeypatch.setattr(intent_classifier_model, 'FEATURE_MODE', 'desconocido')
+    with pytest.raises(Exception):
+        IntentClassifier(data_path, str(tmp_path / 'otros'))
@@ -0,0 +1,89 @@
+'''
+Incremental training: adding examples to the stored statistics gives the same model as computing
+them from the whole corpus, which is Naive Bayes fitted on l2-normalized term frequencies.
+'''
+
+import os
+
+import numpy as np
+
+from src import intent_classifier_model
+from src.incremental_trainer import IncrementalTrainer
+from src.intent_classifier_model import IntentClassifier
+from src.text_normalization import default_normalizer, normalizer_name
+from src.utils import get_training_examples, load_data
+from conftest import write_json
+
+
+MESSAGES = ['hola amigo', 'muchas gracias', 'hasta mañana', 'buenas noches a todos', 'palabras nuevas']
+
+
+# Probabilities of a model with its columns ordered by intent name
+def probabilities(model, messages=MESSAGES):
+    order = np.argsort(model.classes_)
+    return model.predict_proba(messages)[:, order]
+
+
+def test_statistics_match_naive_bayes_on_term_frequencies(tmp_path, intents):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import make_pipeline
+    X, y = get_training_examples(intents)
+    trainer = IncrementalTrainer(str(tmp_path / 'state.npz')).fit(intents)
+    full = make_pipeline(TfidfVectorizer(use_idf=False, norm='l2', preprocessor=default_normalizer()),
+                            MultinomialNB()).fit(X, y)
+    np.testing.assert_allclose(probabilities(trainer.to_pipeline()), probabilities(full), rtol=1e-9)
+
+
+def test_updates_in_chunks_match_a_single_fit(tmp_path, intents):
+    X, y = get_training_examples(intents)
+    whole = IncrementalTrainer(str(tmp_path / 'whole.npz')).fit(intents)
+    chunked = IncrementalTrainer(str(tmp_path / 'chunked.npz'))
+    for start in range(0, len(X), 4):
+        chunked.update(X[start:start + 4], y[start:start + 4])
+    assert chunked.vocabulary == whole.vocabulary
+    assert chunked.classes == whole.classes
+    np.testing.assert_array_equal(chunked.class_count, whole.class_count)
+    np.testing.assert_allclose(chunked.feature_count, whole.feature_count, rtol=1e-12)
+
+
+def test_saved_statistics_are_loaded_back(tmp_path, intents):
+    trainer = IncrementalTrainer(str(tmp_path / 'state.npz')).fit(intents)
+    trainer.data_hash = 'abc'
+    trainer.save()
+    loaded = IncrementalTrainer(str(tmp_path / 'state.npz'))
+    assert loaded.load()
+    assert loaded.data_hash == 'abc' and loaded.classes == trainer.classes
+    np.testing.assert_array_equal(loaded.feature_count, trainer.feature_count)
+    np.testing.assert_allclose(probabilities(loaded.to_pipeline()), probabilities(trainer.to_pipeline()))
+
+
+def test_incremental_retraining_matches_the_whole_corpus(classifier, monkeypatch, capsys):
+    monkeypatch.setattr(intent_classifier_model, 'TRAINING_MODE', 'incremental')
+    train_file = os.path.join(classifier.data_path, 'intents_train.json')
+    # The first training file builds the statistics from the whole corpus, the second one only
+    # adds its examples to them
+    write_json({'intents': [{'intent': 'Saludo', 'examples': ['Buenas noches'],
+                                'response': '¡Hola!'}]}, train_file)
+    IntentClassifier(classifier.data_path, classifier.models_path)
+    write_json({'intents': [{'intent': 'Ayuda', 'examples': ['Necesito ayuda', 'Ayúdame por favor'],
+                                'response': '¿En qué te ayudo?'}]}, train_file)
+    retrained = IntentClassifier(classifier.data_path, classifier.models_path)
+    assert 'Entrenamiento incremental con 2 ejemplos nuevos.' in capsys.readouterr().out
+    corpus = load_data(classifier.intents_path)
+    expected = IncrementalTrainer(os.path.join(classifier.data_path, 'state.npz')).fit(corpus).to_pipeline()
+    np.testing.assert_allclose(probabilities(retrained.model), probabilities(expected), rtol=1e-9)
+
+
+def test_dense_statistics_of_older_versions_are_loaded(tmp_path, intents):
+    trainer = IncrementalTrainer(str(tmp_path / 'state.npz')).fit(intents)
+    terms = sorted(trainer.vocabulary, key=trainer.vocabulary.get)
+    np.savez_compressed(tmp_path / 'state.npz', vocabulary=np.array(terms, dtype=str),
+                        classes=np.array(trainer.classes, dtype=str),
+                        class_count=trainer.class_count, feature_count=trainer.feature_count,
+                        alpha=trainer.alpha, data_hash='', normalization=normalizer_name(trainer.normalizer))
+    loaded = IncrementalTrainer(str(tmp_path / 'state.npz'))
+    assert loaded.load()
+    np.testing.assert_array_equal(loaded.feature_count, trainer.feature_count)
+    loaded.update(['hola de nuevo'], ['Saludo'])
+    assert loaded.class_count.sum() == trainer.class_count.sum() + 1
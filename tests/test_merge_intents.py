@@ -0,0 +1,57 @@
+'''
+Merge of a training file into intents.json: new intents are appended, repeated examples are
+skipped, and the added examples are only collected when a list is passed.
+'''
+
+import copy
+
+import pytest
+
+from constants import MERGE_NORMALIZE_EXAMPLES
+from src.utils import merge_intents
+
+
+TRAIN = {'intents': [
+    {'intent': 'Saludo', 'examples': ['Hola', 'Buenas noches', '  ', 'Buenas noches'],
+        'response': 'otra respuesta'},
+    {'intent': 'Ayuda', 'examples': ['Necesito ayuda', 'hola'], 'response': '¿En qué te ayudo?'},
+]}
+
+
+def test_merge_counts_and_order(intents):
+    merged, stats = merge_intents(intents, TRAIN)
+    assert stats == {'new_intents': 1, 'updated_intents': 1, 'added_examples': 3,
+                        'duplicate_examples': 2}
+    assert merged['intents'][0]['examples'][-1] == 'Buenas noches'
+    # The response of an existing intent is kept
+    assert merged['intents'][0]['response'] == '¡Hola! ¿En qué puedo ayudarte hoy?'
+    assert merged['intents'][-1] == {'intent': 'Ayuda', 'examples': ['Necesito ayuda', 'hola'],
+                                        'response': '¿En qué te ayudo?'}
+
+
+def test_added_examples_are_only_collected_on_request(intents):
+    added = []
+    _, stats = merge_intents(intents, TRAIN, added=added)
+    assert added == [('Saludo', 'Buenas noches'), ('Ayuda', 'Necesito ayuda'), ('Ayuda', 'hola')]
+    assert 'added' not in stats
+
+
+def test_normalized_duplicates_are_opt_in(intents):
+    assert MERGE_NORMALIZE_EXAMPLES is False
+    train = {'intents': [{'intent': 'Saludo', 'examples': ['hola', '¡HOLA!', 'Buenos dias']}]}
+    _, exact = merge_intents(copy.deepcopy(intents), train)
+    assert exact['added_examples'] == 3
+    _, normalized = merge_intents(intents, train, normalize=True)
+    assert normalized['added_examples'] == 0 and normalized['duplicate_examples'] == 3
+
+
+def test_training_data_from_a_generator(intents):
+    merged, stats = merge_intents(intents, iter(TRAIN['intents']))
+    assert stats['added_examples'] == 3 and len(merged['intents']) == 4
+
+
+def test_invalid_training_data(intents):
+    with pytest.raises(KeyError):
+        merge_intents(intents, {'otra': []})
+    with pytest.raises(TypeError):
+        merge_intents(intents, ['Saludo'])
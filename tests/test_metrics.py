@@ -0,0 +1,99 @@
+'''
+Instrumentation: latency histograms, counters, their JSON and Prometheus exports, the sampled
+profiler and the HTTP endpoint.
+'''
+
+import json
+import socket
+import urllib.request
+import urllib.error
+
+import pytest
+
+from src import metrics as metrics_module
+from src.metrics import Histogram, MetricsRegistry, worker_path
+
+
+def test_histogram_quantiles():
+    histogram = Histogram(buckets=(0.001, 0.01, 0.1))
+    for value in [0.0005] * 50 + [0.005] * 49 + [0.05]:
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 0.001
+    assert histogram.quantile(0.99) == 0.01
+    assert histogram.quantile(1.0) == 0.1
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_values_above_the_last_bucket_are_clamped():
+    histogram = Histogram(buckets=(0.001, 0.01))
+    histogram.observe(30.0)
+    assert histogram.counts == [0, 0, 1]
+    assert histogram.quantile(0.99) == 0.01
+    assert histogram.sum == 30.0
+
+
+def test_timer_records_failed_blocks():
+    registry = MetricsRegistry()
+    with registry.timer('etapa'):
+        pass
+    with pytest.raises(ValueError):
+        with registry.timer('etapa'):
+            raise ValueError()
+    registry.inc('mensajes')
+    registry.inc('mensajes', 2)
+    exported = registry.to_dict()
+    assert exported['counters'] == {'mensajes': 3}
+    assert exported['stages']['etapa']['count'] == 2
+    json.dumps(exported)
+
+
+def test_prometheus_format():
+    registry = MetricsRegistry()
+    registry.inc('errors')
+    registry.observe('nb_scoring', 0.0003)
+    registry.observe('nb_scoring', 20.0)
+    lines = registry.to_prometheus().splitlines()
+    assert '# TYPE chatbot_errors_total counter' in lines
+    assert 'chatbot_errors_total 1' in lines
+    assert '# TYPE chatbot_stage_seconds histogram' in lines
+    assert 'chatbot_stage_seconds_bucket{stage="nb_scoring",le="0.00025"} 0' in lines
+    assert 'chatbot_stage_seconds_bucket{stage="nb_scoring",le="0.0005"} 1' in lines
+    assert 'chatbot_stage_seconds_bucket{stage="nb_scoring",le="10.0"} 1' in lines
+    assert 'chatbot_stage_seconds_bucket{stage="nb_scoring",le="+Inf"} 2' in lines
+    assert 'chatbot_stage_seconds_count{stage="nb_scoring"} 2' in lines
+
+
+def test_dump_and_sampled_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics_module, 'PROFILE_SAMPLE_RATE', 1.0)
+    registry = MetricsRegistry()
+    with registry.profile():
+        sorted(range(1000))
+    registry.dump(str(tmp_path / 'metrics.json'), str(tmp_path / 'profile.txt'))
+    with open(tmp_path / 'metrics.json', encoding='utf-8') as f:
+        assert 'counters' in json.load(f)
+    assert (tmp_path / 'profile.txt').read_text(encoding='utf-8').startswith('Mensajes perfilados: 1')
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['metrics.json', 'profile.txt']
+
+
+def test_worker_path():
+    assert worker_path('/tmp/metrics.json', 2) == '/tmp/metrics.2.json'
+    assert worker_path('/tmp/metrics.json', None) == '/tmp/metrics.json'
+    assert worker_path(None, 1) is None
+
+
+def test_http_endpoint(monkeypatch):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    monkeypatch.setattr(metrics_module, 'METRICS_PORT', port)
+    monkeypatch.setattr(metrics_module, 'METRICS_DUMP_PATH', None)
+    monkeypatch.setattr(metrics_module, '_exporters_started', False)
+    metrics_module.metrics.inc('test_requests')
+    metrics_module.start_exporters()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            assert 'chatbot_test_requests_total' in response.read().decode('utf-8')
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/otra", timeout=5)
+    finally:
+        metrics_module.stop_exporters()
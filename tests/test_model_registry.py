@@ -0,0 +1,124 @@
+'''
+Retention and rollback of the model registry. Models are only deleted by prune (or when a retention
+is given explicitly), and the active version is always kept. Processes that register models at the
+same time do not lose each other's versions.
+'''
+
+import os
+import json
+import multiprocessing
+
+import pytest
+
+from constants import MODEL_RETENTION
+from src.model_registry import ModelRegistry, main
+
+
+VERSIONS = ['2024-01-01_00-00-00', '2024-01-02_00-00-00', '2024-01-03_00-00-00',
+            '2024-01-04_00-00-00']
+
+
+# Creates the file of a model and its compact copy
+def create_model(models_path, version):
+    filename = f"trained_model_{version}.pkl"
+    with open(os.path.join(models_path, filename), 'wb') as f:
+        f.write(b'modelo')
+    os.makedirs(os.path.join(models_path, f"trained_model_{version}_compact"))
+    return filename
+
+
+# Registers every version in order and returns the registry
+def registry_with(models_path, versions=VERSIONS, retention=None):
+    registry = ModelRegistry(str(models_path), retention=retention)
+    for version in versions:
+        registry.register(create_model(str(models_path), version), data_hash=version)
+    return registry
+
+
+def model_files(models_path):
+    return sorted(filename for filename in os.listdir(models_path) if filename.endswith('.pkl'))
+
+
+def test_models_are_kept_by_default(tmp_path):
+    assert MODEL_RETENTION is None
+    registry = registry_with(tmp_path, retention=MODEL_RETENTION)
+    assert len(model_files(tmp_path)) == len(VERSIONS)
+    manifest = registry.load()
+    assert manifest['active'] == VERSIONS[-1]
+    assert [entry['version'] for entry in manifest['versions']] == VERSIONS
+
+
+def test_explicit_retention_prunes_on_register(tmp_path):
+    registry = registry_with(tmp_path, retention=2)
+    assert model_files(tmp_path) == [f"trained_model_{version}.pkl" for version in VERSIONS[-2:]]
+    assert not os.path.exists(tmp_path / f"trained_model_{VERSIONS[0]}_compact")
+    assert [entry['version'] for entry in registry.load()['versions']] == VERSIONS[-2:]
+
+
+def test_prune_keeps_the_active_version(tmp_path):
+    registry = registry_with(tmp_path)
+    registry.activate(VERSIONS[0])
+    removed = registry.prune(1)
+    assert removed == VERSIONS[1:3]
+    assert model_files(tmp_path) == [f"trained_model_{version}.pkl"
+                                        for version in (VERSIONS[0], VERSIONS[-1])]
+    assert registry.active_model_path() == os.path.join(str(tmp_path),
+                                                        f"trained_model_{VERSIONS[0]}.pkl")
+
+
+def test_rollback_pins_the_previous_version(tmp_path):
+    registry = registry_with(tmp_path, VERSIONS[:3])
+    assert registry.rollback() == VERSIONS[1]
+    manifest = registry.load()
+    assert manifest['active'] == VERSIONS[1] and manifest['pinned']
+    # A new model does not replace the pinned version until unpin
+    registry.register(create_model(str(tmp_path), VERSIONS[3]))
+    assert registry.load()['active'] == VERSIONS[1]
+    registry.unpin()
+    registry.register(create_model(str(tmp_path), '2024-01-05_00-00-00'))
+    assert registry.load()['active'] == '2024-01-05_00-00-00'
+
+
+def test_rollback_without_previous_version(tmp_path):
+    registry = registry_with(tmp_path, VERSIONS[:1])
+    with pytest.raises(ValueError):
+        registry.rollback()
+
+
+def test_bootstrap_from_existing_files(tmp_path):
+    for version in VERSIONS[:2]:
+        create_model(str(tmp_path), version)
+    registry = ModelRegistry(str(tmp_path), retention=None)
+    assert registry.active_model_path().endswith(f"trained_model_{VERSIONS[1]}.pkl")
+    with open(tmp_path / 'registry.json', encoding='utf-8') as f:
+        assert len(json.load(f)['versions']) == 2
+
+
+def test_prune_command_requires_keep(capsys):
+    with pytest.raises(SystemExit):
+        main(['prune'])
+    assert '--keep' in capsys.readouterr().err
+
+
+# Registers the versions one by one from a separate process
+def register_versions(models_path, versions):
+    registry = ModelRegistry(models_path, retention=None)
+    for version in versions:
+        registry.register(create_model(models_path, version))
+
+
+def test_concurrent_registrations_are_all_kept(tmp_path):
+    versions = [f"2024-02-{day:02d}_00-00-{second:02d}" for day in range(1, 5) for second in range(10)]
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=register_versions, args=(str(tmp_path), versions[i::4]))
+                    for i in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert all(process.exitcode == 0 for process in processes)
+    manifest = ModelRegistry(str(tmp_path)).load()
+    assert [entry['version'] for entry in manifest['versions']] == versions
+    # Only the manifest and its lock are left, no temporary files
+    assert sorted(name for name in os.listdir(tmp_path) if 'registry' in name) == \
+        ['registry.json', 'registry.json.lock']
@@ -0,0 +1,66 @@
+'''
+Model watcher: a change is only handled once it has been stable for a whole check, and a new
+training file is trained on in another process before the classifier is reloaded.
+'''
+
+import os
+
+from src import chatbot
+from src.model_watcher import ModelWatcher
+from src.model_registry import ModelRegistry
+from conftest import write_json
+
+
+# Watcher of the directories of the classifier fixture
+def watcher_of(classifier):
+    return ModelWatcher(interval=0, data_path=classifier.data_path, models_path=classifier.models_path)
+
+
+def test_a_change_is_handled_once_stable(classifier, intents):
+    watcher = watcher_of(classifier)
+    watcher.acknowledge()
+    assert not watcher.poll()
+    write_json(intents, os.path.join(classifier.data_path, 'intents_train.json'))
+    assert not watcher.poll()
+    assert watcher.poll()
+    watcher.acknowledge()
+    assert not watcher.poll()
+
+
+def test_a_change_still_being_written_waits(classifier, intents):
+    watcher = watcher_of(classifier)
+    watcher.acknowledge()
+    train_file = os.path.join(classifier.data_path, 'intents_train.json')
+    write_json(intents, train_file)
+    assert not watcher.poll()
+    intents['intents'][0]['examples'].append('Saludos cordiales')
+    write_json(intents, train_file)
+    assert not watcher.poll()
+    assert watcher.poll()
+
+
+def test_reload_trains_in_another_process(classifier, intents, monkeypatch):
+    reloads = []
+    monkeypatch.setattr(chatbot, 'reload_classifier', lambda: reloads.append(os.getpid()) or object())
+    before = ModelRegistry(classifier.models_path).active_model_path()
+    intents['intents'][0]['examples'].append('Saludos cordiales')
+    write_json(intents, os.path.join(classifier.data_path, 'intents_train.json'))
+    watcher = watcher_of(classifier)
+    watcher._reload()
+    assert reloads == [os.getpid()]
+    assert watcher.reloads == 1
+    assert not os.path.exists(os.path.join(classifier.data_path, 'intents_train.json'))
+    assert ModelRegistry(classifier.models_path).active_model_path() != before
+
+
+def test_failed_build_keeps_the_current_classifier(classifier, monkeypatch):
+    reloads = []
+    monkeypatch.setattr(chatbot, 'reload_classifier', lambda: reloads.append(1))
+    with open(os.path.join(classifier.data_path, 'intents.json'), 'w') as f:
+        f.write('{no es json')
+    with open(os.path.join(classifier.data_path, 'intents_train.json'), 'w') as f:
+        f.write('{no es json')
+    watcher = watcher_of(classifier)
+    watcher._reload()
+    assert reloads == []
+    assert watcher.reloads == 0
@@ -0,0 +1,48 @@
+'''
+Batch prediction: a list of messages is scored in a single vectorized call and gives the same
+results as scoring them one at a time.
+'''
+
+import numpy as np
+
+from src import chatbot
+
+
+MESSAGES = ['hola amigo', 'muchas gracias', 'nos vemos mañana', 'hola amigo', 'algo distinto']
+
+
+def test_batch_matches_the_model(classifier):
+    classifier.prediction_cache = None
+    results = classifier.predict_batch(MESSAGES)
+    probabilities = classifier.model.predict_proba(MESSAGES)
+    assert [result['intent'] for result in results] == list(classifier.model.predict(MESSAGES))
+    np.testing.assert_allclose([result['probability'] for result in results],
+                                probabilities.max(axis=1))
+    assert results[1]['response'] == '¡De nada!'
+
+
+def test_repeated_messages_are_scored_once(classifier, monkeypatch):
+    classifier.prediction_cache = None
+    scored = []
+    score_batch = classifier.score_batch
+
+    def spy(messages, snapshot):
+        scored.append(list(messages))
+        return score_batch(messages, snapshot)
+
+    monkeypatch.setattr(classifier, 'score_batch', spy)
+    results = classifier.predict_batch(MESSAGES)
+    assert scored == [['hola amigo', 'muchas gracias', 'nos vemos mañana', 'algo distinto']]
+    assert results[0] == results[3]
+    assert len(results) == len(MESSAGES)
+
+
+def test_empty_batch(classifier):
+    assert classifier.predict_batch([]) == []
+
+
+def test_process_messages_uses_the_published_classifier(classifier, monkeypatch):
+    monkeypatch.setattr(chatbot, 'classifier', classifier)
+    results = chatbot.process_messages(iter(['hola', 'gracias']))
+    assert [result['intent'] for result in results] == ['Saludo', 'Agradecimiento']
+    assert chatbot.process_message('adiós') == '¡Hasta pronto!'
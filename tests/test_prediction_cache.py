@@ -0,0 +1,94 @@
+'''
+Prediction cache: repeated messages are answered without the model, the cache is bounded in size
+and age, and both tiers are emptied when the model or intents.json changes.
+'''
+
+from src import prediction_cache
+from src.prediction_cache import PredictionCache
+from src.response_store import Snapshot
+
+
+# Snapshot of intents.json with the given digest
+def snapshot(data, digest):
+    intent_map = {item['intent']: item.get('response') for item in data['intents']}
+    return Snapshot(0, 0, digest, data, intent_map, 0)
+
+
+RESULT = {'intent': 'Saludo', 'response': '¡Hola! ¿En qué puedo ayudarte hoy?', 'probability': 0.9}
+
+
+def test_stored_results_are_hits(intents):
+    cache = PredictionCache(max_size=10, ttl=None)
+    current = snapshot(intents, 'a')
+    assert cache.lookup(['¿Hola amiga?'], 'modelo_1', current) == [None]
+    cache.store(['¿Hola amiga?'], [RESULT], 'modelo_1', current)
+    assert cache.lookup(['hola   AMIGA'], 'modelo_1', current) == [RESULT]
+    assert cache.stats()['hits'] == 1
+
+
+def test_exact_matches_skip_the_model(intents):
+    cache = PredictionCache(max_size=10, ttl=None)
+    result, = cache.lookup(['Muchas gracias!'], 'modelo_1', snapshot(intents, 'a'))
+    assert result == {'intent': 'Agradecimiento', 'response': '¡De nada!', 'probability': None}
+    assert cache.stats()['exact_hits'] == 1
+
+
+def test_least_recently_used_results_are_evicted(intents):
+    cache = PredictionCache(max_size=2, ttl=None)
+    current = snapshot(intents, 'a')
+    cache.lookup(['uno'], 'modelo_1', current)
+    cache.store(['uno', 'dos'], [RESULT, RESULT], 'modelo_1', current)
+    cache.lookup(['uno'], 'modelo_1', current)
+    cache.store(['tres'], [RESULT], 'modelo_1', current)
+    assert cache.lookup(['uno', 'dos', 'tres'], 'modelo_1', current) == [RESULT, None, RESULT]
+    assert cache.stats()['evictions'] == 1
+
+
+def test_results_expire(intents, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(prediction_cache.time, 'monotonic', lambda: now[0])
+    cache = PredictionCache(max_size=10, ttl=60)
+    current = snapshot(intents, 'a')
+    cache.lookup(['uno'], 'modelo_1', current)
+    cache.store(['uno'], [RESULT], 'modelo_1', current)
+    now[0] += 59
+    assert cache.lookup(['uno'], 'modelo_1', current) == [RESULT]
+    now[0] += 2
+    assert cache.lookup(['uno'], 'modelo_1', current) == [None]
+    assert cache.stats()['expirations'] == 1
+
+
+def test_new_model_empties_the_cache(intents):
+    cache = PredictionCache(max_size=10, ttl=None)
+    current = snapshot(intents, 'a')
+    cache.lookup(['hola amiga'], 'modelo_1', current)
+    cache.store(['hola amiga'], [RESULT], 'modelo_1', current)
+    assert cache.lookup(['hola amiga'], 'modelo_2', current) == [None]
+    assert cache.stats()['invalidations'] == 1
+    assert cache.stats()['size'] == 0
+
+
+def test_new_intents_file_rebuilds_the_index(intents):
+    cache = PredictionCache(max_size=10, ttl=None)
+    assert cache.lookup(['saludos cordiales'], 'modelo_1', snapshot(intents, 'a')) == [None]
+    intents['intents'][0]['examples'].append('saludos cordiales')
+    result, = cache.lookup(['saludos cordiales'], 'modelo_1', snapshot(intents, 'b'))
+    assert result['intent'] == 'Saludo'
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_results_of_a_replaced_model_are_not_stored(intents):
+    cache = PredictionCache(max_size=10, ttl=None)
+    current = snapshot(intents, 'a')
+    cache.lookup(['hola amiga'], 'modelo_1', current)
+    # The model was replaced while the message was being scored
+    cache.lookup(['otra cosa'], 'modelo_2', current)
+    cache.store(['hola amiga'], [RESULT], 'modelo_1', current)
+    assert cache.lookup(['hola amiga'], 'modelo_2', current) == [None]
+
+
+def test_classifier_answers_repeated_messages_from_the_cache(classifier):
+    first = classifier.classify('hola, buenas noches')
+    second = classifier.classify('¡Hola, buenas   noches!')
+    assert first == second and first['intent'] == 'Saludo'
+    assert classifier.prediction_cache.stats()['hits'] == 1
@@ -0,0 +1,94 @@
+'''
+Pre-fork supervisor: crashed workers are replaced, also while a new model is being prepared in a
+child process, and the workers are rolled to a new generation once the model is ready.
+'''
+
+import gc
+import os
+import time
+import signal
+import asyncio
+import argparse
+
+import pytest
+
+from src import chatbot
+from src import prefork
+from src.prefork import PreforkSupervisor, create_listening_socket
+
+
+# Worker that only waits until it is stopped
+async def idle_worker(sock, options, worker=None):
+    await asyncio.sleep(3600)
+
+
+# Classifier whose construction takes a while, like a retraining
+class SlowClassifier:
+
+    def __init__(self):
+        time.sleep(1.0)
+        self.model = object()
+
+
+class FailingClassifier:
+
+    def __init__(self):
+        raise ValueError("intents.json no es válido")
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    monkeypatch.setattr(prefork, 'run_worker', idle_worker)
+    monkeypatch.setattr(prefork, 'PREFORK_RESTART_DELAY', 0)
+    args = argparse.Namespace(host='127.0.0.1', port=0, workers=2, max_batch_size=8, max_wait_ms=1,
+                                max_queue_size=16, watch=False)
+    supervisor = PreforkSupervisor(args)
+    supervisor.sock = create_listening_socket('127.0.0.1', 0)
+    for worker in range(supervisor.workers):
+        supervisor.spawn(worker)
+    yield supervisor
+    supervisor.shutdown()
+    # Loading a new model freezes the objects of the process, like before forking the workers
+    gc.unfreeze()
+
+
+# Reaps the children until the condition holds
+def wait_until(supervisor, condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        supervisor.reap()
+        time.sleep(0.02)
+
+
+def test_crashed_worker_is_replaced(supervisor):
+    pid, (_, _, worker) = next(iter(supervisor.children.items()))
+    os.kill(pid, signal.SIGKILL)
+    wait_until(supervisor, lambda: supervisor.restarts == 1)
+    assert pid not in supervisor.children
+    assert sorted(number for _, _, number in supervisor.children.values()) == [0, 1]
+
+
+def test_workers_are_replaced_while_the_model_is_built(supervisor, monkeypatch):
+    monkeypatch.setattr(prefork, 'IntentClassifier', SlowClassifier)
+    monkeypatch.setattr(chatbot, 'reload_classifier', lambda: object())
+    old = set(supervisor.children)
+    supervisor.build()
+    os.kill(next(iter(old)), signal.SIGKILL)
+    wait_until(supervisor, lambda: supervisor.restarts == 1)
+    # The worker was replaced before the new model was ready
+    assert supervisor.builder is not None and supervisor.rolls == 0
+    wait_until(supervisor, lambda: supervisor.builder is None)
+    assert supervisor.rolls == 1 and supervisor.generation == 1
+    wait_until(supervisor, lambda: all(generation == 1
+                                        for generation, _, _ in supervisor.children.values()))
+    assert len(supervisor.children) == 2 and not old & set(supervisor.children)
+
+
+def test_failed_build_keeps_the_workers(supervisor, monkeypatch):
+    monkeypatch.setattr(prefork, 'IntentClassifier', FailingClassifier)
+    workers = set(supervisor.children)
+    supervisor.build()
+    wait_until(supervisor, lambda: supervisor.builder is None)
+    assert supervisor.rolls == 0 and supervisor.generation == 0
+    assert set(supervisor.children) == workers
@@ -0,0 +1,56 @@
+'''
+ResponseStore keeps the intent -> response map of intents.json in memory and reloads it only when
+the file changes.
+'''
+
+import os
+
+import pytest
+
+from conftest import write_json
+from src.response_store import ResponseStore
+
+
+@pytest.fixture
+def intents_path(data_path):
+    return os.path.join(data_path, 'intents.json')
+
+
+def test_responses_come_from_the_file(intents_path):
+    store = ResponseStore(intents_path)
+    assert store.get_response('Saludo') == '¡Hola! ¿En qué puedo ayudarte hoy?'
+    assert store.get_response('Inexistente') is None
+    stats = store.stats()
+    assert (stats['hits'], stats['misses'], stats['intents']) == (1, 1, 3)
+
+
+def test_changed_file_is_reloaded(intents_path, intents):
+    store = ResponseStore(intents_path, check_interval=0)
+    intents['intents'][1]['response'] = '¡Que te vaya bien!'
+    write_json(intents, intents_path)
+    # Make sure the change is visible even if the modification time did not move
+    os.utime(intents_path, ns=(0, 0))
+    assert store.get_response('Despedida') == '¡Que te vaya bien!'
+    assert store.reloads == 2
+
+
+def test_same_content_is_not_parsed_again(intents_path):
+    store = ResponseStore(intents_path, check_interval=0)
+    digest = store.stats()['digest']
+    os.utime(intents_path, ns=(0, 0))
+    assert not store.reload()
+    assert store.reloads == 1
+    assert store.stats()['digest'] == digest
+
+
+def test_invalid_file_keeps_the_previous_version(intents_path):
+    store = ResponseStore(intents_path, check_interval=0)
+    with open(intents_path, 'w', encoding='utf-8') as f:
+        f.write('{"intents": [')
+    assert store.get_response('Saludo') == '¡Hola! ¿En qué puedo ayudarte hoy?'
+    assert store.failed_reloads == 1
+
+
+def test_missing_file_fails_on_first_load(tmp_path):
+    with pytest.raises(Exception):
+        ResponseStore(str(tmp_path / 'intents.json'))
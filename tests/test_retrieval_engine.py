@@ -0,0 +1,60 @@
+'''
+Retrieval engine: the top-k search with early termination returns the same examples as scoring
+every example, and messages below the confidence threshold get the unknown intent fallback, both
+in batches and one at a time.
+'''
+
+import numpy as np
+import pytest
+
+from constants import UNKNOWN_INTENT, UNKNOWN_INTENT_RESPONSE
+from benchmarks.common import spanish_corpus
+from src import intent_classifier_model
+from src.intent_classifier_model import IntentClassifier
+from src.retrieval_engine import RetrievalClassifier
+from src.utils import get_training_examples
+
+
+@pytest.fixture
+def retrieval_classifier(tmp_path, data_path, monkeypatch):
+    monkeypatch.setattr(intent_classifier_model, 'CLASSIFIER_ENGINE', 'retrieval')
+    return IntentClassifier(data_path, str(tmp_path / 'models'))
+
+
+def test_top_k_matches_scoring_every_example():
+    X, y = get_training_examples(spanish_corpus(20, 30, vocabulary_size=300, seed=3))
+    engine = RetrievalClassifier(top_k=5).fit(X, y)
+    queries = X[::37] + [' '.join(X[1].split()[:2] + X[500].split()[:2])]
+    Q = engine.transform(queries)
+    exact = (Q @ engine.examples_matrix.T).toarray()
+    for row, (ids, scores) in enumerate(engine.search_transformed(Q)):
+        expected = np.sort(exact[row])[::-1][:5]
+        np.testing.assert_allclose(scores, expected, rtol=1e-5)
+        np.testing.assert_allclose(exact[row][ids], scores, rtol=1e-5)
+
+
+def test_search_returns_the_evidence(intents):
+    engine = RetrievalClassifier(top_k=2).fit(*get_training_examples(intents))
+    nearest, = engine.search(['muchas gracias amigo'])
+    assert len(nearest) == 2
+    assert nearest[0] == {'example': 'Muchas gracias', 'intent': 'Agradecimiento',
+                            'similarity': pytest.approx(nearest[0]['similarity'])}
+    assert nearest[0]['similarity'] >= nearest[1]['similarity']
+    assert engine.search(['xyz'])[0] == []
+
+
+def test_unknown_messages_get_the_fallback(retrieval_classifier):
+    known, unknown = retrieval_classifier.predict_batch(['hola amigo', 'zzz qwerty'])
+    assert known['intent'] == 'Saludo'
+    assert unknown == {'intent': UNKNOWN_INTENT, 'response': UNKNOWN_INTENT_RESPONSE,
+                        'probability': 0.0}
+    assert retrieval_classifier.predict('zzz qwerty') == UNKNOWN_INTENT
+    assert retrieval_classifier.predict('hola amigo') == 'Saludo'
+    assert retrieval_classifier.nearest_examples(['hasta luego'], k=1)[0][0]['intent'] == 'Despedida'
+
+
+def test_threshold_of_the_other_engines(classifier, monkeypatch):
+    monkeypatch.setattr(intent_classifier_model, 'UNKNOWN_INTENT_THRESHOLD', 0.99)
+    classifier.prediction_cache = None
+    assert classifier.predict_batch(['hola amigo'])[0]['intent'] == UNKNOWN_INTENT
+    assert classifier.predict('hola amigo') == UNKNOWN_INTENT
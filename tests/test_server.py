@@ -0,0 +1,242 @@
+'''
+HTTP inference server: the micro-batching of the queued messages against a small trained model,
+and the requests that are rejected before reaching the model.
+'''
+
+import json
+import time
+import asyncio
+import threading
+
+import pytest
+
+import src.server as server_module
+from src.server import InferenceServer, MicroBatcher, QueueFullError
+
+
+# Replaces the classifier used by the batcher with the trained one of the fixture and records the
+# messages of every predict_batch call
+@pytest.fixture
+def batches(classifier, monkeypatch):
+    calls = []
+    predict_batch = classifier.predict_batch
+
+    def spy(messages):
+        calls.append(list(messages))
+        return predict_batch(messages)
+
+    monkeypatch.setattr(classifier, 'predict_batch', spy)
+    monkeypatch.setattr(server_module, 'get_classifier', lambda tenant=None: classifier)
+    return calls
+
+
+# Starts a batcher, runs the coroutine function with it and stops it
+def with_batcher(body, **options):
+    async def run():
+        batcher = MicroBatcher(**options)
+        batcher.start()
+        try:
+            return await body(batcher)
+        finally:
+            await batcher.stop()
+    return asyncio.run(run())
+
+
+def test_concurrent_requests_share_one_batch(batches):
+    async def body(batcher):
+        return await asyncio.gather(batcher.submit(['hola']), batcher.submit(['gracias']),
+                                    batcher.submit(['adiós', 'hola amigo']))
+    results = with_batcher(body, max_batch_size=64, max_wait_ms=50)
+    assert batches == [['hola', 'gracias', 'adiós', 'hola amigo']]
+    assert [[result['intent'] for result in group] for group in results] == \
+        [['Saludo'], ['Agradecimiento'], ['Despedida', 'Saludo']]
+
+
+def test_full_batch_is_flushed(batches):
+    async def body(batcher):
+        return await batcher.submit(['hola', 'gracias', 'adiós', 'chao', 'mil gracias'])
+    results = with_batcher(body, max_batch_size=2, max_wait_ms=1000)
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert len(results) == 5
+
+
+def test_waiting_window_flushes_a_partial_batch(batches):
+    async def body(batcher):
+        start = time.perf_counter()
+        first = await batcher.submit(['hola'])
+        elapsed = time.perf_counter() - start
+        await batcher.submit(['gracias'])
+        return first, elapsed
+    (result,), elapsed = with_batcher(body, max_batch_size=64, max_wait_ms=20)
+    assert result['intent'] == 'Saludo'
+    # The first message did not wait for a second one beyond the window
+    assert 0.015 <= elapsed < 1
+    assert batches == [['hola'], ['gracias']]
+
+
+def test_full_queue_rejects_requests(classifier, monkeypatch):
+    release = threading.Event()
+
+    def blocked_predict(messages, tenant=None):
+        release.wait(5)
+        return classifier.predict_batch(messages)
+
+    monkeypatch.setattr(MicroBatcher, '_predict', staticmethod(blocked_predict))
+
+    async def body(batcher):
+        first = asyncio.ensure_future(batcher.submit(['hola']))
+        # The batcher takes the first message and blocks on it
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(batcher.submit(['gracias', 'adiós']))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await batcher.submit(['chao'])
+        release.set()
+        return await first, await queued, batcher.metrics.rejected
+    first, queued, rejected = with_batcher(body, max_batch_size=1, max_wait_ms=0, max_queue_size=2)
+    assert first[0]['intent'] == 'Saludo' and len(queued) == 2
+    assert rejected == 1
+
+
+def test_dead_batcher_fails_its_requests_and_restarts(batches):
+    async def body(batcher):
+        # A tenant that cannot be grouped makes the batching task fail
+        with pytest.raises(Exception, match="lote"):
+            await asyncio.wait_for(batcher.submit(['hola'], tenant=['no', 'válido']), 5)
+        return await asyncio.wait_for(batcher.submit(['gracias']), 5), batcher.metrics.errors
+    (result,), errors = with_batcher(body)
+    assert result['intent'] == 'Agradecimiento'
+    assert errors == 1
+
+
+# Sends a raw HTTP request to a server listening on a free port and returns the status, the JSON
+# payload and whether the server closed the connection afterwards
+async def exchange(raw, **limits):
+    server = InferenceServer(watch=False)
+    vars(server).update(limits)
+    listener = await asyncio.start_server(server.handle_connection, '127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(raw)
+        await writer.drain()
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode('latin-1').split("\r\n")
+        headers = dict(line.lower().split(": ", 1) for line in lines[1:] if line)
+        body = await reader.readexactly(int(headers['content-length']))
+        closed = headers['connection'] == 'close' and await reader.read() == b""
+        writer.close()
+        return int(lines[0].split(" ")[1]), json.loads(body), closed
+    finally:
+        listener.close()
+        await listener.wait_closed()
+
+
+# Sends a POST /predict request with the given body
+def post(body, content_length=None, **limits):
+    length = len(body) if content_length is None else content_length
+    raw = (f"POST /predict HTTP/1.1\r\nHost: localhost\r\nContent-Length: {length}\r\n"
+            f"Connection: close\r\n\r\n").encode('latin-1') + body
+    return asyncio.run(exchange(raw, **limits))
+
+
+def test_predict_over_http(batches):
+    async def run():
+        server = InferenceServer(watch=False, max_wait_ms=1)
+        server.batcher.start()
+        try:
+            listener = await asyncio.start_server(server.handle_connection, '127.0.0.1', 0)
+            port = listener.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            body = json.dumps({'messages': ['hola', 'gracias']}).encode('utf-8')
+            writer.write(f"POST /predict HTTP/1.1\r\nContent-Length: {len(body)}\r\n"
+                            f"Connection: close\r\n\r\n".encode('latin-1') + body)
+            response = await reader.read()
+            writer.close()
+            listener.close()
+            return response
+        finally:
+            await server.batcher.stop()
+    head, body = asyncio.run(run()).split(b"\r\n\r\n", 1)
+    assert head.startswith(b"HTTP/1.1 200")
+    assert [result['intent'] for result in json.loads(body)['results']] == ['Saludo', 'Agradecimiento']
+
+
+def test_body_larger_than_the_limit_is_rejected():
+    status, payload, closed = post(b'{"message": "hola"}', content_length=10 ** 9)
+    assert status == 413
+    assert closed
+    status, _, _ = post(b'{"message": "' + b'a' * 200 + b'"}', max_body_size=100)
+    assert status == 413
+
+
+def test_slow_body_times_out():
+    raw = b"POST /predict HTTP/1.1\r\nContent-Length: 50\r\n\r\n{\"message\""
+    status, _, closed = asyncio.run(exchange(raw, read_timeout=0.2))
+    assert status == 408
+    assert closed
+
+
+def test_idle_connection_is_closed():
+    async def run():
+        server = InferenceServer(watch=False)
+        server.read_timeout = 0.2
+        listener = await asyncio.start_server(server.handle_connection, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        # Half a request head, never finished
+        writer.write(b"GET /health HTTP/1.1\r\n")
+        closed = await asyncio.wait_for(reader.read(), 5) == b""
+        writer.close()
+        listener.close()
+        return closed
+    assert asyncio.run(run())
+
+
+def test_non_numeric_content_length_is_rejected():
+    status, payload, closed = post(b'{"message": "hola"}', content_length='abc')
+    assert status == 400
+    assert 'Content-Length' in payload['error']
+    assert closed
+
+
+def test_negative_content_length_is_rejected():
+    status, _, closed = post(b'', content_length=-5)
+    assert status == 400
+    assert closed
+
+
+def test_non_object_json_body_is_rejected():
+    for body in (b'[1, 2]', b'"hola"', b'3', b'null'):
+        status, payload, _ = post(body)
+        assert status == 400, body
+        assert payload['error'] == "Se esperaba un objeto JSON."
+
+
+def test_invalid_json_is_rejected():
+    status, _, _ = post(b'{"message": ')
+    assert status == 400
+
+
+def test_invalid_messages_are_rejected():
+    for request in ({'message': 3}, {'messages': 'hola'}, {'messages': ['hola', 1]},
+                    {'message': 'hola', 'tenant': 5}):
+        status, _, _ = post(json.dumps(request).encode('utf-8'))
+        assert status == 400, request
+
+
+def test_empty_message_list_needs_no_model():
+    status, payload, _ = post(b'{"messages": []}')
+    assert status == 200
+    assert payload == {'results': []}
+
+
+def test_malformed_request_line_is_rejected():
+    status, _, closed = asyncio.run(exchange(b"HOLA\r\n\r\n"))
+    assert status == 400
+    assert closed
+
+
+def test_unknown_route():
+    status, _, _ = asyncio.run(exchange(b"GET /nada HTTP/1.1\r\nConnection: close\r\n\r\n"))
+    assert status == 404
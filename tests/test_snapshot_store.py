@@ -0,0 +1,104 @@
+'''
+Snapshot store: versions are rebuilt as the original dictionaries, intents are written once, the
+history is appended line by line, and a retraining only hashes the intents its merge changed.
+'''
+
+import os
+import copy
+import json
+
+import pytest
+
+from src import snapshot_store
+from src.intent_classifier_model import IntentClassifier
+from src.model_registry import file_hash
+from src.snapshot_store import SnapshotStore
+from src.utils import load_data
+from conftest import write_json
+
+
+# Counts the intents serialized to be hashed
+@pytest.fixture
+def hashed(monkeypatch):
+    intents = []
+    canonical_json = snapshot_store.canonical_json
+
+    def spy(value):
+        if 'intent' in value:
+            intents.append(value['intent'])
+        return canonical_json(value)
+
+    monkeypatch.setattr(snapshot_store, 'canonical_json', spy)
+    return intents
+
+
+def test_versions_are_rebuilt_and_deduplicated(tmp_path, intents):
+    store = SnapshotStore(str(tmp_path))
+    first = store.save(intents, 'intents', 'v1')
+    changed = copy.deepcopy(intents)
+    changed['intents'][0]['examples'].append('Saludos')
+    second = store.save(changed, 'intents', 'v2')
+    assert (first['written_intents'], second['written_intents']) == (3, 1)
+    assert store.load('v1') == intents and store.load('v2') == changed
+    assert store.find(second['version'][:8])['name'] == 'v2'
+    assert store.save(intents, 'intents', 'v3')['version'] == first['version']
+    assert store.stats()['objects'] == 4 and store.stats()['versions'] == 2
+
+
+def test_history_is_appended(tmp_path, intents):
+    store = SnapshotStore(str(tmp_path))
+    # History written by the previous versions, as a single JSON document
+    write_json({'snapshots': [{'name': 'antiguo', 'kind': 'intents', 'version': '0' * 64}]},
+                tmp_path / 'index.json')
+    store.save(intents, 'intents', 'v1')
+    store.save(intents, 'train', 't1')
+    with open(tmp_path / 'index.jsonl', 'a', encoding='utf-8') as f:
+        f.write('{"name": "cortado')
+    assert [entry['name'] for entry in store.list()] == ['antiguo', 'v1', 't1']
+    with open(tmp_path / 'index.jsonl', encoding='utf-8') as f:
+        assert len(f.readlines()) == 3
+
+
+def test_extending_a_version_hashes_the_changed_intents(tmp_path, intents, hashed):
+    store = SnapshotStore(str(tmp_path))
+    base, _ = store.store_version(intents)
+    hashed.clear()
+    intents['intents'][1]['examples'].append('Chao')
+    intents['intents'].append({'intent': 'Ayuda', 'examples': ['Ayuda'], 'response': 'Claro.'})
+    version, written = store.store_version(intents, base, changed=[1])
+    assert hashed == ['Despedida', 'Ayuda'] and written == 2
+    assert version == SnapshotStore(str(tmp_path / 'otro')).store_version(intents)[0]
+
+
+def test_retraining_does_not_rehash_its_own_intents_file(classifier, hashed):
+    train_file = os.path.join(classifier.data_path, 'intents_train.json')
+    write_json({'intents': [{'intent': 'Saludo', 'examples': ['Buenas noches']}]}, train_file)
+    IntentClassifier(classifier.data_path, classifier.models_path)
+    store = SnapshotStore(classifier.snapshots_path)
+    head = store.head()
+    assert head['file_hash'] == file_hash(classifier.intents_path)
+    written = load_data(classifier.intents_path)
+    hashed.clear()
+    write_json({'intents': [{'intent': 'Ayuda', 'examples': ['Necesito ayuda'],
+                                'response': '¿En qué te ayudo?'}]}, train_file)
+    IntentClassifier(classifier.data_path, classifier.models_path)
+    # Only the intent of the training file is hashed, twice: as the training file and as the new
+    # intent of intents.json
+    assert hashed == ['Ayuda', 'Ayuda']
+    entry = store.list('intents')[-1]
+    assert entry['version'] == head['version'] and store.load(entry['name']) == written
+
+
+def test_edited_intents_file_is_hashed_again(classifier, hashed):
+    train_file = os.path.join(classifier.data_path, 'intents_train.json')
+    write_json({'intents': [{'intent': 'Saludo', 'examples': ['Buenas noches']}]}, train_file)
+    IntentClassifier(classifier.data_path, classifier.models_path)
+    edited = load_data(classifier.intents_path)
+    edited['intents'][0]['response'] = '¡Buenas!'
+    write_json(edited, classifier.intents_path)
+    write_json({'intents': [{'intent': 'Saludo', 'examples': ['Hola a todos']}]}, train_file)
+    IntentClassifier(classifier.data_path, classifier.models_path)
+    store = SnapshotStore(classifier.snapshots_path)
+    assert store.load(store.list('intents')[-1]['name']) == edited
+    with open(classifier.intents_path, encoding='utf-8') as f:
+        assert json.load(f)['intents'][0]['response'] == '¡Buenas!'
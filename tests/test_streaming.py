@@ -0,0 +1,73 @@
+'''
+Streaming training: large files are read one intent (or line) at a time in chunks, invalid files
+are rejected, and the streamed model replaces the stored incremental statistics.
+'''
+
+import io
+import os
+import json
+
+import numpy as np
+import pytest
+
+from src import streaming
+from src.incremental_trainer import IncrementalTrainer
+from src.model_registry import ModelRegistry, file_hash
+from src.streaming import iter_chunks, iter_json_intents, validate_json_stream
+from src.utils import get_training_examples
+from conftest import write_json
+
+
+# Writes the intents as JSON Lines, one example per line
+def write_jsonl(intents, file_path):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        for intent in intents['intents']:
+            for example in intent['examples']:
+                f.write(json.dumps({'intent': intent['intent'], 'example': example}) + '\n')
+
+
+def test_json_and_jsonl_give_the_same_chunks(tmp_path, intents):
+    write_json(intents, tmp_path / 'train.json')
+    write_jsonl(intents, tmp_path / 'train.jsonl')
+    chunks = list(iter_chunks(str(tmp_path / 'train.json'), chunk_size=5))
+    assert [len(X) for X, _ in chunks] == [5, 5, 5, 3]
+    assert chunks == list(iter_chunks(str(tmp_path / 'train.jsonl'), chunk_size=5))
+    X = [example for X_chunk, _ in chunks for example in X_chunk]
+    y = [intent for _, y_chunk in chunks for intent in y_chunk]
+    assert (X, y) == get_training_examples(intents)
+
+
+def test_items_split_between_blocks(intents, monkeypatch):
+    monkeypatch.setattr(streaming, 'READ_BLOCK_SIZE', 16)
+    text = json.dumps(intents, ensure_ascii=False, indent=4)
+    assert list(iter_json_intents(io.StringIO(text))) == intents['intents']
+
+
+def test_invalid_files_are_rejected(tmp_path, intents):
+    text = json.dumps(intents)
+    with pytest.raises(ValueError):
+        list(iter_json_intents(io.StringIO(text[:-40])))
+    with pytest.raises(ValueError):
+        list(iter_json_intents(io.StringIO('{"intents": [{"intent": ' + ' ' * 200), max_item_size=100))
+    with open(tmp_path / 'bad.jsonl', 'w') as f:
+        f.write('{"intent": "Saludo", "example": "hola"}\n{no es json\n')
+    assert not validate_json_stream(str(tmp_path / 'bad.jsonl'))
+    write_json({'intents': [{'intent': 'Saludo'}]}, tmp_path / 'missing.json')
+    assert not validate_json_stream(str(tmp_path / 'missing.json'))
+
+
+def test_streamed_model_is_registered(classifier, tmp_path, intents):
+    # Statistics of a previous incremental training
+    IncrementalTrainer(classifier.incremental_state_path).fit(intents).save()
+    file_path = str(tmp_path / 'train.jsonl')
+    write_jsonl(intents, file_path)
+    classifier.train_from_file(file_path, chunk_size=4)
+    registry = ModelRegistry(classifier.models_path)
+    entry = registry.find(registry.load(), registry.load()['active'])
+    assert entry['data_hash'] == file_hash(file_path)
+    assert registry.active_model_path() == classifier.model_filename
+    assert not os.path.exists(classifier.incremental_state_path)
+    messages = ['hola amigo', 'muchas gracias', 'hasta luego']
+    expected = IncrementalTrainer(str(tmp_path / 'state.npz')).fit(intents).to_pipeline()
+    np.testing.assert_allclose(classifier.model.predict_proba(messages),
+                                expected.predict_proba(messages), rtol=1e-9)
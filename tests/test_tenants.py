@@ -0,0 +1,154 @@
+'''
+Tenants: every tenant is served by its own classifier, the least recently used ones are evicted
+beyond the memory budget, and a failed load wakes up the requests that wait for it with its error
+and is forgotten so the next request tries again.
+'''
+
+import os
+import threading
+
+import pytest
+
+from src.tenants import TenantManager, TenantNotFoundError
+from conftest import write_json
+
+
+# Creates the data directory of a tenant with the given intents
+def create_tenant(tenants_path, tenant, intents):
+    data_path = os.path.join(tenants_path, tenant, 'data')
+    os.makedirs(data_path)
+    write_json(intents, os.path.join(data_path, 'intents.json'))
+
+
+def test_every_tenant_has_its_own_bot(tmp_path, intents):
+    create_tenant(str(tmp_path), 'acme', intents)
+    create_tenant(str(tmp_path), 'globex', {'intents': [
+        {'intent': 'Horario', 'examples': ['¿A qué hora abren?', 'Horario de atención', 'Cuándo abren'],
+            'response': 'Abrimos de 9 a 18.'},
+        {'intent': 'Precio', 'examples': ['¿Cuánto cuesta?', 'Precio del producto', 'Qué vale'],
+            'response': 'Depende del producto.'},
+    ]})
+    os.makedirs(tmp_path / 'sin_datos')
+    manager = TenantManager(str(tmp_path), memory_budget=None)
+    assert manager.list_tenants() == ['acme', 'globex']
+    assert manager.get('acme').classify('muchas gracias')['response'] == '¡De nada!'
+    assert manager.get('globex').classify('¿a qué hora abren?')['response'] == 'Abrimos de 9 a 18.'
+    assert os.path.isdir(tmp_path / 'globex' / 'models')
+    assert manager.stats()['loads'] == 2
+
+
+# Classifier of a given size
+class SizedClassifier:
+
+    def __init__(self, size):
+        self.size = size
+
+    def memory_usage(self):
+        return self.size
+
+
+def test_least_recently_used_tenants_are_evicted(tmp_path, monkeypatch):
+    manager = TenantManager(str(tmp_path), memory_budget=100)
+    monkeypatch.setattr(manager, '_load', lambda tenant: SizedClassifier(40))
+    for tenant in ['a', 'b', 'a', 'c']:
+        manager.get(tenant)
+    assert manager.stats()['tenants'] == ['a', 'c']
+    assert manager.evictions == 1 and manager.stats()['memory_bytes'] == 80
+    # A tenant larger than the budget is still served
+    monkeypatch.setattr(manager, '_load', lambda tenant: SizedClassifier(500))
+    manager.get('d')
+    assert manager.stats()['tenants'] == ['d']
+
+
+def test_missing_tenant_fails_and_is_forgotten(tmp_path):
+    manager = TenantManager(str(tmp_path), memory_budget=None)
+    for _ in range(2):
+        with pytest.raises(TenantNotFoundError):
+            manager.get('acme')
+    assert manager.failed_loads == 2
+    assert manager._loading == {}
+    assert manager.stats()['tenants'] == []
+
+
+def test_invalid_tenant_id(tmp_path):
+    manager = TenantManager(str(tmp_path), memory_budget=None)
+    with pytest.raises(TenantNotFoundError):
+        manager.get('../data')
+    assert manager._loading == {}
+
+
+# Classifier whose size cannot be measured, so publishing it fails after the load succeeded
+class BrokenClassifier:
+
+    def memory_usage(self):
+        raise RuntimeError("sin tamaño")
+
+
+def test_publish_failure_resolves_the_load(tmp_path, monkeypatch):
+    manager = TenantManager(str(tmp_path), memory_budget=None)
+    monkeypatch.setattr(manager, '_load', lambda tenant: BrokenClassifier())
+    with pytest.raises(RuntimeError):
+        manager.get('acme')
+    assert manager.failed_loads == 1
+    assert manager._loading == {}
+    assert manager.stats()['tenants'] == []
+
+
+def test_waiting_requests_get_the_error(tmp_path, monkeypatch):
+    manager = TenantManager(str(tmp_path), memory_budget=None)
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_failing_load(tenant):
+        started.set()
+        release.wait(5)
+        raise TenantNotFoundError(f"El cliente '{tenant}' no existe.")
+
+    monkeypatch.setattr(manager, '_load', slow_failing_load)
+    errors = []
+
+    def request():
+        try:
+            manager.get('acme')
+        except TenantNotFoundError as e:
+            errors.append(e)
+
+    loader = threading.Thread(target=request)
+    loader.start()
+    assert started.wait(5)
+    waiters = [threading.Thread(target=request) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    # The waiters join the load in progress instead of starting their own
+    while manager.shared_loads < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in [loader] + waiters:
+        thread.join(5)
+        assert not thread.is_alive()
+    assert len(errors) == 4
+    assert manager.failed_loads == 1
+    assert manager._loading == {}
+
+
+def test_load_after_failure_succeeds(tmp_path, monkeypatch):
+    manager = TenantManager(str(tmp_path), memory_budget=None)
+    attempts = []
+
+    class Classifier:
+        def memory_usage(self):
+            return 1
+
+    def flaky_load(tenant):
+        attempts.append(tenant)
+        if len(attempts) == 1:
+            raise OSError("disco no disponible")
+        return Classifier()
+
+    monkeypatch.setattr(manager, '_load', flaky_load)
+    with pytest.raises(OSError):
+        manager.get('acme')
+    classifier = manager.get('acme')
+    assert manager.get('acme') is classifier
+    assert len(attempts) == 2
+    assert manager.stats()['hits'] == 1
@@ -0,0 +1,59 @@
+'''
+Text normalization: spellings that only differ in case, accents or punctuation are the same text
+for the model, the ñ is kept, and the cache keys follow the normalization of the loaded model.
+'''
+
+import pickle
+import unicodedata
+
+import pytest
+
+from src.prediction_cache import model_preprocessor, normalize_message
+from src.text_normalization import TextNormalizer, normalize_text, normalizer_from_name, stem_token
+from src.utils import get_training_examples
+
+
+def test_spellings_of_the_same_text():
+    assert normalize_text('¿Cómo estás?') == normalize_text('como estas') == \
+        normalize_text('COMO  ESTÁS') == 'como estas'
+    assert normalize_text('¡Pingüino, «ñandú»!') == 'pinguino ñandu'
+
+
+def test_the_enie_is_kept():
+    assert normalize_text('Año') == 'año' != normalize_text('ano')
+    # A ñ that arrives decomposed (n + combining tilde) is not folded to n
+    assert normalize_text(unicodedata.normalize('NFD', 'año')) == 'año'
+
+
+@pytest.mark.parametrize('token, stem', [('amigos', 'amig'), ('amiga', 'amig'), ('veces', 'vez'), ('lapices', 'lapiz'),
+                                            ('los', 'los'), ('mes', 'mes'), ('tu', 'tu')])
+def test_light_stemming(token, stem):
+    assert stem_token(token) == stem
+
+
+def test_normalizer_round_trips():
+    normalizer = TextNormalizer(stem=True)
+    assert pickle.loads(pickle.dumps(normalizer))('Mis AMIGAS') == 'mis amig'
+    assert normalizer_from_name(normalizer.name).stem
+    assert normalizer_from_name('none') is None
+    with pytest.raises(ValueError):
+        normalizer_from_name('otra')
+
+
+def test_cache_keys_follow_the_model_preprocessing(intents):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import make_pipeline
+    X, y = get_training_examples(intents)
+    plain = make_pipeline(TfidfVectorizer(), MultinomialNB()).fit(X, y)
+    folding = make_pipeline(TfidfVectorizer(preprocessor=TextNormalizer()), MultinomialNB()).fit(X, y)
+    # A model that keeps the accents tells both messages apart, so they get different keys
+    preprocessor = model_preprocessor(plain)
+    assert normalize_message('Cómo estás', preprocessor) != normalize_message('como estas', preprocessor)
+    preprocessor = model_preprocessor(folding)
+    assert normalize_message('¿Cómo estás?', preprocessor) == normalize_message('como estas', preprocessor)
+
+
+def test_classifier_ignores_accents_and_case(classifier):
+    assert classifier.predict('MUCHAS GRÁCIAS!!') == classifier.predict('muchas gracias')
+    assert classifier.model[0].preprocessor.name == 'fold'
@@ -0,0 +1,96 @@
+'''
+Hyperparameter search: the cross-validation of the cached folds scores a candidate like fitting its
+pipeline on every fold, the worst candidates stop early, and retraining with the chosen parameters
+builds a new classifier without touching the one being served.
+'''
+
+import os
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from src import chatbot, intent_classifier_model
+from src.evaluation import stratified_folds
+from src.model_registry import ModelRegistry
+from src.tuning import build_steps, load_tuned_params, save_tuned_params, search, main
+from src.utils import get_training_examples
+
+
+VECTORIZER_GRID = {'ngram_range': [(1, 1), (1, 2)], 'sublinear_tf': [False, True]}
+CLASSIFIER_GRID = {'alpha': [0.1, 1.0]}
+
+
+# Every model trained from now on gets a later timestamp, so two models never share a file
+@pytest.fixture
+def later(monkeypatch):
+    class LaterDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2100, 1, 1)
+    monkeypatch.setattr(intent_classifier_model, 'datetime', LaterDatetime)
+
+
+def test_search_scores_like_fitting_every_fold(intents):
+    results = search(intents, n_folds=3, workers=1, vectorizer_grid=VECTORIZER_GRID,
+                        classifier_grid=CLASSIFIER_GRID, elimination_rate=None)
+    assert len(results) == 8 and all(result['folds'] == 3 for result in results)
+    assert [result['accuracy'] for result in results] == \
+        sorted((result['accuracy'] for result in results), reverse=True)
+    from sklearn.pipeline import make_pipeline
+    X, y = get_training_examples(intents)
+    for result in results:
+        hits = 0
+        for train, test in stratified_folds(y, 3, 0):
+            pipeline = make_pipeline(*build_steps(result['params']))
+            pipeline.fit([X[i] for i in train], [y[i] for i in train])
+            hits += int(np.sum(pipeline.predict([X[i] for i in test]) == np.array(y)[test]))
+        assert result['accuracy'] == round(hits / len(y), 4)
+
+
+def test_worst_candidates_stop_early(intents):
+    results = search(intents, n_folds=3, workers=1, vectorizer_grid=VECTORIZER_GRID,
+                        classifier_grid=CLASSIFIER_GRID, elimination_rate=2)
+    # 8 candidates on the first fold, 4 on the second and 2 on the last one
+    assert [result['folds'] for result in results] == [3, 3, 2, 2, 1, 1, 1, 1]
+
+
+def test_tuned_params_are_used_by_new_models(classifier):
+    result = {'params': {'vectorizer': {'ngram_range': (1, 2), 'min_df': 1},
+                            'classifier': {'alpha': 0.3}}, 'accuracy': 1.0}
+    save_tuned_params(result, 3, classifier.models_path)
+    assert load_tuned_params(classifier.models_path) == result['params']
+    model = classifier.create_new_model()
+    assert model[0].ngram_range == (1, 2) and model[-1].alpha == 0.3
+
+
+def test_retrain_builds_a_new_classifier(classifier, monkeypatch, later):
+    model, model_filename = classifier.model, classifier.model_filename
+    classifier.classify('Hola')
+    monkeypatch.setattr(chatbot, 'classifier', classifier)
+    new_classifier = classifier.retrain()
+    # The classifier being served is not modified, the new one replaces it
+    assert (classifier.model, classifier.model_filename) == (model, model_filename)
+    assert chatbot.classifier is new_classifier
+    assert new_classifier.model_filename != model_filename
+    assert ModelRegistry(classifier.models_path).active_model_path() == \
+        os.path.abspath(new_classifier.model_filename)
+    assert new_classifier.prediction_cache is not classifier.prediction_cache
+    assert new_classifier.predict('Muchas gracias') == 'Agradecimiento'
+
+
+def test_retrain_does_not_publish_another_classifier(classifier, monkeypatch, later):
+    published = object()
+    monkeypatch.setattr(chatbot, 'classifier', published)
+    classifier.retrain()
+    assert chatbot.classifier is published
+
+
+def test_command_line(classifier, capsys, later):
+    main(['--data', classifier.intents_path, '--models', classifier.models_path, '--folds', '2',
+            '--workers', '1'])
+    output = capsys.readouterr().out
+    assert 'Parámetros guardados' in output
+    assert load_tuned_params(classifier.models_path) is not None
+    active = ModelRegistry(classifier.models_path).active_model_path()
+    assert 'trained_model_2100-01-01' in active and active != os.path.abspath(classifier.model_filename)